@@ -1,22 +1,39 @@
 import openai
 import base64
+import io
+import json
 import os
-from config import OPENAI_API_KEY, COMPLETION_MODEL
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from config import (OPENAI_API_KEY, COMPLETION_MODEL, OCR_MAX_SIDE, OCR_JPEG_QUALITY, OCR_PAGES_PER_CHUNK,
+                    OCR_CONCURRENCY, OCR_MAX_ATTEMPTS)
 
-def encode_image(image_path):
-    """Encodes an image to base64 for API submission."""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+def encode_image(image_path, max_side=OCR_MAX_SIDE, quality=OCR_JPEG_QUALITY):
+    """Downsizes an image to max_side pixels and encodes it as base64 jpeg for API submission."""
+    with Image.open(image_path) as img:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=quality, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+def page_number(image_path):
+    """Page number of a page_<n> image, so that page_10 sorts after page_9."""
+    match = re.search(r"(\d+)", os.path.splitext(os.path.basename(image_path))[0])
+    return int(match.group(1)) if match else 0
+
+def send_images_to_gpt(image_paths, prompt, client=None):
 
-def send_images_to_gpt(image_paths, prompt):
-    
     # Initialize OpenAI client
-    client = openai.OpenAI(api_key=OPENAI_API_KEY)
+    client = client or openai.OpenAI(api_key=OPENAI_API_KEY)
 
     images_content = [
         {
             "type": "image_url",
-            "image_url": {"url": f"data:image/png;base64,{encode_image(img_path)}"},
+            "image_url": {"url": f"data:image/jpeg;base64,{encode_image(img_path)}"},
         }
         for img_path in image_paths
     ]
@@ -36,10 +53,66 @@ def send_images_to_gpt(image_paths, prompt):
 
     return response.choices[0].message.content
 
-def images_to_text(image_folder, output_file, prompt):
+def _transcribe_chunk(client, chunk, first_page, page_total, prompt, attempts):
+    """Transcribes one chunk of pages, retrying it with backoff."""
+    if page_total > len(chunk):
+        prompt += (f"\nThese are pages {first_page}-{first_page + len(chunk) - 1} of {page_total}; "
+                   "continue the document without repeating a title or an introduction.")
+    for attempt in range(attempts):
+        try:
+            return send_images_to_gpt(chunk, prompt, client)
+        except Exception as e:
+            if attempt == attempts - 1:
+                raise
+            print(f"Retrying pages {first_page}-{first_page + len(chunk) - 1} after error: {e}")
+            time.sleep(2 ** attempt)
+
+def images_to_text(image_folder, output_file, prompt, pages_per_chunk=OCR_PAGES_PER_CHUNK,
+                   concurrency=OCR_CONCURRENCY, attempts=OCR_MAX_ATTEMPTS):
+    """
+    Transcribes the page images of a folder to one markdown file.
+
+    Pages are sent in chunks of pages_per_chunk, concurrently, and the
+    transcriptions joined in page order. Chunks already transcribed are kept
+    in <output_file>.chunks.json until the whole document is done, so a
+    rerun after a failure only sends the chunks that failed.
+    """
+    image_paths = sorted((os.path.join(image_folder, img_file) for img_file in os.listdir(image_folder)),
+                         key=lambda path: (page_number(path), path))
+    chunks = [image_paths[i:i + pages_per_chunk] for i in range(0, len(image_paths), pages_per_chunk)]
+
+    progress_file = output_file + ".chunks.json"
+    done = {}
+    if os.path.exists(progress_file):
+        with open(progress_file, "r", encoding="utf-8") as f:
+            done = json.load(f)
+
+    client = openai.OpenAI(api_key=OPENAI_API_KEY)
+    keys = [",".join(os.path.basename(path) for path in chunk) for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            key: executor.submit(_transcribe_chunk, client, chunk, i * pages_per_chunk + 1, len(image_paths),
+                                 prompt, attempts)
+            for i, (key, chunk) in enumerate(zip(keys, chunks)) if key not in done
+        }
+        failed = []
+        for key, future in futures.items():
+            try:
+                done[key] = future.result()
+            except Exception as e:
+                failed.append(key)
+                print(f"Failed to transcribe {key}: {e}")
+                continue
+            with open(progress_file, "w", encoding="utf-8") as f:
+                json.dump(done, f, ensure_ascii=False)
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(chunks)} chunks of {image_folder} failed; "
+                           "rerun to retry them")
 
     with open(output_file, "w", encoding="utf-8") as f:
-        image_paths = [os.path.join(image_folder, img_file) for img_file in sorted(os.listdir(image_folder))]
-        f.write(send_images_to_gpt(image_paths, prompt))
+        f.write("\n\n".join(done[key] for key in keys))
+    if os.path.exists(progress_file):
+        os.remove(progress_file)
 
     print(f"All translations saved to {output_file}")
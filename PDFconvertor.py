@@ -1,25 +1,121 @@
 import os
-from PdfToImage import pdf_to_images
+import json
+import hashlib
+import argparse
+from PdfToImage import convert_pdfs
 from ImageToText import images_to_text
+from src.indexer.build_index import build_index
 
-def PDFconvertor(folder):
+MANIFEST_FILE = "ingest_manifest.json"
+
+# Stages a task goes through, in order
+RENDERED = "rendered"
+TRANSCRIBED = "transcribed"
+
+PROMPT = "Extract the equations and text from this solution to the markdown format, and add '$' on both sides of math terms. Ignore the comments and other unrelated UI, focusing on the solution. Your response could only contain the translation of the solution."
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(folder):
+    """Per task: the hash of its PDF and the last stage it completed."""
+    path = os.path.join(folder, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(folder, manifest):
+    # Replaced atomically, so an interrupted run never leaves it half written
+    path = os.path.join(folder, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+def PDFconvertor(folder, index=True):
+    """
+    Renders and transcribes the solution PDFs of folder that are new or changed.
+
+    Each task records the hash of its PDF and its completed stage in
+    ingest_manifest.json: unchanged PDFs are skipped, and a task interrupted
+    after rendering resumes at transcription. The newly transcribed
+    solutions are then added to the vector store with an incremental build.
+
+    Returns:
+        List[str]: Tasks transcribed by this run
+    """
     pdf_path = os.path.join(folder, "solution-pdf")
     img_path = os.path.join(folder, "solution-img")
     md_path = os.path.join(folder, "solution")
-    
+
     if(not os.path.exists(img_path)):
         os.makedirs(img_path)
     if(not os.path.exists(md_path)):
         os.makedirs(md_path)
 
-    for pdf in os.listdir(pdf_path):
-        task_name = os.path.splitext(pdf)[0]
+    manifest = load_manifest(folder)
+    pdfs = {os.path.splitext(pdf)[0]: os.path.join(pdf_path, pdf) for pdf in os.listdir(pdf_path)}
+    for task_name in set(manifest) - set(pdfs):
+        del manifest[task_name]
+
+    to_render, to_transcribe = {}, []
+    for task_name, path in sorted(pdfs.items()):
+        pdf_hash = file_hash(path)
+        entry = manifest.get(task_name)
+        output_file = os.path.join(md_path, task_name + ".md")
         img_folder = os.path.join(img_path, task_name)
-        path = os.path.join(pdf_path, pdf)
-        pdf_to_images(path, img_folder)
+        if entry is None and os.path.exists(output_file) and os.path.getmtime(output_file) >= os.path.getmtime(path):
+            # Transcribed before the manifest existed
+            manifest[task_name] = {"pdf_hash": pdf_hash, "stage": TRANSCRIBED}
+        elif entry is None or entry["pdf_hash"] != pdf_hash or entry["stage"] is None:
+            manifest[task_name] = {"pdf_hash": pdf_hash, "stage": None}
+            to_render[task_name] = path
+        elif entry["stage"] == RENDERED or not os.path.exists(output_file):
+            if os.path.isdir(img_folder) and os.listdir(img_folder):
+                to_transcribe.append(task_name)
+            else:
+                entry["stage"] = None
+                to_render[task_name] = path
+    for task_name in to_render:
+        # Chunks transcribed from the previous rendering no longer apply
+        progress_file = os.path.join(md_path, task_name + ".md.chunks.json")
+        if os.path.exists(progress_file):
+            os.remove(progress_file)
+    print(f"{len(to_render)} PDFs to render, {len(to_transcribe)} to transcribe, "
+          f"{len(pdfs) - len(to_render) - len(to_transcribe)} unchanged")
+
+    # Render every PDF first, in parallel processes
+    for task_name in convert_pdfs(to_render, img_path):
+        manifest[task_name]["stage"] = RENDERED
+        to_transcribe.append(task_name)
+    save_manifest(folder, manifest)
 
+    transcribed = []
+    for task_name in sorted(to_transcribe):
+        img_folder = os.path.join(img_path, task_name)
         output_file = os.path.join(md_path, task_name + ".md")
-        images_to_text(img_folder, output_file, prompt="Extract the equations and text from this solution to the markdown format, and add '$' on both sides of math terms. Ignore the comments and other unrelated UI, focusing on the solution. Your response could only contain the translation of the solution.")
+        try:
+            images_to_text(img_folder, output_file, prompt=PROMPT)
+        except Exception as e:
+            print(f"Error transcribing {task_name}: {e}")
+            continue
+        manifest[task_name]["stage"] = TRANSCRIBED
+        save_manifest(folder, manifest)
+        transcribed.append(task_name)
+
+    if index and transcribed:
+        build_index(incremental=True, names=[task_name + ".md" for task_name in transcribed])
+
+    return transcribed
 
 if __name__ == "__main__":
-    PDFconvertor("data/questions/Luogu")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Render and transcribe new or changed solution PDFs")
+    parser.add_argument("--folder", default="data/questions/Luogu")
+    parser.add_argument("--no-index", action="store_true", help="do not update the vector store afterwards")
+    args = parser.parse_args()
+
+    PDFconvertor(args.folder, index=not args.no_index)
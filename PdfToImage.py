@@ -1,19 +1,77 @@
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
 from pdf2image import convert_from_path
+from config import PDF_IMAGE_DPI, PDF_IMAGE_FORMAT, PDF_JPEG_QUALITY, PDF_GRAYSCALE, PDF_WORKERS
 
-def pdf_to_images(pdf_path, output_folder, dpi=300):
+IMAGE_FORMATS = ("png", "jpeg")
+
+def pdf_to_images(pdf_path, output_folder, dpi=PDF_IMAGE_DPI, fmt=PDF_IMAGE_FORMAT,
+                  quality=PDF_JPEG_QUALITY, grayscale=PDF_GRAYSCALE) -> List[str]:
     """
     Converts a PDF to images and ensures the output folder exists.
+
+    One poppler process renders every page straight to disk, so no page is
+    held in memory; the pages are then named output_folder/page_<n>.<ext>.
+
+    Args:
+        pdf_path (str): PDF to convert
+        output_folder (str): Folder the page images are written to
+        dpi (int): Rendering resolution
+        fmt (str): "png" or "jpeg"
+        quality (int): Jpeg quality, 1-95; ignored for png
+        grayscale (bool): Render without colour
+
+    Returns:
+        List[str]: Paths of the page images, in page order
     """
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format: {fmt}")
     if not os.path.exists(output_folder):  # Create folder if missing
         os.makedirs(output_folder)
+    for name in os.listdir(output_folder):  # Pages of an earlier conversion, maybe in another format or unrenamed
+        if name.startswith("page"):
+            os.remove(os.path.join(output_folder, name))
 
-    images = convert_from_path(pdf_path, dpi=dpi)
+    jpegopt = {"quality": quality, "optimize": True, "progressive": False} if fmt == "jpeg" else None
+    rendered = convert_from_path(
+        pdf_path, dpi=dpi, fmt=fmt, jpegopt=jpegopt, grayscale=grayscale,
+        output_folder=output_folder, output_file="page", paths_only=True
+    )
+
+    # pdftoppm suffixes the zero-padded page number, as in page0001-01.png
     image_paths = []
+    for path in rendered:
+        stem, ext = os.path.splitext(path)
+        image_paths.append(os.path.join(output_folder, f"page_{int(stem.rsplit('-', 1)[1])}{ext}"))
+        os.replace(path, image_paths[-1])
+    return image_paths
+
+def convert_pdfs(pdf_paths: Dict[str, str], output_root, workers=PDF_WORKERS, **options) -> Dict[str, List[str]]:
+    """
+    Converts many PDFs in parallel processes.
 
-    for i, img in enumerate(images):
-        img_path = os.path.join(output_folder, f"page_{i+1}.png")
-        img.save(img_path, "PNG")
-        image_paths.append(img_path)
+    Args:
+        pdf_paths (Dict[str, str]): PDF path of each task name
+        output_root (str): Each task's pages go to output_root/<task name>
+        workers (int): Number of processes
+        **options: Passed on to pdf_to_images
 
-    return image_paths
\ No newline at end of file
+    Returns:
+        Dict[str, List[str]]: Page image paths of each converted task; tasks
+            that failed are reported and left out
+    """
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(pdf_to_images, path, os.path.join(output_root, task_name), **options): task_name
+            for task_name, path in pdf_paths.items()
+        }
+        for future in as_completed(futures):
+            task_name = futures[future]
+            try:
+                results[task_name] = future.result()
+                print(f"Converted {task_name} ({len(results[task_name])} pages)")
+            except Exception as e:
+                print(f"Error converting {task_name}: {e}")
+    return results
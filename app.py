@@ -3,8 +3,9 @@ import openai
 from openai import OpenAI
 import os
 from pathlib import Path
-from src.retriever.similarity_search import SimilaritySearcher
+from src.retriever.shared_searcher import SharedSearcher
 from src.generator.solution_generator import SolutionGenerator
+from src.common.tracing import get_tracer
 from config import *
 
 # Page config
@@ -17,6 +18,10 @@ st.set_page_config(
 def render_sidebar():
     """Render the sidebar with filtering options"""
     st.sidebar.header("Settings")
+
+    # Lexical search needs no API call, hybrid adds it to the vector search
+    modes = ["hybrid", "vector", "lexical"]
+    mode = st.sidebar.selectbox("Search Mode", options=modes, index=modes.index(SEARCH_MODE))
     
     # Filter by concepts
     if st.sidebar.checkbox("Filter by Concepts"):
@@ -24,43 +29,84 @@ def render_sidebar():
             "Select Concepts",
             options=LEETCODE_CONCEPTS
         )
-        return {"concepts": selected_concepts}
-    return {"concepts": []}
+        return {"concepts": selected_concepts, "mode": mode}
+    return {"concepts": [], "mode": mode}
 
+@st.cache_resource
 def initialize_components():
-    """Initialize necessary components"""
-    if "searcher" not in st.session_state:
-        st.session_state.searcher = SimilaritySearcher(OPENAI_API_KEY)
-    if "solution_generator" not in st.session_state:
-        st.session_state.solution_generator = SolutionGenerator(OPENAI_API_KEY)
-    
-    return st.session_state.searcher, st.session_state.solution_generator
+    """Initialize the components shared by every session of the process
 
-def display_solution(solution: str, similar_questions: list):
-    """Display the solution and similar questions in columns"""
-    col1, col2 = st.columns([2, 1])
-    
-    with col1:
-        st.subheader("Generated Solution")
+    The searcher reloads itself when a new vector store build is published.
+    """
+    searcher = SharedSearcher(OPENAI_API_KEY)
+    return searcher, SolutionGenerator(OPENAI_API_KEY, embed=searcher.embed_question)
+
+def render_cache_stats(searcher, solution_generator):
+    """Show the hit rates of the result caches in the sidebar"""
+    for name, cache in (("Search", searcher.result_cache), ("Solution", solution_generator.result_cache)):
+        if cache is not None:
+            stats = cache.stats()
+            st.sidebar.caption(f"{name} cache: {stats['hit_rate']:.0%} hit rate "
+                               f"({stats['exact_hits']} exact, {stats['semantic_hits']} similar, "
+                               f"{stats['misses']} misses)")
+
+def render_debug_panel():
+    """Show per-stage latency percentiles and cost, and the spans of the last request"""
+    tracer = get_tracer()
+    with st.expander("Debug: stage timings", expanded=True):
+        summary = tracer.summary()
+        if not summary:
+            st.caption("No spans recorded yet")
+            return
+        st.dataframe([{'stage': name, **row} for name, row in summary.items()])
+        for trace_name in ("search", "generate"):
+            spans = tracer.last_trace(trace_name)
+            if spans:
+                st.markdown(f"**Last {trace_name}**")
+                st.dataframe([{
+                    'stage': span['name'],
+                    'ms': round(span['duration_ms'], 1),
+                    'tokens': span.get('input_tokens', 0) + span.get('output_tokens', 0),
+                    'cost_usd': span.get('cost_usd', 0.0),
+                    'cached': span.get('cached', False)
+                } for span in spans])
+
+def display_solution(solution_stream) -> str:
+    """Render the generated solution as its pieces arrive
 
-        st.markdown(solution)
+    Args:
+        solution_stream (Iterator[str]): Pieces of the solution, as yielded
+            by SolutionGenerator.generate_stream
+
+    Returns:
+        str: The complete solution
+    """
+    st.subheader("Generated Solution")
+    placeholder = st.empty()
+    solution = ""
+    for piece in solution_stream:
+        solution += piece
+        placeholder.markdown(solution + "▌")
+    placeholder.markdown(solution)
+    return solution
+
+def display_similar_questions(similar_questions: list):
+    """Display the similar questions and the concepts they use"""
+    st.subheader("Similar Questions")
+    for idx, question in enumerate(similar_questions):
+        with st.expander(f"Question {question['id']}"):
+            st.markdown(question['question'])
+            st.markdown("**Concepts:**")
+            st.markdown(", ".join(question['concepts']))
+            
+            if st.button(f"Show Solution {idx}", key=f"sol_{idx}"):
+                st.code(question['solution'], language="python")
     
-    with col2:
-        st.subheader("Similar Questions")
-        for idx, question in enumerate(similar_questions):
-            with st.expander(f"Question {question['id']}"):
-                st.markdown(question['question'])
-                st.markdown("**Concepts:**")
-                st.markdown(", ".join(question['concepts']))
-                
-                if st.button(f"Show Solution {idx}", key=f"sol_{idx}"):
-                    st.code(question['solution'], language="python")
-        
-        st.subheader("Concepts Used")
-        all_concepts = set()
-        for q in similar_questions:
-            all_concepts.update(q['concepts'])
-        st.markdown(", ".join(sorted(all_concepts)))
+    st.subheader("Concepts Used")
+    all_concepts = set()
+    for q in similar_questions:
+        all_concepts.update(q['concepts'])
+    st.markdown(", ".join(sorted(all_concepts)))
 
 def main():
     st.title("OI Search Engine 🧮")
@@ -73,6 +119,7 @@ def main():
     
     # Sidebar filters
     filters = render_sidebar()
+    debug = st.sidebar.checkbox("Debug")
     
     # Main input area
     question = st.text_area(
@@ -86,23 +133,28 @@ def main():
         search_button = st.button("Generate Solution")
     with col2:
         if search_button:
-            with st.spinner('🔍 Searching similar questions and generating solution...'):
-                try:
-                    # Search similar questions
-                    similar_questions = searcher.search(question, concepts=filters["concepts"])
-                    
-                    # Generate solution
-                    solution = solution_generator.generate(
+            try:
+                # Search similar questions
+                with st.spinner('🔍 Searching similar questions...'):
+                    similar_questions = searcher.search(question, concepts=filters["concepts"], mode=filters["mode"])
+                
+                # Show the references right away, then stream the solution next to them
+                solution_col, questions_col = st.columns([2, 1])
+                with questions_col:
+                    display_similar_questions(similar_questions)
+                with solution_col:
+                    display_solution(solution_generator.generate_stream(
                         question=question,
                         similar_questions=similar_questions
-                    )
-                    
-                    # Display results
-                    display_solution(solution, similar_questions)
-                    
-                except Exception as e:
-                    st.error(f"An error occurred: {str(e)}")
-                    st.error("Please try again or contact support if the problem persists.")
+                    ))
+                
+            except Exception as e:
+                st.error(f"An error occurred: {str(e)}")
+                st.error("Please try again or contact support if the problem persists.")
+
+    render_cache_stats(searcher, solution_generator)
+    if debug:
+        render_debug_panel()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
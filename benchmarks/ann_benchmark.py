@@ -0,0 +1,87 @@
+import argparse
+import time
+import faiss
+import numpy as np
+from src.indexer.index_factory import (INDEX_TYPES, STORAGE_CODES, index_description, create_index,
+                                       search_parameters, reconstruct_vectors, stored_ids)
+from src.indexer.vector_store import current_build
+from config import VECTOR_STORE_PATH
+
+def load_store_vectors(index_name: str = "questions") -> np.ndarray:
+    """Read the vectors back out of a built index of the vector store"""
+    index = faiss.read_index(str(current_build(VECTOR_STORE_PATH) / f"{index_name}.index"))
+    return reconstruct_vectors(index, np.sort(stored_ids(index)))
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random topic centres, like text embeddings"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(n // 100, 1), dim)).astype(np.float32)
+    vectors = centres[rng.integers(len(centres), size=n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def make_queries(vectors: np.ndarray, n_queries: int, seed: int = 1) -> np.ndarray:
+    """Perturbed copies of stored vectors, standing in for near-duplicate queries"""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(len(vectors), size=n_queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+def benchmark(vectors: np.ndarray, queries: np.ndarray, k: int, index_types=INDEX_TYPES,
+              storage: str = "float32"):
+    """Measure every index type against exact search
+
+    Returns:
+        List[Dict]: One row per index type with recall@k, build time, query
+            latency percentiles and serialized size
+    """
+    ids = np.arange(len(vectors), dtype=np.int64)
+    exact = create_index(vectors, ids, "Flat")
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for index_type in index_types:
+        description = index_description(index_type, vectors.shape[1], len(vectors), storage=storage)
+        start = time.perf_counter()
+        index = create_index(vectors, ids, description)
+        build_seconds = time.perf_counter() - start
+
+        # One query at a time, as SimilaritySearcher issues them
+        params = search_parameters(index)
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            _, found = index.search(query.reshape(1, -1), k, params=params)
+            latencies.append(time.perf_counter() - start)
+            hits += len(np.intersect1d(found[0], expected))
+
+        latencies_ms = np.array(latencies) * 1000
+        rows.append({
+            'index_type': index_type,
+            'description': description,
+            'recall': hits / (len(queries) * k),
+            'build_s': build_seconds,
+            'p50_ms': float(np.percentile(latencies_ms, 50)),
+            'p95_ms': float(np.percentile(latencies_ms, 95)),
+            'size_mb': faiss.serialize_index(index).size / 1024 ** 2
+        })
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare FAISS index types on recall, latency and size")
+    parser.add_argument("--synthetic", type=int, metavar="N",
+                        help="benchmark N synthetic vectors instead of the built vector store")
+    parser.add_argument("--dim", type=int, default=3072, help="dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--storage", choices=STORAGE_CODES, default="float32", help="vector encoding")
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.synthetic, args.dim) if args.synthetic else load_store_vectors()
+    queries = make_queries(vectors, args.queries)
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+
+    print(f"{'index':<10}{'factory':<16}{'recall@k':>10}{'build s':>10}{'p50 ms':>10}{'p95 ms':>10}{'size MB':>10}")
+    for row in benchmark(vectors, queries, args.k, args.index_types, args.storage):
+        print(f"{row['index_type']:<10}{row['description']:<16}{row['recall']:>10.3f}{row['build_s']:>10.2f}"
+              f"{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}{row['size_mb']:>10.1f}")
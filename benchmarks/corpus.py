@@ -0,0 +1,138 @@
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import List
+
+# Topics of the synthetic problems, with words their statements and
+# solutions use and a line of code standing for their technique
+TOPICS = {
+    "动态规划": (["状态", "转移", "最优子结构"], "dp[i][j] = max(dp[i - 1][j], dp[i - 1][j - w[i]] + v[i]);"),
+    "贪心": (["排序", "每次选择", "局部最优"], "sort(a + 1, a + n + 1, cmp);"),
+    "二分答案": (["单调性", "最小的最大值", "判定"], "while (l < r) { int mid = (l + r) / 2; if (check(mid)) r = mid; else l = mid + 1; }"),
+    "最短路": (["边权", "起点", "单源"], "dist[v] = min(dist[v], dist[u] + w);"),
+    "线段树": (["区间修改", "区间查询", "懒标记"], "void pushdown(int p) { add[p * 2] += add[p]; add[p * 2 + 1] += add[p]; add[p] = 0; }"),
+    "并查集": (["连通", "合并", "集合"], "int find(int x) { return fa[x] == x ? x : fa[x] = find(fa[x]); }"),
+    "深度优先搜索": (["回溯", "枚举所有方案", "剪枝"], "void dfs(int u) { vis[u] = true; for (int v : g[u]) if (!vis[v]) dfs(v); }"),
+    "广度优先搜索": (["最少步数", "网格", "队列"], "while (!q.empty()) { auto [x, y] = q.front(); q.pop(); }"),
+    "字符串哈希": (["子串", "匹配", "模数"], "h[i] = h[i - 1] * base + s[i];"),
+    "数论": (["质数", "最大公约数", "取模"], "long long gcd(long long a, long long b) { return b ? gcd(b, a % b) : a; }"),
+    "拓扑排序": (["有向无环图", "依赖关系", "入度"], "if (--indeg[v] == 0) q.push(v);"),
+    "最小生成树": (["无向图", "连接所有点", "总代价最小"], "if (find(e.u) != find(e.v)) { ans += e.w; unite(e.u, e.v); }"),
+    "树状数组": (["单点修改", "前缀和", "逆序对"], "for (; x <= n; x += x & -x) c[x] += v;"),
+    "单调栈": (["左边第一个更大", "柱状图", "栈"], "while (top && a[st[top]] < a[i]) top--;"),
+    "双指针": (["连续子段", "滑动窗口", "左右端点"], "while (r < n && sum + a[r] <= k) sum += a[r++];"),
+    "前缀和": (["区间和", "多次询问", "差分"], "s[i] = s[i - 1] + a[i];"),
+    "网络流": (["最大流", "容量", "增广路"], "flow += dfs(s, INF);"),
+    "KMP": (["模式串", "失配", "border"], "while (j && p[i] != p[j + 1]) j = nxt[j];"),
+    "状态压缩": (["子集", "二进制", "集合枚举"], "for (int s = 0; s < (1 << n); s++) if (s >> i & 1) f[s] = min(f[s], f[s ^ (1 << i)] + c[i]);"),
+    "树形动态规划": (["子树", "根节点", "树上选择"], "f[u][1] += f[v][0]; f[u][0] += max(f[v][0], f[v][1]);"),
+}
+
+STORIES = [
+    "小明在整理他的收藏", "农夫约翰有一片牧场", "某城市正在规划公路", "一个机器人在网格上行走",
+    "学校举办了一场比赛", "商店里有若干件商品", "考古学家发现了一串古老的字符", "一支探险队要穿越山脉",
+    "银行要处理一系列交易", "游戏中有许多关卡", "快递公司需要安排路线", "图书馆要整理书架",
+]
+
+SENTENCES = [
+    "给定 $n$ 个整数 $a_1, a_2, \\dots, a_n$。",
+    "共有 $m$ 次操作，每次操作给出两个整数 $x, y$。",
+    "请你求出满足条件的方案数，答案对 $10^9+7$ 取模。",
+    "请输出最小的代价。",
+    "如果无解，输出 $-1$。",
+    "保证输入数据合法。",
+    "每一步只能向相邻的位置移动。",
+    "请问最多能得到多少价值？",
+    "对于每个询问，输出一行一个整数表示答案。",
+    "注意可能存在重复的元素。",
+]
+
+def _problem(i: int, seed: int):
+    """Statement and solution text of synthetic problem i"""
+    rng = random.Random(seed * 1_000_003 + i)
+    topics = rng.sample(sorted(TOPICS), rng.randint(1, 3))
+    words = [word for topic in topics for word in TOPICS[topic][0]]
+    n_max = rng.choice([10 ** 3, 10 ** 5, 2 * 10 ** 5, 10 ** 6])
+
+    description = [rng.choice(STORIES) + "。"]
+    description += [rng.choice(SENTENCES) for _ in range(rng.randint(3, 6))]
+    description.insert(rng.randint(1, len(description)), f"题目与{'、'.join(rng.sample(words, min(3, len(words))))}有关。")
+    title = rng.choice(STORIES)[:4] + rng.choice(["问题", "计划", "游戏", "挑战"])
+    sample_in = " ".join(str(rng.randint(1, 100)) for _ in range(rng.randint(3, 8)))
+    statement = (f"# S{i:06d} {title}\n\n## 题目描述\n\n{''.join(description)}\n\n"
+                 f"## 输入格式\n\n第一行包含两个整数 $n, m$。\n\n第二行包含 $n$ 个整数。\n\n"
+                 f"## 输出格式\n\n输出一个整数。\n\n"
+                 f"## 样例 #1\n\n### 样例输入 #1\n\n```\n{sample_in}\n```\n\n### 样例输出 #1\n\n```\n{rng.randint(0, 1000)}\n```\n\n"
+                 f"## 提示\n\n对于 $100\\%$ 的数据，$1 \\le n, m \\le {n_max}$。\n")
+
+    ideas = "".join(f"考虑{topic}：注意{'、'.join(TOPICS[topic][0])}。" for topic in topics)
+    body = "\n    ".join(TOPICS[topic][1] for topic in topics)
+    solution = (f"## 思路\n\n{ideas}时间复杂度 $O(n \\log n)$。\n\n"
+                f"## 代码\n\n```cpp\n#include <bits/stdc++.h>\nusing namespace std;\nconst int N = {n_max + 5};\n"
+                f"int n, m, a[N];\nint main() {{\n    scanf(\"%d%d\", &n, &m);\n    for (int i = 1; i <= n; i++) scanf(\"%d\", &a[i]);\n"
+                f"    {body}\n    return 0;\n}}\n```\n")
+    return statement, solution
+
+def generate_corpus(root: Path, n: int, seed: int = 0) -> List[Path]:
+    """Write n synthetic problems as root/Luogu/{statement,solution}/S<i>.md
+
+    Problems are generated from their number and the seed alone, so a
+    smaller corpus is a prefix of a larger one with the same seed. The
+    previous corpus is replaced, so a directory holding anything without
+    the generator's corpus.json is refused rather than emptied.
+
+    Args:
+        root (Path): Questions directory, laid out like QUESTIONS_DIR
+        n (int): Number of problems
+        seed (int): Seed of the generator
+
+    Returns:
+        List[Path]: The statement files
+    """
+    statement_dir, solution_dir = root / "Luogu" / "statement", root / "Luogu" / "solution"
+    info_path = root / "corpus.json"
+    if info_path.exists() and json.loads(info_path.read_text()) == {'problems': n, 'seed': seed}:
+        return sorted(statement_dir.glob("*.md"))
+    if not info_path.exists() and root.exists() and any(root.iterdir()):
+        raise ValueError(f"{root} is not empty and holds no generated corpus; refusing to overwrite it")
+
+    statement_dir.mkdir(parents=True, exist_ok=True)
+    solution_dir.mkdir(parents=True, exist_ok=True)
+    for path in list(statement_dir.glob("*.md")) + list(solution_dir.glob("*.md")):
+        path.unlink()
+
+    paths = []
+    for i in range(n):
+        statement, solution = _problem(i, seed)
+        paths.append(statement_dir / f"S{i:06d}.md")
+        paths[-1].write_text(statement, encoding='utf-8')
+        (solution_dir / f"S{i:06d}.md").write_text(solution, encoding='utf-8')
+    info_path.write_text(json.dumps({'problems': n, 'seed': seed}))
+    return paths
+
+def make_queries(n_problems: int, n_queries: int, seed: int = 0) -> List[str]:
+    """Reworded statements of corpus problems, as users paste them
+
+    Each query keeps most sentences of a problem's description, in another
+    order, and with other limits.
+    """
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(n_queries):
+        statement, _ = _problem(rng.randrange(n_problems), seed)
+        description = statement.split("## 题目描述\n\n")[1].split("\n\n")[0]
+        sentences = [s + "。" for s in description.split("。") if s]
+        rng.shuffle(sentences)
+        kept = sentences[:max(1, len(sentences) - 1)]
+        queries.append(f"## 题目描述\n\n{''.join(kept)}\n\n## 提示\n\n$1 \\le n \\le {rng.randint(10, 10 ** 6)}$。\n")
+    return queries
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic statement/solution corpus")
+    parser.add_argument("root", type=Path, help="questions directory to write, laid out like QUESTIONS_DIR")
+    parser.add_argument("--problems", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Wrote {len(generate_corpus(args.root, args.problems, args.seed))} problems to {args.root}")
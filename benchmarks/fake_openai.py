@@ -0,0 +1,194 @@
+import argparse
+import json
+import re
+import threading
+import time
+import zlib
+from functools import lru_cache
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from benchmarks.corpus import TOPICS
+
+# Words and single CJK characters, the features of the fake embeddings
+_TOKEN = re.compile(r"[A-Za-z_]+|\d+|[一-鿿]")
+
+SOLUTION = ("1. 问题理解\n- 分析题目给出的约束。\n\n2. 解题思路\n- 按参考题解的方法处理。\n\n"
+            "3. C++代码实现\n```cpp\nint main() { return 0; }\n```\n\n4. 复杂度分析\n- 时间复杂度 $O(n)$。\n")
+
+@lru_cache(maxsize=1 << 20)
+def _feature_hash(feature: str) -> int:
+    return zlib.crc32(feature.encode('utf-8'))
+
+def fake_embedding(text: str, dim: int) -> np.ndarray:
+    """Hashed bag of words and word pairs: texts sharing words get similar unit vectors"""
+    tokens = _TOKEN.findall(text)
+    hashes = np.array([_feature_hash(t) for t in tokens] + [_feature_hash(a + b) for a, b in zip(tokens, tokens[1:])]
+                      + [zlib.crc32(text.encode('utf-8'))], dtype=np.uint32)
+    signs = np.where(hashes & 0x80000000, 1.0, -1.0)
+    vector = np.bincount(hashes % dim, weights=signs, minlength=dim).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[hashes[-1] % dim] = 1.0
+        return vector
+    return vector / norm
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(_TOKEN.findall(text)))
+
+def fake_completion(messages) -> str:
+    """Answer the prompts of DocumentProcessor and SolutionGenerator"""
+    prompt = "\n".join(m['content'] if isinstance(m['content'], str) else json.dumps(m['content'], ensure_ascii=False)
+                       for m in messages)
+    # The syllabus precedes the problem in the concepts prompt
+    problem = prompt.split("题目描述：", 1)[-1]
+    topics = [topic for topic in TOPICS if topic in problem][:5] or ["模拟"]
+    if "知识点大纲" in prompt:
+        return ",".join(topics)
+    if "总结" in prompt:
+        return f"主要算法和数据结构：{'、'.join(topics)}；关键技巧：{'、'.join(TOPICS.get(topics[0], ([''],))[0])}。"
+    return SOLUTION
+
+class FakeOpenAI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, dim: int = 256,
+                 embedding_latency_ms: float = 50, chat_latency_ms: float = 300, stream_chunk_ms: float = 5):
+        """Deterministic stand-in for the embeddings and chat completions endpoints
+
+        Responses depend on the request alone. Embeddings are hashed bags of
+        words, so near-duplicate texts are close, and completions answer the
+        concept, summary and solution prompts in the expected format.
+        Every request sleeps for a fixed simulated latency.
+
+        Args:
+            host (str): Interface to listen on
+            port (int): Port to listen on, 0 for any free port
+            dim (int): Embedding size when a request does not ask for dimensions
+            embedding_latency_ms (float): Latency of an embeddings request
+            chat_latency_ms (float): Latency of a completion, or of the first
+                piece of a streamed one
+            stream_chunk_ms (float): Delay between streamed pieces
+        """
+        self.dim = dim
+        self.embedding_latency = embedding_latency_ms / 1000
+        self.chat_latency = chat_latency_ms / 1000
+        self.stream_chunk = stream_chunk_ms / 1000
+        self.requests = {'embeddings': 0, 'chat': 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to set as OPENAI_BASE_URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAI":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, endpoint: str):
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def embeddings(self, body):
+        self._count('embeddings')
+        time.sleep(self.embedding_latency)
+        inputs = [body['input']] if isinstance(body['input'], str) else body['input']
+        dim = body.get('dimensions') or self.dim
+        return {
+            'object': 'list',
+            'data': [{'object': 'embedding', 'index': i, 'embedding': fake_embedding(text, dim).tolist()}
+                     for i, text in enumerate(inputs)],
+            'model': body['model'],
+            'usage': {'prompt_tokens': sum(map(_count_tokens, inputs)),
+                      'total_tokens': sum(map(_count_tokens, inputs))}
+        }
+
+    def chat(self, body):
+        self._count('chat')
+        time.sleep(self.chat_latency)
+        content = fake_completion(body['messages'])
+        prompt_tokens = sum(_count_tokens(json.dumps(m, ensure_ascii=False)) for m in body['messages'])
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': _count_tokens(content),
+                 'total_tokens': prompt_tokens + _count_tokens(content)}
+        return content, usage
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; with Nagle's
+            # algorithm and delayed ACKs each response would wait ~40ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if self.path.endswith('/embeddings'):
+                    self._send_json(fake.embeddings(body))
+                elif self.path.endswith('/chat/completions'):
+                    content, usage = fake.chat(body)
+                    if body.get('stream'):
+                        self._stream(body, content, usage)
+                    else:
+                        self._send_json({
+                            'id': 'fake', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                                         'finish_reason': 'stop'}],
+                            'usage': usage
+                        })
+                else:
+                    self._send_json({'error': {'message': f"Unknown endpoint {self.path}"}}, status=404)
+
+            def _stream(self, body, content, usage):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                chunk = {'id': 'fake', 'object': 'chat.completion.chunk', 'created': 0, 'model': body['model']}
+                for start in range(0, len(content), 16):
+                    piece = {'index': 0, 'delta': {'content': content[start:start + 16]}, 'finish_reason': None}
+                    self.wfile.write(f"data: {json.dumps(dict(chunk, choices=[piece]))}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    time.sleep(fake.stream_chunk)
+                if (body.get('stream_options') or {}).get('include_usage'):
+                    self.wfile.write(f"data: {json.dumps(dict(chunk, choices=[], usage=usage))}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI API for offline runs and benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=256, help="embedding size when none is requested")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument("--chat-latency-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    server = FakeOpenAI(args.host, args.port, dim=args.dim, embedding_latency_ms=args.embedding_latency_ms,
+                        chat_latency_ms=args.chat_latency_ms)
+    print(f"Serving on {server.url}; set OPENAI_BASE_URL to it")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+from benchmarks.corpus import generate_corpus, make_queries
+from benchmarks.fake_openai import FakeOpenAI
+from config import ROOT_DIR, INDEX_CONCURRENCY, FUSION_STRATEGY
+
+# Compared against the baseline, with the direction that is better
+METRICS = {
+    'build.docs_per_s': 'higher',
+    'build.peak_rss_mb': 'lower',
+    'search.startup_s': 'lower',
+    'search.p50_ms': 'lower',
+    'search.p95_ms': 'lower',
+    'search.p99_ms': 'lower',
+    'search.peak_rss_mb': 'lower',
+}
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+def run_build(concurrency: int) -> Dict:
+    """Full build of the vector store the environment points at"""
+    from src.indexer.build_index import build_index
+    from src.indexer.vector_store import current_build, read_manifest
+    from config import VECTOR_STORE_PATH
+
+    start = time.perf_counter()
+    build_index(concurrency=concurrency)
+    seconds = time.perf_counter() - start
+    documents = len(read_manifest(current_build(VECTOR_STORE_PATH)).get('documents', {}))
+    return {
+        'documents': documents,
+        'seconds': seconds,
+        'docs_per_s': documents / seconds,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def run_search(queries: List[str], k: int, fusion: str) -> Dict:
+    """Open the published store and time one search per query"""
+    start = time.perf_counter()
+    from src.retriever.similarity_search import SimilaritySearcher
+    searcher = SimilaritySearcher()
+    startup = time.perf_counter() - start
+
+    # The first search pays for connections and lazy initialisation
+    searcher.search(queries[0], k=k, fusion=fusion)
+    latencies = []
+    for query in queries[1:]:
+        start = time.perf_counter()
+        searcher.search(query, k=k, fusion=fusion)
+        latencies.append((time.perf_counter() - start) * 1000)
+    searcher.close()
+
+    latencies = np.array(latencies)
+    return {
+        'startup_s': startup,
+        'queries': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def _run_phase(phase: str, work_dir: Path, env: Dict, args: List[str]) -> Dict:
+    """Run a phase in a fresh interpreter, so startup and peak RSS are its own"""
+    result_file = work_dir / f"{phase}.json"
+    subprocess.run([sys.executable, "-m", "benchmarks.run_benchmark", "--phase", phase,
+                    "--work-dir", str(work_dir), "--result-file", str(result_file)] + args,
+                   cwd=ROOT_DIR, env=env, check=True)
+    return json.loads(result_file.read_text())
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Metrics that are worse than the baseline by more than threshold
+
+    Args:
+        results (Dict): Results of this run
+        baseline (Dict): Results of a reference run
+        threshold (float): Tolerated relative change, 0.2 for 20%
+
+    Returns:
+        List[str]: One description per regressed metric
+    """
+    regressions = []
+    for metric, better in METRICS.items():
+        section, name = metric.split('.')
+        if name not in baseline.get(section, {}) or name not in results.get(section, {}):
+            continue
+        new, old = results[section][name], baseline[section][name]
+        change = (new - old) / old if old else 0.0
+        if (better == 'higher' and change < -threshold) or (better == 'lower' and change > threshold):
+            regressions.append(f"{metric}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+    return regressions
+
+def benchmark(problems: int, queries: int, work_dir: Path, k: int = 5, fusion: str = FUSION_STRATEGY,
+              concurrency: int = INDEX_CONCURRENCY, seed: int = 0, **server_options) -> Dict:
+    """Build a synthetic corpus and time indexing and search against a fake API
+
+    Args:
+        problems (int): Corpus size
+        queries (int): Searches to time
+        work_dir (Path): Holds the corpus, which is reused by later runs of
+            the same size and seed, and the store and cache, which are not
+        k (int): Results per search
+        fusion (str): Fusion strategy of the searches
+        concurrency (int): Documents processed in parallel by the build
+        seed (int): Seed of the corpus and queries
+        **server_options: Passed on to FakeOpenAI, such as the latencies
+
+    Returns:
+        Dict: The parameters, and the build and search measurements
+    """
+    questions_dir = work_dir / "questions"
+    print(f"Generating {problems} problems in {questions_dir}")
+    generate_corpus(questions_dir, problems, seed)
+    for path in (work_dir / "vector_store", work_dir / "cache"):
+        shutil.rmtree(path, ignore_errors=True)
+    (work_dir / "queries.json").write_text(json.dumps(make_queries(problems, queries + 1, seed), ensure_ascii=False),
+                                           encoding='utf-8')
+
+    server = FakeOpenAI(**server_options).start()
+    env = dict(os.environ,
+               OPENAI_API_KEY="benchmark",
+               OPENAI_BASE_URL=server.url,
+               OI_QUESTIONS_DIR=str(questions_dir),
+               OI_VECTOR_STORE_PATH=str(work_dir / "vector_store"),
+               OI_CACHE_PATH=str(work_dir / "cache" / "llm_cache.sqlite"))
+    try:
+        build = _run_phase("build", work_dir, env, ["--concurrency", str(concurrency)])
+        search = _run_phase("search", work_dir, env, ["-k", str(k), "--fusion", fusion])
+    finally:
+        server.stop()
+
+    return {
+        'params': dict(problems=problems, queries=queries, k=k, fusion=fusion, concurrency=concurrency, seed=seed,
+                       **server_options),
+        'build': build,
+        'search': search,
+        'requests': server.requests
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark indexing and search offline, on a synthetic corpus and a fake OpenAI API")
+    parser.add_argument("--problems", type=int, default=1000, help="corpus size, 100 to 100k")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--fusion", default=FUSION_STRATEGY)
+    parser.add_argument("--concurrency", type=int, default=INDEX_CONCURRENCY)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dim", type=int, default=256, help="embedding size returned by the fake API")
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument("--chat-latency-ms", type=float, default=300)
+    parser.add_argument("--work-dir", type=Path, help="defaults to a temporary directory")
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="fail if the results regress against this results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="tolerated relative regression")
+    parser.add_argument("--phase", choices=("build", "search"), help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase == "build":
+        args.result_file.write_text(json.dumps(run_build(args.concurrency)))
+        sys.exit(0)
+    if args.phase == "search":
+        queries = json.loads((args.work_dir / "queries.json").read_text(encoding='utf-8'))
+        args.result_file.write_text(json.dumps(run_search(queries, args.k, args.fusion)))
+        sys.exit(0)
+
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="oi-bench-"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    results = benchmark(args.problems, args.queries, work_dir, k=args.k, fusion=args.fusion,
+                        concurrency=args.concurrency, seed=args.seed, dim=args.dim,
+                        embedding_latency_ms=args.embedding_latency_ms, chat_latency_ms=args.chat_latency_ms)
+    if args.work_dir is None:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    build, search = results['build'], results['search']
+    print(f"build:  {build['documents']} documents in {build['seconds']:.1f}s, {build['docs_per_s']:.1f} docs/s, "
+          f"peak RSS {build['peak_rss_mb']:.0f} MB")
+    print(f"search: startup {search['startup_s']:.2f}s, p50 {search['p50_ms']:.1f}ms, p95 {search['p95_ms']:.1f}ms, "
+          f"p99 {search['p99_ms']:.1f}ms over {search['queries']} queries, peak RSS {search['peak_rss_mb']:.0f} MB")
+    print(f"API requests: {results['requests']['embeddings']} embeddings, {results['requests']['chat']} chat")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get('params') != results['params']:
+            print(f"Warning: the baseline was run with other parameters: {baseline.get('params')}")
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression past {args.threshold:.0%} against {args.baseline}")
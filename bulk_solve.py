@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Set
+from src.retriever.similarity_search import SimilaritySearcher, SEARCH_MODES
+from src.generator.solution_generator import SolutionGenerator
+from config import OPENAI_API_KEY, SEARCH_WORKERS, SEARCH_MODE
+
+def read_questions(input_path: Path) -> Iterator[Dict]:
+    """Stream {'id', 'question', 'solution'} records from the input
+
+    Args:
+        input_path (Path): A JSONL file with 'question' and optional 'id' and
+            'solution' fields per line, or a directory of .md statements
+            named by their id
+    """
+    if input_path.is_dir():
+        for path in sorted(input_path.glob("*.md")):
+            yield {'id': path.stem, 'question': path.read_text(encoding='utf-8'), 'solution': ""}
+        return
+
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                record = json.loads(line)
+                yield {'id': str(record.get('id', line_number)), 'question': record['question'],
+                       'solution': record.get('solution', "")}
+
+def load_checkpoint(output_path: Path) -> Set[str]:
+    """Ids already written to the output
+
+    A line cut short by an interrupted run is removed, so that appending
+    continues from the last complete result.
+    """
+    if not output_path.exists():
+        return set()
+    done, valid_bytes = set(), 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['id'])
+            except (ValueError, KeyError):
+                break
+            valid_bytes += len(line)
+    if valid_bytes < output_path.stat().st_size:
+        with open(output_path, 'r+b') as f:
+            f.truncate(valid_bytes)
+    return done
+
+def _batches(records: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def bulk_solve(input_path: Path, output_path: Path, k: int = 5, batch_size: int = 32,
+               concurrency: int = SEARCH_WORKERS, generate: bool = True, concepts: List[str] = None,
+               mode: str = SEARCH_MODE):
+    """Find similar questions, and generate a solution, for every input question
+
+    Results are appended to output_path one JSON line per question after
+    each batch, and questions already in it are skipped, so an interrupted
+    run picks up where it stopped.
+
+    Args:
+        input_path (Path): Questions, see read_questions
+        output_path (Path): JSONL file of results
+        k (int): Similar questions per question
+        batch_size (int): Questions searched together
+        concurrency (int): Maximum completions in flight
+        generate (bool): Also generate a solution of each question
+        concepts (List[str], optional): Only return questions having these concepts
+        mode (str): Search mode, see SimilaritySearcher.search
+    """
+    done = load_checkpoint(output_path)
+    if done:
+        print(f"Resuming: {len(done)} questions already in {output_path}")
+
+    searcher = SimilaritySearcher(OPENAI_API_KEY)
+    generator = SolutionGenerator(OPENAI_API_KEY) if generate else None
+
+    written, start = 0, time.perf_counter()
+    records = (record for record in read_questions(input_path) if record['id'] not in done)
+    with open(output_path, 'a', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for batch in _batches(records, batch_size):
+            similar = searcher.search_many([r['question'] for r in batch], k=k,
+                                           solutions=[r['solution'] for r in batch],
+                                           concepts=concepts, concurrency=concurrency, mode=mode)
+            solutions = [None] * len(batch)
+            if generator is not None:
+                solutions = list(executor.map(generator.generate, [r['question'] for r in batch], similar))
+
+            for record, similar_questions, solution in zip(batch, similar, solutions):
+                result = {
+                    'id': record['id'],
+                    'similar': [{'id': q['id'], 'score': q['score'], 'concepts': q['concepts']}
+                                for q in similar_questions]
+                }
+                if solution is not None:
+                    result['solution'] = solution
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+            # Checkpoint: a batch is on disk before the next one starts
+            out.flush()
+            os.fsync(out.fileno())
+            written += len(batch)
+            elapsed = time.perf_counter() - start
+            print(f"{written} questions solved ({written / elapsed:.2f}/s)")
+
+    searcher.close()
+    print(f"Done: {written} new results in {output_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find similar questions and generate solutions for a problem set")
+    parser.add_argument("input", type=Path, help="JSONL file of questions, or a directory of .md statements")
+    parser.add_argument("output", type=Path, help="JSONL file results are appended to; rerun to resume")
+    parser.add_argument("-k", type=int, default=5, help="similar questions per question")
+    parser.add_argument("--batch-size", type=int, default=32, help="questions searched together")
+    parser.add_argument("--concurrency", type=int, default=SEARCH_WORKERS, help="maximum completions in flight")
+    parser.add_argument("--no-generate", action="store_true", help="only find similar questions")
+    parser.add_argument("--concepts", nargs="+", help="only return questions having these concepts")
+    parser.add_argument("--mode", choices=SEARCH_MODES, default=SEARCH_MODE,
+                        help="lexical searches without any API call")
+    args = parser.parse_args()
+
+    bulk_solve(args.input, args.output, k=args.k, batch_size=args.batch_size, concurrency=args.concurrency,
+               generate=not args.no_generate, concepts=args.concepts, mode=args.mode)
@@ -7,18 +7,139 @@ load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Project paths
+# Project paths; the corpus, store and cache can be moved through the
+# environment, as the benchmarks do to run on a synthetic corpus
 ROOT_DIR = Path(__file__).parent
 DATA_DIR = ROOT_DIR / "data"
-QUESTIONS_DIR = DATA_DIR / "questions"
-VECTOR_STORE_PATH = DATA_DIR / "vector_store"
+QUESTIONS_DIR = Path(os.getenv("OI_QUESTIONS_DIR", DATA_DIR / "questions"))
+VECTOR_STORE_PATH = Path(os.getenv("OI_VECTOR_STORE_PATH", DATA_DIR / "vector_store"))
 
-# Embedding model
+# Embedding model: "openai" embeds through the API, "local" runs a
+# sentence-transformers model in-process on the CPU (pip install sentence-transformers)
+EMBEDDING_PROVIDER = "openai"
 EMBEDDING_MODEL = "text-embedding-3-large"
+LOCAL_EMBEDDING_MODEL = "BAAI/bge-small-zh-v1.5"  # Used instead of EMBEDDING_MODEL by the local provider
+LOCAL_EMBEDDING_BATCH_SIZE = 64  # Texts per forward pass
+LOCAL_EMBEDDING_DEVICE = "cpu"
+EMBEDDING_BATCH_SIZE = 512  # Max inputs per embeddings request (API limit 2048)
+EMBEDDING_BATCH_TOKENS = 250000  # Max tokens per embeddings request (API limit 300k)
+EMBEDDING_MAX_INPUT_TOKENS = 8191  # Longer inputs are truncated
+EMBEDDING_DIMENSIONS = None  # Shorten embeddings to this many dimensions; None keeps the full size
+EMBEDDING_DIMENSIONS_MODE = "api"  # "api" requests shortened embeddings, "truncate" cuts and renormalises locally
+VECTOR_STORAGE = "float32"  # How indexes store vectors: "float32", "float16" or "int8" (scalar-quantized)
 
 # Completion model
 COMPLETION_MODEL = "gpt-4o-mini"
 
+# Solution generation: references are packed into the prompt within this
+# many tokens, most relevant first, trimmed to their summary and code when short
+CONTEXT_TOKEN_BUDGET = 6000
+CONTEXT_QUESTION_TOKENS = 800  # Longest reference statement kept whole
+
+# Tracing: per-stage timing spans with token counts and estimated cost
+TRACING_ENABLED = True
+TRACE_MAX_SPANS = 20000  # Most recent spans kept in memory for the latency histograms
+TRACE_LOG_PATH = None  # JSON-lines file every span is also logged to, e.g. DATA_DIR / "traces.jsonl"
+
+# USD per million tokens, (input, output), for the cost estimates
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-ada-002": (0.10, 0.0),
+}
+
+# Cache for LLM completions and embeddings
+CACHE_ENABLED = True
+CACHE_PATH = Path(os.getenv("OI_CACHE_PATH", DATA_DIR / "cache" / "llm_cache.sqlite"))
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # Least recently used entries are evicted past this size
+
+# Results of whole searches and generations, kept in memory per process and
+# matched on the normalized question, then on question-embedding similarity
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_MAX_ENTRIES = 1000
+RESULT_CACHE_TTL = 24 * 3600  # Seconds
+RESULT_CACHE_SIMILARITY = 0.97  # Minimum cosine similarity of a near-duplicate question
+
+# Solution PDF conversion (PDFconvertor.py)
+PDF_IMAGE_DPI = 300
+PDF_IMAGE_FORMAT = "png"  # "png" or "jpeg"
+PDF_JPEG_QUALITY = 85  # Compression of jpeg pages, 1-95
+PDF_GRAYSCALE = False  # Grayscale pages are a fraction of the size of colour ones
+PDF_WORKERS = os.cpu_count() or 1  # PDFs rendered in parallel processes
+
+# Transcription of the rendered pages (ImageToText.py)
+OCR_MAX_SIDE = 2048  # Pages are downsized to at most this many pixels per side
+OCR_JPEG_QUALITY = 85  # Pages are sent re-encoded as jpeg
+OCR_PAGES_PER_CHUNK = 4  # Pages sent in one request
+OCR_CONCURRENCY = 4  # Requests in flight per document
+OCR_MAX_ATTEMPTS = 3  # Attempts per chunk before the document fails
+
+# Indexing
+INDEX_CONCURRENCY = 8  # Max documents processed in parallel by build_index
+
+# Vector index: "flat" (exact), "ivf_flat", "ivf_pq" or "hnsw"; compare them
+# with python -m benchmarks.ann_benchmark
+INDEX_TYPE = "flat"
+IVF_NLIST = 1024  # Upper bound; small corpora get fewer lists
+IVF_NPROBE = 16
+PQ_M = 64  # Sub-quantizers; must divide the embedding dimension
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 128
+
+# Vector store: each build is written to its own directory under
+# VECTOR_STORE_PATH/builds and published by pointing CURRENT at it
+STORE_MMAP = True  # Memory-map the indexes instead of reading them into memory
+STORE_VERIFY_CHECKSUMS = False  # Hash every file against the manifest when opening
+STORE_RELOAD_INTERVAL = 10  # Seconds between checks of the app for a newly published build; 0 disables
+
+# Lexical BM25 index over statements and solutions, built next to the FAISS indexes
+LEXICAL_NGRAMS = (2, 3)  # Character n-gram lengths; words and LaTeX commands also count alone
+LEXICAL_K1 = 1.2
+LEXICAL_B = 0.75
+LEXICAL_MAX_QUERY_TERMS = 256  # Rarest query terms scored; common n-grams add cost, not precision
+
+# Near-duplicate detection: a query that is a stored statement, pasted as is
+# or lightly edited, is answered from neighbours computed at build time,
+# without extraction or embedding calls. Those neighbours come from the stored
+# concepts and summary, extracted with the editorial, so the ranking can
+# differ from that of searching the question alone. MinHash signatures of statement
+# shingles are bucketed in LSH bands; a band of r rows over b bands finds
+# pairs above a Jaccard similarity of about (1 / b) ** (1 / r)
+DUPLICATE_DETECTION = True
+DUPLICATE_SHINGLE = 4  # Characters, words or LaTeX commands per shingle
+DUPLICATE_PERMUTATIONS = 128  # MinHash signature length
+DUPLICATE_BANDS = 16  # Of DUPLICATE_PERMUTATIONS // DUPLICATE_BANDS rows each
+DUPLICATE_THRESHOLD = 0.8  # Minimum estimated Jaccard similarity of the shingle sets
+DUPLICATE_MIN_SHINGLES = 20  # Shorter queries are never taken for a stored problem
+DUPLICATE_SPARE_NEIGHBOURS = 20  # Kept past SEARCH_FETCH_K, so incremental builds rarely search again
+
+# Concept extraction: "llm" asks the completion model with the whole NOI
+# syllabus in the prompt, "embedding" matches embeddings against its topics
+CONCEPT_ENGINE = "llm"
+CONCEPT_SIMILARITY_THRESHOLD = 0.3
+CONCEPT_TOP_K = 5
+
+# Search
+SEARCH_WORKERS = 8  # Threads shared by all searches for the LLM and embedding calls
+SEARCH_FETCH_K = 20  # Candidates taken from each index before fusion
+FUSION_STRATEGY = "rrf"  # "rrf", "weighted_distance", or "question" for the question index alone
+FUSION_WEIGHTS = {"questions": 1.0, "concepts": 0.5, "summary": 0.8, "lexical": 0.7}
+# "vector" fuses the FAISS indexes, "hybrid" adds the lexical BM25 ranking to
+# them, and "lexical" ranks by BM25 alone, without any API call
+SEARCH_MODE = "hybrid"
+RRF_K = 60
+FILTER_EXACT_MAX_IDS = 4096  # Concept filters allowing fewer documents are scored exactly
+
+# HTTP search service (python -m src.service.search_service)
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_BATCH_WINDOW_MS = 10  # Requests arriving this close together are searched as one batch
+SERVICE_MAX_BATCH = 64
+SERVICE_GENERATE_WORKERS = 4  # Threads for /generate, apart from the searches
+
 # LeetCode concepts
 LEETCODE_CONCEPTS = [
     "Array", "String", "Hash Table", "Dynamic Programming",
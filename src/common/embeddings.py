@@ -0,0 +1,280 @@
+import logging
+import re
+import threading
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+import tiktoken
+from src.common.tracing import span
+from config import (EMBEDDING_PROVIDER, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_TOKENS,
+                    EMBEDDING_MAX_INPUT_TOKENS, EMBEDDING_DIMENSIONS, EMBEDDING_DIMENSIONS_MODE, VECTOR_STORAGE,
+                    LOCAL_EMBEDDING_MODEL, LOCAL_EMBEDDING_BATCH_SIZE, LOCAL_EMBEDDING_DEVICE)
+
+logger = logging.getLogger("oi_search.embeddings")
+
+# Stores built before providers were recorded were embedded through the API
+LAYOUT_DEFAULTS = {'provider': "openai"}
+
+def default_layout() -> Dict:
+    """Embedding layout described by config.py
+
+    The layout is recorded with a vector store so that queries are embedded
+    the same way as the stored documents.
+    """
+    return {
+        'provider': EMBEDDING_PROVIDER,
+        'model': LOCAL_EMBEDDING_MODEL if EMBEDDING_PROVIDER == "local" else EMBEDDING_MODEL,
+        'dimensions': EMBEDDING_DIMENSIONS,
+        'dimensions_mode': EMBEDDING_DIMENSIONS_MODE,
+        'storage': VECTOR_STORAGE
+    }
+
+def layout_value(layout: Dict, key: str):
+    return layout.get(key, LAYOUT_DEFAULTS.get(key))
+
+def same_embeddings(layout: Dict, other: Dict) -> bool:
+    """Whether two layouts produce interchangeable query embeddings"""
+    keys = ('provider', 'model', 'dimensions', 'dimensions_mode')
+    return all(layout_value(layout, key) == layout_value(other, key) for key in keys)
+
+def truncate_embeddings(embeddings: np.ndarray, dimensions: int) -> np.ndarray:
+    """Keep the first dimensions of each row and rescale it to unit length"""
+    embeddings = embeddings[:, :dimensions]
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+
+class ApproximateEncoding:
+    """Stand-in for a tiktoken encoding that needs no download
+
+    Tokens are CJK characters, runs of up to four word characters and
+    single symbols, each with a leading space, and other whitespace runs,
+    which is close to cl100k_base's
+    counts for statements and code. Decoding the tokens of a text gives
+    the text back.
+    """
+    name = "approximate"
+    _TOKEN = re.compile(r"\s?(?:[\u3400-\u9fff\uf900-\ufaff]|\w{1,4}|[^\w\s])|\s+")
+
+    def encode(self, text: str, **kwargs) -> List[str]:
+        return self._TOKEN.findall(text)
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+def get_encoding(model: str):
+    """tiktoken encoding of a model, cl100k_base for models it does not know
+
+    tiktoken downloads encodings on first use; without network access,
+    and nothing in TIKTOKEN_CACHE_DIR, tokens are counted approximately.
+    """
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning("Could not load the tiktoken encoding of %s (%s), counting tokens approximately",
+                               model, type(e).__name__)
+                _encodings[model] = ApproximateEncoding()
+        return _encodings[model]
+
+def _batches(token_counts: List[int], max_items: int, max_tokens: int) -> Iterator[List[int]]:
+    """Group input positions into batches that respect both request limits"""
+    batch, batch_tokens = [], 0
+    for i, n_tokens in enumerate(token_counts):
+        if batch and (len(batch) >= max_items or batch_tokens + n_tokens > max_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += n_tokens
+    if batch:
+        yield batch
+
+def embed_texts(client, texts: List[str], model: str, cache=None,
+                dimensions: Optional[int] = None, dimensions_mode: str = "api",
+                batch_size: int = EMBEDDING_BATCH_SIZE,
+                max_batch_tokens: int = EMBEDDING_BATCH_TOKENS) -> np.ndarray:
+    """Embed many texts with as few embeddings requests as possible
+
+    Args:
+        client (OpenAI): Client used for the requests
+        texts (List[str]): Texts to embed
+        model (str): Name of the embedding model to use
+        cache (LLMCache, optional): Cache consulted before, and filled after, the requests
+        dimensions (int, optional): Shorten the embeddings to this size
+        dimensions_mode (str): "api" to pass dimensions to the model, or
+            "truncate" to cut full embeddings and renormalise them
+        batch_size (int): Max number of inputs per request
+        max_batch_tokens (int): Max number of tokens per request
+
+    Returns:
+        np.ndarray: float32 matrix of shape (len(texts), dim), rows in input order
+    """
+    # Truncated embeddings are cut from cached full-size ones
+    params = {'dimensions': dimensions} if dimensions and dimensions_mode == "api" else {}
+
+    rows = [None] * len(texts)
+    if cache is not None:
+        rows = cache.get_embeddings(model, params, texts)
+    missing = [i for i, row in enumerate(rows) if row is None]
+
+    if missing:
+        encoding = get_encoding(model)
+
+        # The endpoint rejects empty strings and inputs over its context length
+        inputs = []
+        for i in missing:
+            text = texts[i]
+            tokens = encoding.encode(text or " ", disallowed_special=())
+            if len(tokens) > EMBEDDING_MAX_INPUT_TOKENS:
+                text = encoding.decode(tokens[:EMBEDDING_MAX_INPUT_TOKENS])
+                tokens = tokens[:EMBEDDING_MAX_INPUT_TOKENS]
+            inputs.append((text or " ", len(tokens)))
+
+        for batch in _batches([n_tokens for _, n_tokens in inputs], batch_size, max_batch_tokens):
+            with span("embedding", model=model, inputs=len(batch)) as record:
+                response = client.embeddings.create(
+                    input=[inputs[j][0] for j in batch],
+                    model=model,
+                    **params
+                )
+                usage = getattr(response, 'usage', None)
+                record['input_tokens'] = (usage.prompt_tokens if usage is not None
+                                          else sum(inputs[j][1] for j in batch))
+            embedded = [None] * len(batch)
+            for item in response.data:
+                embedded[item.index] = item.embedding
+            for j, embedding in zip(batch, embedded):
+                rows[missing[j]] = embedding
+            if cache is not None:
+                cache.put_embeddings(model, params, [texts[missing[j]] for j in batch], embedded)
+
+    if not rows:
+        return np.zeros((0, 0), dtype=np.float32)
+    embeddings = np.array(rows, dtype=np.float32)
+    if dimensions and dimensions_mode == "truncate":
+        embeddings = truncate_embeddings(embeddings, dimensions)
+    return embeddings
+
+class EmbeddingProvider:
+    """Embeds texts as a vector store layout describes
+
+    Subclasses implement embed; get_provider picks the one named by the
+    layout's 'provider'.
+    """
+    name = None
+
+    def __init__(self, layout: Dict, cache=None):
+        self.layout = layout
+        self.model = layout['model']
+        self.cache = cache
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in as few requests or forward passes as possible
+
+        Returns:
+            np.ndarray: float32 matrix of shape (len(texts), dim), rows in input order
+        """
+        raise NotImplementedError
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    name = "openai"
+
+    def __init__(self, layout: Dict, cache=None, client=None):
+        super().__init__(layout, cache)
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI()
+        self.client = client
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return embed_texts(self.client, texts, self.model, cache=self.cache,
+                           dimensions=self.layout.get('dimensions'),
+                           dimensions_mode=self.layout.get('dimensions_mode', "api"))
+
+_local_models = {}
+_local_models_lock = threading.Lock()
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    name = "local"
+
+    def __init__(self, layout: Dict, cache=None, batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+                 device: str = LOCAL_EMBEDDING_DEVICE):
+        """Embed with a sentence-transformers model running in this process
+
+        The model is loaded on first use and shared by every provider of the
+        process, so reopening a store does not load it again. Embeddings are
+        normalized, and shortened by truncation when the layout asks for
+        fewer dimensions.
+
+        Args:
+            layout (Dict): Layout naming the sentence-transformers model
+            cache (LLMCache, optional): Cache consulted before, and filled after, inference
+            batch_size (int): Texts per forward pass
+            device (str): Torch device to run on
+        """
+        super().__init__(layout, cache)
+        self.batch_size = batch_size
+        self.device = device
+        # Cached apart from API embeddings of a model with the same name
+        self.cache_model = f"local/{self.model}"
+
+    def _load(self):
+        with _local_models_lock:
+            key = (self.model, self.device)
+            if key not in _local_models:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError:
+                    raise ImportError("The local embedding provider needs sentence-transformers: "
+                                      "pip install sentence-transformers") from None
+                logger.info("Loading %s on %s", self.model, self.device)
+                # Forward passes are serialized; torch already uses every core for each
+                _local_models[key] = (SentenceTransformer(self.model, device=self.device), threading.Lock())
+            return _local_models[key]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        rows = [None] * len(texts)
+        if self.cache is not None:
+            rows = self.cache.get_embeddings(self.cache_model, {}, texts)
+        missing = [i for i, row in enumerate(rows) if row is None]
+
+        if missing:
+            model, lock = self._load()
+            with span("embedding", model=self.model, inputs=len(missing)), lock:
+                embedded = model.encode([texts[i] or " " for i in missing], batch_size=self.batch_size,
+                                        normalize_embeddings=True, convert_to_numpy=True,
+                                        show_progress_bar=False).astype(np.float32)
+            for i, embedding in zip(missing, embedded):
+                rows[i] = embedding
+            if self.cache is not None:
+                self.cache.put_embeddings(self.cache_model, {}, [texts[i] for i in missing], embedded)
+
+        if not rows:
+            return np.zeros((0, 0), dtype=np.float32)
+        embeddings = np.array(rows, dtype=np.float32)
+        dimensions = self.layout.get('dimensions')
+        if dimensions and dimensions < embeddings.shape[1]:
+            embeddings = truncate_embeddings(embeddings, dimensions)
+        return embeddings
+
+PROVIDERS = {provider.name: provider for provider in (OpenAIEmbeddingProvider, LocalEmbeddingProvider)}
+
+def get_provider(layout: Dict, cache=None, client=None) -> EmbeddingProvider:
+    """Embedding provider of a layout
+
+    Args:
+        layout (Dict): Layout of the store the embeddings are for
+        cache (LLMCache, optional): Cache of computed embeddings
+        client (OpenAI, optional): Client of the OpenAI provider
+    """
+    provider = layout_value(layout, 'provider')
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown embedding provider: {provider}")
+    if provider == OpenAIEmbeddingProvider.name:
+        return OpenAIEmbeddingProvider(layout, cache=cache, client=client)
+    return PROVIDERS[provider](layout, cache=cache)
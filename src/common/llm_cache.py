@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from config import CACHE_ENABLED, CACHE_PATH, CACHE_MAX_BYTES
+
+class LLMCache:
+    def __init__(self, path: Path = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        """Persistent cache for completions and embeddings
+
+        Entries are keyed by model, request parameters and a hash of the
+        input text, and stored in SQLite so they survive restarts and can
+        be shared by several processes.
+
+        Args:
+            path (Path): SQLite database file
+            max_bytes (int): Size bound; least recently used entries are
+                evicted once the stored values exceed it
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_model ON entries (model)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, params: Dict, text: str) -> str:
+        """Content-addressed key for one request"""
+        text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        payload = json.dumps([model, params, text_hash], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Look up several keys, counting a hit or a miss for each"""
+        if not keys:
+            return []
+        with self._lock:
+            found = {}
+            # Stay below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            values = [found.get(key) for key in keys]
+            self.hits += sum(value is not None for value in values)
+            self.misses += sum(value is None for value in values)
+            return values
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key])[0]
+
+    def put_many(self, model: str, items: Dict[str, bytes]):
+        """Store values for several keys, then evict down to the size bound"""
+        if not items:
+            return
+        with self._lock:
+            # Other processes write to the same database, so the size is read
+            # in the transaction that inserts and evicts, never kept in memory
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, model, value, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                    [(key, model, value, len(value), now) for key, value in items.items()]
+                )
+                size = self._total_size()
+                if size > self.max_bytes:
+                    self._evict(size)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+    def put(self, key: str, model: str, value: bytes):
+        self.put_many(model, {key: value})
+
+    def _total_size(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self, size: int):
+        # Free a tenth of the budget at once so eviction does not run on every put
+        target = self.max_bytes * 0.9
+        evicted = []
+        for key, entry_size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            if size <= target:
+                break
+            evicted.append((key,))
+            size -= entry_size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def get_completion(self, model: str, params: Dict, prompt: str) -> Optional[str]:
+        value = self.get(self.make_key(model, params, prompt))
+        return value.decode('utf-8') if value is not None else None
+
+    def put_completion(self, model: str, params: Dict, prompt: str, content: str):
+        self.put(self.make_key(model, params, prompt), model, content.encode('utf-8'))
+
+    def get_embeddings(self, model: str, params: Dict, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [self.make_key(model, params, text) for text in texts]
+        return [np.frombuffer(value, dtype=np.float32) if value is not None else None
+                for value in self.get_many(keys)]
+
+    def put_embeddings(self, model: str, params: Dict, texts: List[str], embeddings: np.ndarray):
+        self.put_many(model, {
+            self.make_key(model, params, text): np.asarray(embedding, dtype=np.float32).tobytes()
+            for text, embedding in zip(texts, embeddings)
+        })
+
+    def invalidate(self, model: str) -> int:
+        """Drop every entry produced by the given model
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self._lock:
+            count = self._conn.execute("DELETE FROM entries WHERE model = ?", (model,)).rowcount
+            self._conn.commit()
+            return count
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': entries,
+                'bytes': self._total_size()
+            }
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_cache() -> Optional[LLMCache]:
+    """The process-wide cache shared by the indexer and the searcher,
+    or None when caching is disabled in config"""
+    global _default_cache
+    if not CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the LLM cache")
+    parser.add_argument("--invalidate", metavar="MODEL", help="remove all entries of a model")
+    args = parser.parse_args()
+
+    cache = LLMCache()
+    if args.invalidate:
+        print(f"Removed {cache.invalidate(args.invalidate)} entries for {args.invalidate}")
+    print(cache.stats())
@@ -0,0 +1,188 @@
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import numpy as np
+from config import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL, RESULT_CACHE_SIMILARITY
+
+def normalize_text(text: str) -> str:
+    """Canonical form of a pasted question: NFKC, lower case, single spaces"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+class SemanticResultCache:
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, ttl: float = RESULT_CACHE_TTL,
+                 threshold: float = RESULT_CACHE_SIMILARITY):
+        """In-memory cache of results for repeated and near-duplicate questions
+
+        A lookup first matches the normalized question text exactly, then, if
+        the caller can embed the question, the most similar cached question
+        whose embedding is at least threshold cosine-similar. Only entries
+        stored with the same parameters are matched.
+
+        Args:
+            max_entries (int): Least recently used entries are evicted past this
+            ttl (float): Seconds an entry stays valid
+            threshold (float): Minimum cosine similarity of a near-duplicate
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # Embeddings of the entries, one preallocated row each, written in
+        # place; rows of evicted entries are reused, and only rows up to
+        # _used have ever held one
+        self._vectors = None
+        self._row_keys = []
+        self._free_rows = []
+        self._used = 0
+
+    @staticmethod
+    def _key(text: str, params: Dict) -> str:
+        payload = json.dumps([normalize_text(text), params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _params_key(params: Dict) -> str:
+        return json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry['created'] > self.ttl]
+        for key in expired:
+            self._release(self._entries.pop(key))
+
+    def _release(self, entry: Dict):
+        row = entry['row']
+        if row is not None:
+            self._row_keys[row] = None
+            self._free_rows.append(row)
+
+    def _store_embedding(self, key: str, embedding: np.ndarray) -> Optional[int]:
+        """Write an entry's embedding into a free row, returning the row"""
+        if embedding is None:
+            return None
+        if self._vectors is None or self._vectors.shape[1] != len(embedding):
+            # Embeddings of another size do not compare with the new ones
+            for entry in self._entries.values():
+                entry['row'] = None
+            self._vectors = np.zeros((self.max_entries, len(embedding)), dtype=np.float32)
+            self._row_keys = [None] * self.max_entries
+            self._free_rows = []
+            self._used = 0
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = self._used
+            self._used += 1
+        self._vectors[row] = embedding
+        self._row_keys[row] = key
+        return row
+
+    def _semantic_match(self, embedding: np.ndarray, params_key: str) -> Optional[str]:
+        if self._vectors is None or self._vectors.shape[1] != len(embedding):
+            return None
+
+        query = embedding / max(np.linalg.norm(embedding), 1e-12)
+        similarities = self._vectors[:self._used] @ query
+        candidates = np.flatnonzero(similarities >= self.threshold)
+        for i in candidates[np.argsort(-similarities[candidates])]:
+            key = self._row_keys[i]
+            if key is not None and self._entries[key]['params'] == params_key:
+                return key
+        return None
+
+    def lookup(self, text: str, params: Dict,
+               embed: Callable[[], np.ndarray] = None) -> Tuple[Optional[Any], Optional[np.ndarray]]:
+        """Cached result for a question
+
+        Args:
+            text (str): The question
+            params (Dict): Everything else the result depends on
+            embed (Callable, optional): Returns the question embedding; only
+                called when there is no exact match. Without it only exact
+                repeats are found
+
+        Returns:
+            Tuple[Any, np.ndarray]: The result or None, and the embedding if
+                embed was called, so the caller need not compute it again
+        """
+        value = self.lookup_exact(text, params)
+        if value is not None:
+            return value, None
+        # Embedded outside the lock, which may take a request
+        embedding = embed() if embed is not None else None
+        if embedding is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+        return self.lookup_similar(embedding, params), embedding
+
+    def lookup_exact(self, text: str, params: Dict) -> Optional[Any]:
+        """Cached result for a repeat of a question, without embedding it
+
+        A miss is not counted, since lookup_similar usually follows.
+        """
+        key = self._key(text, params)
+        with self._lock:
+            self._expire(time.time())
+            if key not in self._entries:
+                return None
+            self.exact_hits += 1
+            self._entries.move_to_end(key)
+            # Callers may modify what they get back
+            return copy.deepcopy(self._entries[key]['value'])
+
+    def lookup_similar(self, embedding: np.ndarray, params: Dict) -> Optional[Any]:
+        """Cached result for a near-duplicate of a question, given its embedding"""
+        with self._lock:
+            key = self._semantic_match(embedding, self._params_key(params))
+            if key is None:
+                self.misses += 1
+                return None
+            self.semantic_hits += 1
+            self._entries.move_to_end(key)
+            return copy.deepcopy(self._entries[key]['value'])
+
+    def put(self, text: str, params: Dict, value: Any, embedding: np.ndarray = None):
+        """Cache the result for a question, evicting the least recently used entries"""
+        if embedding is not None:
+            embedding = (embedding / max(np.linalg.norm(embedding), 1e-12)).astype(np.float32)
+        with self._lock:
+            key = self._key(text, params)
+            if key in self._entries:
+                self._release(self._entries.pop(key))
+            # Evicted first, so the new entry's embedding finds a free row
+            while len(self._entries) >= self.max_entries:
+                self._release(self._entries.popitem(last=False)[1])
+            self._entries[key] = {
+                'value': copy.deepcopy(value),
+                'params': self._params_key(params),
+                'row': self._store_embedding(key, embedding),
+                'created': time.time()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._vectors = None
+            self._row_keys, self._free_rows, self._used = [], [], 0
+
+    def stats(self) -> Dict:
+        """Entry count, hit counts and hit rate"""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0
+            }
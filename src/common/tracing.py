@@ -0,0 +1,188 @@
+import argparse
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+import numpy as np
+from config import TRACING_ENABLED, TRACE_MAX_SPANS, TRACE_LOG_PATH, MODEL_PRICES
+
+logger = logging.getLogger("oi_search.trace")
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+def estimate_cost(model: str, input_tokens: int = 0, output_tokens: int = 0) -> float:
+    """Estimated USD cost of a call, 0 for models without a known price"""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1e6
+
+class Tracer:
+    def __init__(self, max_spans: int = TRACE_MAX_SPANS, log_path: Optional[Path] = TRACE_LOG_PATH):
+        """Collects finished spans for latency histograms and structured logs
+
+        Args:
+            max_spans (int): Most recent spans kept in memory
+            log_path (Path, optional): JSON-lines file every span is appended to
+        """
+        self._lock = threading.Lock()
+        self._spans = deque(maxlen=max_spans)
+        if log_path is not None and not logger.handlers:
+            Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.FileHandler(log_path, encoding='utf-8')
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+    def record(self, span: Dict):
+        with self._lock:
+            self._spans.append(span)
+        logger.info(json.dumps(span, ensure_ascii=False, default=str))
+
+    def spans(self, trace_id: str = None) -> List[Dict]:
+        """Recorded spans, oldest first, optionally of one trace only"""
+        with self._lock:
+            spans = list(self._spans)
+        return [span for span in spans if trace_id is None or span.get('trace_id') == trace_id]
+
+    def last_trace(self, name: str = None) -> List[Dict]:
+        """Spans of the most recently finished trace, optionally of the last one named name"""
+        spans = self.spans()
+        roots = [span for span in spans if span.get('root') and name in (None, span['name'])]
+        return [span for span in spans if roots and span.get('trace_id') == roots[-1]['trace_id']]
+
+    def summary(self, spans: List[Dict] = None) -> Dict[str, Dict]:
+        """Per span name: count, latency percentiles in ms, tokens and cost
+
+        Args:
+            spans (List[Dict], optional): Spans to summarize, such as those
+                of one trace; defaults to every recorded span
+        """
+        by_name = {}
+        for span in self.spans() if spans is None else spans:
+            by_name.setdefault(span['name'], []).append(span)
+        summary = {}
+        for name, spans in sorted(by_name.items()):
+            durations = np.array([span['duration_ms'] for span in spans])
+            summary[name] = {
+                'count': len(spans),
+                'p50_ms': float(np.percentile(durations, 50)),
+                'p95_ms': float(np.percentile(durations, 95)),
+                'p99_ms': float(np.percentile(durations, 99)),
+                'tokens': sum(span.get('input_tokens', 0) + span.get('output_tokens', 0) for span in spans),
+                'cost_usd': sum(span.get('cost_usd', 0.0) for span in spans),
+                'errors': sum('error' in span for span in spans)
+            }
+        return summary
+
+    def export(self, path: Path):
+        """Write every recorded span to a JSON-lines file"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for span in self.spans():
+                f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer"""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Dict]:
+    """Time a stage as a span of the current trace
+
+    The yielded dict is the span record: set token counts, the model and
+    other attributes on it while the stage runs. A span that raises records
+    the error.
+
+    Example:
+        with span("embedding", model=model) as s:
+            ...
+            s['input_tokens'] = n
+    """
+    record = {'name': name, 'trace_id': _trace_id.get(), 'start': time.time(), **attributes}
+    if not TRACING_ENABLED:
+        yield record
+        return
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record['error'] = repr(e)
+        raise
+    finally:
+        record['duration_ms'] = (time.perf_counter() - start) * 1000
+        if 'model' in record and ('input_tokens' in record or 'output_tokens' in record):
+            record['cost_usd'] = estimate_cost(record['model'], record.get('input_tokens', 0),
+                                               record.get('output_tokens', 0))
+        get_tracer().record(record)
+
+@contextmanager
+def trace(name: str, **attributes) -> Iterator[Dict]:
+    """Start a new trace, with a root span, for one request or one build"""
+    token = _trace_id.set(uuid.uuid4().hex[:16])
+    try:
+        with span(name, root=True, **attributes) as record:
+            yield record
+    finally:
+        _trace_id.reset(token)
+
+def propagate(fn: Callable) -> Callable:
+    """Wrap fn so that, run in a worker thread, its spans join the caller's trace"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+def isolate(generator: Iterator) -> Iterator:
+    """Run a generator in a context of its own
+
+    A trace opened inside a generator would otherwise stay current in the
+    consumer's context between items, and claim the consumer's own spans.
+    """
+    context = contextvars.copy_context()
+    try:
+        while True:
+            try:
+                item = context.run(next, generator)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        context.run(generator.close)
+
+def format_summary(summary: Dict[str, Dict]) -> str:
+    lines = [f"{'span':<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'tokens':>10}{'cost $':>12}"]
+    for name, row in summary.items():
+        lines.append(f"{name:<28}{row['count']:>8}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+                     f"{row['p99_ms']:>10.1f}{row['tokens']:>10}{row['cost_usd']:>12.6f}")
+    return "\n".join(lines)
+
+def load_spans(path: Path) -> List[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize exported or logged spans")
+    parser.add_argument("spans", type=Path, help="JSON-lines file of spans")
+    args = parser.parse_args()
+
+    tracer = Tracer(max_spans=None, log_path=None)
+    for record in load_spans(args.spans):
+        tracer._spans.append(record)
+    print(format_summary(tracer.summary()))
@@ -0,0 +1,96 @@
+import re
+from typing import Dict, List, Tuple
+from src.common.embeddings import get_encoding
+from config import COMPLETION_MODEL, CONTEXT_TOKEN_BUDGET, CONTEXT_QUESTION_TOKENS
+
+CODE_BLOCK = re.compile(r"```.*?```", re.S)
+SEPARATOR = "-" * 80 + "\n"
+
+# Shortest piece of code worth trimming a solution down to
+_MIN_CODE_TOKENS = 64
+
+class ContextPacker:
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET, model: str = COMPLETION_MODEL,
+                 question_tokens: int = CONTEXT_QUESTION_TOKENS):
+        """Pack reference questions into a prompt context of bounded size
+
+        Every reference first gets its statement, concepts and summary, most
+        relevant first, while they fit. The remaining budget then goes to
+        solutions, again most relevant first: the full editorial if it fits,
+        otherwise only its code blocks, trimmed if need be.
+
+        Args:
+            budget (int): Maximum tokens of the packed context
+            model (str): Model whose tokenizer counts the tokens
+            question_tokens (int): Longer reference statements are cut to this
+        """
+        self.budget = budget
+        self.question_tokens = question_tokens
+        self.encoding = get_encoding(model)
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens]) + "\n..."
+
+    def _solution_options(self, solution: str) -> List[Tuple[str, str]]:
+        """(detail, text) forms of a solution, longest first"""
+        options = [('full', f"Solution:\n{solution}\n")]
+        code = "\n".join(CODE_BLOCK.findall(solution))
+        if code:
+            options.append(('code', f"Key code:\n{code}\n"))
+        return options
+
+    def pack(self, similar_questions: List[Dict]) -> Tuple[str, Dict]:
+        """Pack as much of the references as the budget allows
+
+        Args:
+            similar_questions (List[Dict]): Search results; ranked by their
+                'score' when present, otherwise taken in order
+
+        Returns:
+            Tuple[str, Dict]: The context, and a report with the budget, the
+                tokens used and the detail each reference got
+        """
+        ranked = sorted(similar_questions, key=lambda q: -q.get('score', 0.0))
+
+        # Statements, concepts and summaries first
+        entries, used = [], 0
+        for q in ranked:
+            base = (f"\nReference {len(entries) + 1}:\n"
+                    f"Question: {self._truncate(q['question'], self.question_tokens)}\n"
+                    f"Concepts: {', '.join(q['concepts'])}\n"
+                    f"Summary: {q.get('summary', '')}\n")
+            tokens = self.count(base + SEPARATOR)
+            if used + tokens > self.budget:
+                break
+            entries.append({'question': q, 'base': base, 'solution': "", 'detail': 'summary', 'tokens': tokens})
+            used += tokens
+
+        # Then solutions, in the same order
+        for entry in entries:
+            remaining = self.budget - used
+            for detail, text in self._solution_options(entry['question']['solution']):
+                tokens = self.count(text)
+                if tokens > remaining and detail == 'code' and remaining >= _MIN_CODE_TOKENS:
+                    text = self._truncate(text, remaining - 2)
+                    tokens = self.count(text)
+                if tokens <= remaining:
+                    entry.update(solution=text, detail=detail, tokens=entry['tokens'] + tokens)
+                    used += tokens
+                    break
+
+        context = "".join(entry['base'] + entry['solution'] + SEPARATOR for entry in entries)
+
+        report = {
+            'budget': self.budget,
+            'tokens': self.count(context),
+            'references': [{'id': entry['question'].get('id'), 'detail': entry['detail'], 'tokens': entry['tokens']}
+                           for entry in entries],
+            'dropped': len(ranked) - len(entries)
+        }
+        return context, report
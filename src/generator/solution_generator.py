@@ -1,15 +1,121 @@
+import time
 from openai import OpenAI
-from typing import List, Dict
-from config import COMPLETION_MODEL
+from typing import List, Dict, Iterator, Callable
+import numpy as np
+from src.generator.context_packer import ContextPacker
+from src.common.result_cache import SemanticResultCache
+from src.common.embeddings import get_encoding
+from src.common.tracing import span, trace, isolate
+from config import COMPLETION_MODEL, RESULT_CACHE_ENABLED
 from config import OPENAI_API_KEY
 
 class SolutionGenerator:
-    def __init__(self, api_key: str):
-        """Initialize the solution generator"""
+    def __init__(self, api_key: str, embed: Callable[[str], np.ndarray] = None):
+        """Initialize the solution generator
+
+        Args:
+            api_key (str): OpenAI API key
+            embed (Callable, optional): Embeds a question, such as
+                SimilaritySearcher.embed_question, so that near-duplicate
+                questions are answered from the result cache too; without it
+                only exact repeats are
+        """
         self.client = OpenAI(api_key=api_key)
+        self.context_packer = ContextPacker()
+        self.embed = embed
+        self.result_cache = SemanticResultCache() if RESULT_CACHE_ENABLED else None
+
+    def _cache_lookup(self, question: str, similar_questions: List[Dict]):
+        """Cached solution, the cache parameters and the question embedding"""
+        # The same question with other references gets a new solution
+        params = {'model': COMPLETION_MODEL, 'references': [q.get('id') for q in similar_questions]}
+        if self.result_cache is None:
+            return None, params, None
+        embed = (lambda: self.embed(question)) if self.embed is not None else None
+        solution, embedding = self.result_cache.lookup(question, params, embed=embed)
+        return solution, params, embedding
     
     def generate(self, question: str, similar_questions: List[Dict]) -> str:
         """Generate solution based on similar questions"""
+        with trace("generate", model=COMPLETION_MODEL) as record:
+            solution, params, embedding = self._cache_lookup(question, similar_questions)
+            if solution is not None:
+                record['cached'] = True
+                return solution
+
+            messages = self._build_messages(question, similar_questions)
+            with span("generate.completion", model=COMPLETION_MODEL) as completion:
+                response = self.client.chat.completions.create(
+                    model=COMPLETION_MODEL,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=2000
+                )
+                if response.usage is not None:
+                    completion['input_tokens'] = response.usage.prompt_tokens
+                    completion['output_tokens'] = response.usage.completion_tokens
+            solution = response.choices[0].message.content
+
+        if self.result_cache is not None:
+            self.result_cache.put(question, params, solution, embedding)
+        return solution
+
+    def generate_stream(self, question: str, similar_questions: List[Dict]) -> Iterator[str]:
+        """Generate solution based on similar questions, yielding text as it arrives
+
+        The generation is traced in a context of its own, so spans the
+        caller records between pieces stay out of its trace.
+
+        Yields:
+            str: Successive pieces of the solution; joined they equal what
+                generate returns
+        """
+        return isolate(self._generate_stream(question, similar_questions))
+
+    def _generate_stream(self, question: str, similar_questions: List[Dict]) -> Iterator[str]:
+        with trace("generate", model=COMPLETION_MODEL, stream=True) as record:
+            solution, params, embedding = self._cache_lookup(question, similar_questions)
+            if solution is not None:
+                record['cached'] = True
+                yield solution
+                return
+
+            messages = self._build_messages(question, similar_questions)
+            with span("generate.completion", model=COMPLETION_MODEL, stream=True) as completion:
+                stream = self.client.chat.completions.create(
+                    model=COMPLETION_MODEL,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=2000,
+                    stream=True,
+                    stream_options={'include_usage': True}
+                )
+                pieces, usage = [], None
+                for chunk in stream:
+                    if getattr(chunk, 'usage', None) is not None:
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not pieces:
+                            completion['ttft_ms'] = (time.time() - completion['start']) * 1000
+                        pieces.append(chunk.choices[0].delta.content)
+                        yield pieces[-1]
+
+                if usage is not None:
+                    completion['input_tokens'] = usage.prompt_tokens
+                    completion['output_tokens'] = usage.completion_tokens
+                else:
+                    # Counted locally when the endpoint does not report usage
+                    encoding = get_encoding(COMPLETION_MODEL)
+                    completion['input_tokens'] = sum(len(encoding.encode(m['content'], disallowed_special=()))
+                                                     for m in messages)
+                    completion['output_tokens'] = len(encoding.encode("".join(pieces), disallowed_special=()))
+
+        # Only complete solutions are cached
+        if self.result_cache is not None:
+            self.result_cache.put(question, params, "".join(pieces), embedding)
+
+    def _build_messages(self, question: str, similar_questions: List[Dict]) -> List[Dict]:
+        """Chat messages asking for a solution of question"""
         # Prepare context from similar questions
         context = self._prepare_context(similar_questions)
         
@@ -37,28 +143,19 @@ class SolutionGenerator:
         请按照以上格式生成解答，注意全程使用 markdown 格式，并在数学公式两侧加入 '$' 符号。
         """
         
-        response = self.client.chat.completions.create(
-            model=COMPLETION_MODEL,
-            messages=[
-                {"role": "system", "content": "你是一位信息学竞赛教练。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
-        
-        return response.choices[0].message.content
+        return [
+            {"role": "system", "content": "你是一位信息学竞赛教练。"},
+            {"role": "user", "content": prompt}
+        ]
     
     def _prepare_context(self, similar_questions: List[Dict]) -> str:
-        """Prepare context from similar questions"""
-        context = ""
-        for i, q in enumerate(similar_questions, 1):  # Use top 2 similar questions
-            context += f"\nReference {i}:\n"
-            context += f"Question: {q['question']}\n"
-            context += f"Solution:\n{q['solution']}\n"
-            context += f"Concepts: {', '.join(q['concepts'])}\n"
-            context += f"Summary: {q['summary']}\n"
-            context += "-" * 80 + "\n"
+        """Prepare context from similar questions, within the configured token budget"""
+        with span("context.pack", references=len(similar_questions)) as record:
+            context, report = self.context_packer.pack(similar_questions)
+            record['context_tokens'] = report['tokens']
+            record['budget'] = report['budget']
+            record['packed'] = {ref['id']: ref['detail'] for ref in report['references']}
+            record['dropped'] = report['dropped']
         return context
 
 def main():
@@ -1,88 +1,378 @@
 import faiss
 import numpy as np
 import json
-import pickle
+import time
+import shutil
+import hashlib
+import argparse
 from pathlib import Path
-from document_processor import DocumentProcessor
+from typing import Dict, Iterable, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.indexer.document_processor import DocumentProcessor
+from src.common.embeddings import layout_value
+from src.indexer.document_store import DocumentStore, DOCUMENTS_FILE
+from src.indexer.lexical_index import LexicalIndex
+from src.indexer.duplicate_index import DuplicateIndex
+from src.indexer.index_factory import (INDEX_TYPES, index_description, create_index, remove_ids, nearest_neighbours,
+                                       reconstruct_vectors, stored_distances, wrapped_ivf)
+from src.indexer.vector_store import current_build, new_build, read_manifest, write_manifest, publish
+from src.common.tracing import span, trace, propagate, get_tracer, format_summary
+from config import (INDEX_CONCURRENCY, INDEX_TYPE, QUESTIONS_DIR, VECTOR_STORE_PATH, SEARCH_FETCH_K,
+                    DUPLICATE_DETECTION, DUPLICATE_SPARE_NEIGHBOURS)
 from tqdm import tqdm
 
-def build_index():
+INDEX_NAMES = ('questions', 'concepts', 'summary')
 
+def process_documents(processor: DocumentProcessor, file_paths, concurrency: int = INDEX_CONCURRENCY):
+    """Run extract_file over file_paths with a bounded worker pool
 
-    processor = DocumentProcessor()
-    
-    # Process all question files
-    all_docs = []
-    question_embeddings = []
-    concept_embeddings = []
-    summary_embeddings = []
-    
-    # Walk through all directories in questions
-    ROOT_DIR = Path(__file__).parent.parent.parent
-    DATA_DIR = ROOT_DIR / "data"
-    QUESTIONS_DIR = DATA_DIR / "questions" / "Luogu" / "statement"
-
-    print(QUESTIONS_DIR)
-
-    cnt = 0
-    for file_path in tqdm(QUESTIONS_DIR.glob("*.md")):
-        print(f"Processing {file_path}")
-        try:
-            doc_info = processor.process_file(file_path)
-            all_docs.append({
-                'id': doc_info['id'],
-                'file_path': doc_info['file_path'],
-                'question': doc_info['question'],
-                'solution': doc_info['solution'],
-                'concepts': doc_info['concepts'],
-                'summary': doc_info['summary']
-            })
-            question_embeddings.append(doc_info['question_embedding'])
-            concept_embeddings.append(doc_info['conscepts_embedding'])
-            summary_embeddings.append(doc_info['summary_embedding'])
-
-            # cnt += 1
-            # if cnt > 2:
-            #     break
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-
-    # Create FAISS index
-    question_embedding_dim = len(question_embeddings[0])
-    question_index = faiss.IndexFlatL2(question_embedding_dim)
-    question_embeddings_np = np.array(question_embeddings).astype('float32')
-    question_index.add(question_embeddings_np)
-
-    concept_embedding_dim = len(concept_embeddings[0])
-    concept_index = faiss.IndexFlatL2(concept_embedding_dim)
-    concept_embeddings_np = np.array(concept_embeddings).astype('float32')
-    concept_index.add(concept_embeddings_np)
-
-    summary_embedding_dim = len(summary_embeddings[0])
-    summary_index = faiss.IndexFlatL2(summary_embedding_dim)
-    summary_embeddings_np = np.array(summary_embeddings).astype('float32')
-    summary_index.add(summary_embeddings_np)
-    
-    # Save index and metadata
-    VECTOR_STORE_PATH = DATA_DIR / "vector_store"
-    VECTOR_STORE_PATH.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(question_index, str(VECTOR_STORE_PATH / "questions.index"))
-    faiss.write_index(concept_index, str(VECTOR_STORE_PATH / "concepts.index"))
-    faiss.write_index(summary_index, str(VECTOR_STORE_PATH / "summary.index"))
-    
-    with open(VECTOR_STORE_PATH / "metadata.pkl", 'wb') as f:
-        pickle.dump(all_docs, f)
-    
-    # Create concept mapping
+    Args:
+        processor (DocumentProcessor): Processor shared by all workers
+        file_paths (List[Path]): Statement files to process
+        concurrency (int): Maximum number of documents in flight
+
+    Returns:
+        List[Dict]: Extracted documents in the order of file_paths;
+            files that failed are left out
+    """
+    results = [None] * len(file_paths)
+    failed = 0
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(propagate(_extract_file), processor, file_path): i
+                   for i, file_path in enumerate(file_paths)}
+        with tqdm(total=len(file_paths), unit="doc") as progress:
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    failed += 1
+                    tqdm.write(f"Error processing {file_paths[i]}: {e}")
+                progress.update(1)
+                progress.set_postfix(failed=failed)
+
+    elapsed = time.perf_counter() - start
+    done = len(file_paths) - failed
+    print(f"Processed {done}/{len(file_paths)} documents in {elapsed:.1f}s "
+          f"({done / elapsed if elapsed else 0:.2f} docs/s, {failed} failed)")
+
+    return [doc_info for doc_info in results if doc_info is not None]
+
+def _extract_file(processor: DocumentProcessor, file_path: Path) -> Dict:
+    with span("extract.document", file=file_path.name):
+        return processor.extract_file(file_path)
+
+def _file_hash(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _content_hashes(file_path: Path) -> Dict:
+    """Hashes of a statement file and of its solution file"""
+    solution_path = Path(str(file_path).replace('/statement/', '/solution/'))
+    return {
+        'statement_hash': _file_hash(file_path),
+        'solution_hash': _file_hash(solution_path) if solution_path.exists() else None
+    }
+
+def _build_concept_mapping(documents: DocumentStore) -> Dict[str, List[str]]:
     concept_to_questions = {}
-    for doc in all_docs:
-        for concept in doc['concepts']:
+    for _, qid, concepts in documents.iter_concepts():
+        for concept in concepts:
             if concept not in concept_to_questions:
                 concept_to_questions[concept] = []
-            concept_to_questions[concept].append(doc['id'])
-    
-    with open(VECTOR_STORE_PATH / "concept_mapping.json", 'w') as f:
-        json.dump(concept_to_questions, f, ensure_ascii=False)
+            concept_to_questions[concept].append(qid)
+    return concept_to_questions
+
+def _same_layout(stored: Dict, configured: Dict) -> bool:
+    # The stored layout also records the resulting dimension
+    return all(layout_value(stored, key) == value for key, value in configured.items())
+
+def _neighbours(indexes: Dict, duplicates: DuplicateIndex, previous: DuplicateIndex, removed: np.ndarray,
+                added: np.ndarray, k: int = SEARCH_FETCH_K + DUPLICATE_SPARE_NEIGHBOURS,
+                batch_size: int = 1024):
+    """Neighbour lists of the signed documents, in every index
+
+    Lists of the previous build are updated rather than searched again:
+    removed documents are dropped from them, and added documents merged
+    into them by their distance to the document. A list is only known down
+    to its last kept neighbour, so added documents farther than that are
+    left out of it, unless it held every document. It stays exact as long
+    as it keeps SEARCH_FETCH_K neighbours, which the spare ones it holds
+    past that allow for; only new documents and lists left shorter are
+    searched.
+
+    Args:
+        indexes (Dict): FAISS indexes by name, after the update
+        duplicates (DuplicateIndex): The signed documents
+        previous (DuplicateIndex): Duplicate index of the updated build,
+            None to search every document
+        removed (np.ndarray): FAISS ids removed by the update
+        added (np.ndarray): FAISS ids added by the update
+        k (int): Neighbours kept per document
+        batch_size (int): Documents merged at a time
+
+    Returns:
+        Tuple[Dict, int]: Per index name, the neighbour ids and distances
+            of each document, and the number of documents searched
+    """
+    faiss_ids = duplicates.faiss_ids
+    if previous is None or any(name not in previous.neighbours or previous.neighbours[name][0].shape[1] != k
+                               for name in INDEX_NAMES):
+        return {name: nearest_neighbours(indexes[name], faiss_ids, k) for name in INDEX_NAMES}, len(faiss_ids)
+
+    rows = previous.rows(faiss_ids)
+    carried = np.flatnonzero(rows >= 0)
+    neighbours, searched = {}, np.zeros(len(faiss_ids), dtype=bool)
+    for name in INDEX_NAMES:
+        index = indexes[name]
+        larger_is_closer = index.metric_type == faiss.METRIC_INNER_PRODUCT
+        farthest = -np.inf if larger_is_closer else np.inf
+        ids = np.full((len(faiss_ids), k), -1, dtype=np.int64)
+        distances = np.full((len(faiss_ids), k), farthest, dtype=np.float32)
+        previous_ids, previous_distances = (array[rows[carried]] for array in previous.neighbours[name])
+        ids[carried], distances[carried] = previous_ids, previous_distances
+
+        # A list as long as the previous index held every document, so it
+        # still does once merged; lists cut short by updates are shorter
+        previous_total = index.ntotal - len(added) + len(removed)
+        complete = np.zeros(len(faiss_ids), dtype=bool)
+        complete[carried] = np.count_nonzero(previous_ids >= 0, axis=1) >= previous_total
+        gone = (ids < 0) | np.isin(ids, removed)
+        ids[gone], distances[gone] = -1, farthest
+        known = np.where(gone, -farthest, distances)
+        depth = known.min(axis=1) if larger_is_closer else known.max(axis=1)
+        depth[complete] = farthest
+        added_vectors = reconstruct_vectors(index, added) if len(added) else None
+        for start in range(0, len(carried), batch_size):
+            batch = carried[start:start + batch_size]
+            batch_ids, batch_distances = ids[batch], distances[batch]
+            if added_vectors is not None:
+                batch_ids = np.hstack([batch_ids, np.broadcast_to(added, (len(batch), len(added)))])
+                batch_distances = np.hstack([batch_distances,
+                                             stored_distances(index, faiss_ids[batch], added_vectors)])
+            order = np.argsort(-batch_distances if larger_is_closer else batch_distances, axis=1,
+                               kind='stable')[:, :k]
+            batch_ids = np.take_along_axis(batch_ids, order, axis=1)
+            batch_distances = np.take_along_axis(batch_distances, order, axis=1)
+            unknown = (batch_distances < depth[batch, None] if larger_is_closer
+                       else batch_distances > depth[batch, None])
+            batch_ids[unknown], batch_distances[unknown] = -1, farthest
+            ids[batch], distances[batch] = batch_ids, batch_distances
+
+        stale = np.ones(len(faiss_ids), dtype=bool)
+        stale[carried] = ~complete[carried] & (np.count_nonzero(ids[carried] >= 0, axis=1) < SEARCH_FETCH_K)
+        if stale.any():
+            ids[stale], distances[stale] = nearest_neighbours(index, faiss_ids[stale], k)
+        neighbours[name] = (ids, distances)
+        searched |= stale
+    return neighbours, int(searched.sum())
+
+def _load_store(store_path: Path, build_dir: Path):
+    """Load the published store as the starting point of a new build
+
+    The documents are copied into build_dir, so the published build is
+    never modified while readers may have it open.
+
+    Returns:
+        Tuple[Dict, DocumentStore, Dict]: Indexes by name, the documents and
+            the manifest, or None if there is no store to update
+    """
+    published = current_build(store_path)
+    manifest = read_manifest(published)
+    if not manifest:
+        return None
+    indexes = {name: faiss.read_index(str(published / f"{name}.index")) for name in INDEX_NAMES}
+    DocumentStore.open(published).close()
+    shutil.copyfile(published / DOCUMENTS_FILE, build_dir / DOCUMENTS_FILE)
+    return indexes, DocumentStore(build_dir / DOCUMENTS_FILE), manifest
+
+def _save_store(store_path: Path, build_dir: Path, indexes: Dict, documents: DocumentStore, manifest: Dict):
+    with span("index.write"):
+        for name in INDEX_NAMES:
+            faiss.write_index(indexes[name], str(build_dir / f"{name}.index"))
+
+    with open(build_dir / "concept_mapping.json", 'w') as f:
+        json.dump(_build_concept_mapping(documents), f, ensure_ascii=False)
+    documents.close()
+
+    write_manifest(build_dir, manifest)
+    publish(store_path, build_dir)
+
+def build_index(concurrency: int = INDEX_CONCURRENCY, incremental: bool = False,
+                index_type: str = INDEX_TYPE, names: Iterable[str] = None):
+    """Build the vector store from the statement/solution files
+
+    Args:
+        concurrency (int): Maximum number of documents processed in parallel
+        incremental (bool): Only process files added or changed since the
+            last build, starting from a copy of the published store
+        index_type (str): FAISS index type, see index_factory.INDEX_TYPES
+        names (Iterable[str], optional): Restrict an incremental build to
+            these statement file names; other files keep what is indexed
+            for them. Ignored when a full build is needed
+    """
+    with trace("build_index", incremental=incremental, index_type=index_type) as record:
+        _build_index(concurrency, incremental, index_type, names)
+    # Only this build's spans; the tracer also holds earlier builds and searches of the process
+    tracer = get_tracer()
+    summary = tracer.summary(tracer.spans(record['trace_id']))
+    if summary:
+        print(format_summary(summary))
+
+def _build_index(concurrency: int, incremental: bool, index_type: str, names: Iterable[str]):
+    processor = DocumentProcessor()
+
+    statement_dir = QUESTIONS_DIR / "Luogu" / "statement"
+    print(statement_dir)
+
+    # Sort so the index ids do not depend on filesystem order
+    file_paths = sorted(statement_dir.glob("*.md"))
+    hashes = {file_path.name: _content_hashes(file_path) for file_path in file_paths}
+
+    # Everything is written to a fresh build directory, published at the end
+    build_dir = new_build(VECTOR_STORE_PATH)
+    store = loaded = _load_store(VECTOR_STORE_PATH, build_dir) if incremental else None
+    if incremental and store is None:
+        print("No manifest found in the vector store, doing a full build")
+    elif store is not None and store[2].get('concept_engine', 'llm') != processor.concept_engine:
+        print("The store was built with another concept engine, doing a full build")
+        store = None
+    elif store is not None and store[2].get('index_type', 'flat') != index_type:
+        print("The store was built with another index type, doing a full build")
+        store = None
+    elif store is not None and not _same_layout(store[2].get('layout', {}), processor.layout):
+        print("The store was built with another embedding layout, doing a full build")
+        store = None
+    elif store is not None and any(wrapped_ivf(index) for index in store[0].values()):
+        print("The store's IVF indexes were written inside ID maps, doing a full build")
+        store = None
+
+    if store is None:
+        if loaded is not None:
+            loaded[1].close()
+        indexes = None
+        (build_dir / DOCUMENTS_FILE).unlink(missing_ok=True)
+        documents = DocumentStore(build_dir / DOCUMENTS_FILE)
+        manifest = {'next_id': 0, 'concept_engine': processor.concept_engine,
+                    'index_type': index_type, 'layout': dict(processor.layout), 'documents': {}}
+    else:
+        indexes, documents, manifest = store
+
+    entries = manifest['documents']
+    removed = [name for name in entries if name not in hashes]
+    pending = [file_path for file_path in file_paths
+               if entries.get(file_path.name, {}).get('hashes') != hashes[file_path.name]]
+    if store is not None and names is not None:
+        names = set(names)
+        removed = [name for name in removed if name in names]
+        pending = [file_path for file_path in pending if file_path.name in names]
+    print(f"{len(pending)} added or changed, {len(removed)} removed, "
+          f"{len(file_paths) - len(pending)} unchanged")
+
+    if store is not None and not pending and not removed:
+        print("Vector store is up to date")
+        documents.close()
+        shutil.rmtree(build_dir)
+        return
+
+    docs = process_documents(processor, pending, concurrency)
+
+    # Stale vectors go away only for files that were reprocessed successfully,
+    # so a failed file keeps its previous entry and is retried on the next run
+    stale_names = removed + [Path(doc['file_path']).name for doc in docs if Path(doc['file_path']).name in entries]
+    stale_ids = np.array([entries[name]['faiss_id'] for name in stale_names], dtype=np.int64)
+    if indexes is not None and len(stale_ids):
+        for name in INDEX_NAMES:
+            indexes[name] = remove_ids(indexes[name], stale_ids, manifest.get('index_description', 'Flat'))
+    documents.delete(entries.pop(name)['faiss_id'] for name in stale_names)
+
+    if docs:
+        with span("index.embed", documents=len(docs)):
+            embeddings = dict(zip(INDEX_NAMES, processor.embed_documents(docs)))
+        ids = np.arange(manifest['next_id'], manifest['next_id'] + len(docs), dtype=np.int64)
+        manifest['next_id'] += len(docs)
+
+        if indexes is None:
+            # Trained on the first build's vectors; later additions reuse the training
+            dim = embeddings['questions'].shape[1]
+            manifest['layout']['dim'] = dim
+            manifest['index_description'] = index_description(index_type, dim, len(docs),
+                                                              storage=processor.layout['storage'])
+            with span("index.train_add", documents=len(docs)):
+                indexes = {name: create_index(embeddings[name], ids, manifest['index_description'])
+                           for name in INDEX_NAMES}
+        else:
+            with span("index.add", documents=len(docs)):
+                for name in INDEX_NAMES:
+                    indexes[name].add_with_ids(embeddings[name], ids)
+
+        documents.put_many(dict(zip(ids.tolist(), docs)))
+        for faiss_id, doc in zip(ids.tolist(), docs):
+            entries[Path(doc['file_path']).name] = {
+                'faiss_id': faiss_id,
+                'hashes': hashes[Path(doc['file_path']).name]
+            }
+
+    if indexes is None:
+        print("No documents to index")
+        documents.close()
+        shutil.rmtree(build_dir)
+        return
+
+    # An updated store updates the published build's lexical and duplicate
+    # indexes; the others are built from every stored document
+    published = current_build(VECTOR_STORE_PATH) if store is not None else None
+    added = list(zip(ids.tolist(), docs)) if docs else []
+
+    with span("index.lexical", documents=len(documents)):
+        lexical = LexicalIndex.load(published) if published is not None else None
+        if lexical is None:
+            lexical = LexicalIndex.build((faiss_id, question + "\n" + solution)
+                                         for faiss_id, question, solution in documents.iter_texts())
+        else:
+            lexical = lexical.updated(stale_ids, ((faiss_id, doc['question'] + "\n" + doc['solution'])
+                                                  for faiss_id, doc in added))
+        lexical.save(build_dir)
+
+    if DUPLICATE_DETECTION:
+        with span("index.duplicates", documents=len(documents)) as record:
+            previous = DuplicateIndex.load(published) if published is not None else None
+            if previous is None:
+                duplicates = DuplicateIndex.build((faiss_id, question)
+                                                  for faiss_id, question, _ in documents.iter_texts())
+            else:
+                duplicates = previous.updated(stale_ids, ((faiss_id, doc['question']) for faiss_id, doc in added))
+            duplicates.neighbours, record['searched'] = _neighbours(indexes, duplicates, previous, stale_ids,
+                                                                    np.array([faiss_id for faiss_id, _ in added],
+                                                                             dtype=np.int64))
+            print(f"Searched the neighbours of {record['searched']}/{len(duplicates)} documents")
+            duplicates.save(build_dir)
+
+    if processor.concept_classifier is not None:
+        processor.concept_classifier.save(build_dir)
+    _save_store(VECTOR_STORE_PATH, build_dir, indexes, documents, manifest)
+    print(f"Vector store holds {indexes['questions'].ntotal} documents, published {build_dir.name}")
 
 if __name__ == "__main__":
-    build_index()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the FAISS vector store")
+    parser.add_argument("--concurrency", type=int, default=INDEX_CONCURRENCY,
+                        help="maximum number of documents processed in parallel")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only process added or changed files, reusing the published store")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE,
+                        help="FAISS index type")
+    parser.add_argument("--files", nargs="+", metavar="NAME",
+                        help="with --incremental, only update these statement files")
+    parser.add_argument("--trace-out", type=Path, metavar="PATH",
+                        help="export the spans of the build to this JSON-lines file")
+    args = parser.parse_args()
+
+    try:
+        build_index(concurrency=args.concurrency, incremental=args.incremental, index_type=args.index_type,
+                    names=args.files)
+    finally:
+        if args.trace_out:
+            get_tracer().export(args.trace_out)
+            print(f"Spans exported to {args.trace_out}")
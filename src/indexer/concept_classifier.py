@@ -0,0 +1,112 @@
+import json
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+from src.common.embeddings import same_embeddings
+from config import CONCEPT_SIMILARITY_THRESHOLD, CONCEPT_TOP_K
+
+TOPICS_FILE = "syllabus_topics.json"
+EMBEDDINGS_FILE = "syllabus_embeddings.npy"
+
+def flatten_syllabus(syllabus: Dict) -> List[Dict]:
+    """Flatten the NOI syllabus tree into its leaf topics
+
+    Only the "竞赛大纲" part is used; the introduction holds no topics.
+
+    Returns:
+        List[Dict]: One {'name', 'path'} entry per leaf, where path lists the
+            levels from the contest level down to the leaf itself
+    """
+    outline = syllabus
+    for node in syllabus.values():
+        if isinstance(node, dict) and "竞赛大纲" in node:
+            outline = node["竞赛大纲"]
+
+    topics = []
+
+    def walk(node, path):
+        if isinstance(node, dict):
+            for key, child in node.items():
+                walk(child, path + [key])
+        elif isinstance(node, list):
+            for child in node:
+                walk(child, path)
+        else:
+            topics.append({'name': str(node), 'path': path + [str(node)]})
+
+    walk(outline, [])
+    return topics
+
+class ConceptClassifier:
+    def __init__(self, topics: List[Dict], embeddings: np.ndarray, layout: Dict,
+                 threshold: float = CONCEPT_SIMILARITY_THRESHOLD, top_k: int = CONCEPT_TOP_K):
+        """Assign syllabus topics to a text by embedding similarity
+
+        Args:
+            topics (List[Dict]): Leaf topics from flatten_syllabus
+            embeddings (np.ndarray): One embedding per topic
+            layout (Dict): Embedding layout the topic embeddings come from
+            threshold (float): Minimum cosine similarity of an assigned topic
+            top_k (int): Maximum number of topics assigned
+        """
+        self.topics = topics
+        self.layout = layout
+        self.threshold = threshold
+        self.top_k = top_k
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        self.embeddings = embeddings / np.maximum(norms, 1e-12)
+
+    @staticmethod
+    def topic_text(topic: Dict) -> str:
+        # Drop the contest level; the branch names carry the meaning
+        return ' '.join(topic['path'][1:])
+
+    @classmethod
+    def build(cls, processor, syllabus: Dict) -> "ConceptClassifier":
+        """Embed every leaf topic of the syllabus with the processor's model"""
+        topics = flatten_syllabus(syllabus)
+        embeddings = processor.get_embeddings([cls.topic_text(topic) for topic in topics])
+        return cls(topics, embeddings, processor.layout)
+
+    def save(self, store_path: Path):
+        store_path.mkdir(parents=True, exist_ok=True)
+        with open(store_path / TOPICS_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'layout': self.layout, 'topics': self.topics}, f, ensure_ascii=False)
+        np.save(store_path / EMBEDDINGS_FILE, self.embeddings.astype(np.float32))
+
+    @classmethod
+    def load(cls, store_path: Path, layout: Dict):
+        """Load saved topic embeddings, or None if missing or embedded differently"""
+        if not (store_path / TOPICS_FILE).exists() or not (store_path / EMBEDDINGS_FILE).exists():
+            return None
+        with open(store_path / TOPICS_FILE, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if not same_embeddings(saved.get('layout', {}), layout):
+            return None
+        return cls(saved['topics'], np.load(store_path / EMBEDDINGS_FILE), layout)
+
+    def classify_many(self, embeddings: np.ndarray) -> List[List[str]]:
+        """Assign up to top_k topics above the threshold to each embedding
+
+        Returns:
+            List[List[str]]: Topic names, most similar first, like the
+                concepts extracted by the LLM
+        """
+        embeddings = np.atleast_2d(embeddings)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        similarities = (embeddings / np.maximum(norms, 1e-12)) @ self.embeddings.T
+
+        results = []
+        for row in similarities:
+            concepts = []
+            for i in np.argsort(-row):
+                if row[i] < self.threshold or len(concepts) >= self.top_k:
+                    break
+                # The same topic name can appear under several levels
+                if self.topics[i]['name'] not in concepts:
+                    concepts.append(self.topics[i]['name'])
+            results.append(concepts)
+        return results
+
+    def classify(self, embedding: np.ndarray) -> List[str]:
+        return self.classify_many(embedding)[0]
@@ -1,21 +1,73 @@
 import os
 from typing import Dict, List, Tuple
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 import json
-from config import OPENAI_API_KEY, EMBEDDING_MODEL, DATA_DIR, COMPLETION_MODEL
+import numpy as np
+from src.common.embeddings import default_layout, get_provider
+from src.common.llm_cache import get_cache
+from src.common.tracing import span, propagate
+from src.indexer.concept_classifier import ConceptClassifier
+from src.indexer.vector_store import current_build
+from config import OPENAI_API_KEY, DATA_DIR, COMPLETION_MODEL, CONCEPT_ENGINE, VECTOR_STORE_PATH
 
 class DocumentProcessor:
-    def __init__(self):
+    def __init__(self, concept_engine: str = CONCEPT_ENGINE, layout: Dict = None, store_path: Path = None):
         """Initialize the document processor
         
         Args:
-            api_key (str): OpenAI API key
-            embedding_model (str): Name of the embedding model to use
+            concept_engine (str): "llm" to extract concepts with a chat
+                completion, "embedding" to classify them locally against
+                the embedded syllabus
+            layout (Dict, optional): Embedding layout to produce, defaults
+                to the one configured in config.py
+            store_path (Path, optional): Vector store build holding saved
+                syllabus embeddings, defaults to the published one
         """
         self.api_key = OPENAI_API_KEY
-        self.embedding_model = EMBEDDING_MODEL
+        self.layout = layout or default_layout()
+        self.embedding_model = self.layout['model']
         self.client = OpenAI(api_key=self.api_key)
+        self.cache = get_cache()
+        self.embedder = get_provider(self.layout, cache=self.cache, client=self.client)
+
+        with open(DATA_DIR / 'IOI_outline/NOI.json', 'r', encoding='utf-8') as file:
+            self.syllabus = json.load(file)
+
+        self.concept_engine = concept_engine
+        self.concept_classifier = None
+        if concept_engine == "embedding":
+            self.concept_classifier = ConceptClassifier.load(store_path or current_build(VECTOR_STORE_PATH), self.layout)
+            if self.concept_classifier is None:
+                self.concept_classifier = ConceptClassifier.build(self, self.syllabus)
+        elif concept_engine != "llm":
+            raise ValueError(f"Unknown concept engine: {concept_engine}")
+
+    def _chat(self, stage: str, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        """Run a chat completion, answering from the cache when possible"""
+        params = {'temperature': temperature, 'max_tokens': max_tokens}
+        prompt = json.dumps(messages, ensure_ascii=False)
+        with span(stage, model=COMPLETION_MODEL) as record:
+            if self.cache is not None:
+                content = self.cache.get_completion(COMPLETION_MODEL, params, prompt)
+                if content is not None:
+                    record['cached'] = True
+                    return content
+
+            response = self.client.chat.completions.create(
+                model=COMPLETION_MODEL,
+                messages=messages,
+                **params
+            )
+            content = response.choices[0].message.content
+            if response.usage is not None:
+                record['input_tokens'] = response.usage.prompt_tokens
+                record['output_tokens'] = response.usage.completion_tokens
+
+        if self.cache is not None:
+            self.cache.put_completion(COMPLETION_MODEL, params, prompt, content)
+        return content
 
     def _extract_summary(self, question: str, solution: str) -> str:
 
@@ -28,8 +80,8 @@ class DocumentProcessor:
 4. 输出格式：“主要算法和数据结构：xxx；关键技巧：xxx。”
         """
         
-        response = self.client.chat.completions.create(
-            model=COMPLETION_MODEL,
+        content = self._chat(
+            "extract.summary",
             messages=[
                 {"role": "system", "content": "你是一个信息学竞赛专家。"},
                 {"role": "user", "content": prompt}
@@ -38,8 +90,6 @@ class DocumentProcessor:
             max_tokens=1000
         )
 
-        content = response.choices[0].message.content
-
         return content
     
     def _extract_concepts(self, question: str, solution: str) -> List[str]:
@@ -52,17 +102,14 @@ class DocumentProcessor:
         Returns:
             List[str]: List of concepts
         """
-        with open(DATA_DIR / 'IOI_outline/NOI.json', 'r', encoding='utf-8') as file:
-            syllabus = json.load(file)
-
-        prompt = f"""知识点大纲：{syllabus}
+        prompt = f"""知识点大纲：{self.syllabus}
         题目描述：{question}
         题解：{solution}
         请阅读题目、题解、以及知识点大纲，分析该题目所考察的最重要的大纲知识点（最多5个），提取这些知识点，并用','分隔输出。不要输出其他内容。
         """
         
-        response = self.client.chat.completions.create(
-            model=COMPLETION_MODEL,
+        content = self._chat(
+            "extract.concepts",
             messages=[
                 {"role": "system", "content": "你是一个信息学竞赛专家。"},
                 {"role": "user", "content": prompt}
@@ -71,20 +118,18 @@ class DocumentProcessor:
             max_tokens=1000
         )
         
-        concepts = response.choices[0].message.content.strip().split(',')
-
-        print(concepts)
+        concepts = content.strip().split(',')
 
         return [concept.strip() for concept in concepts]
     
-    def process_file(self, file_path: Path) -> Dict:
-        """Process a single LeetCode question file
-        
+    def extract_file(self, file_path: Path) -> Dict:
+        """Read a question file and run the LLM extraction steps on it
+
         Args:
-            file_path (Path): Path to the Python file
-            
+            file_path (Path): Path to the statement file
+
         Returns:
-            Dict: Processed document information
+            Dict: Document information without embeddings
         """
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
@@ -99,22 +144,20 @@ class DocumentProcessor:
         solution_path = str(file_path).replace('/statement/', '/solution/')
         solution_path = Path(solution_path)
 
-        print(solution_path)
-
         with open(solution_path, 'r', encoding='utf-8') as f:
             solution = f.read()
         
-        # Get concepts
-        concepts = self._extract_concepts(question, solution)
-
-        # Get summary
-        summary = self._extract_summary(question, solution)
-        
-        # Get embeddings
-        question_embedding = self._get_embedding(question)
-        sorted_concepts = sorted(concepts)
-        concepts_embedding = self._get_embedding(' '.join(sorted_concepts))
-        summary_embedding = self._get_embedding(summary)
+        if self.concept_classifier is not None:
+            # Concepts are classified from the summary embedding in embed_documents
+            concepts = None
+            summary = self._extract_summary(question, solution)
+        else:
+            # Concepts and summary are independent, so request them together
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                concepts_future = executor.submit(propagate(self._extract_concepts), question, solution)
+                summary_future = executor.submit(propagate(self._extract_summary), question, solution)
+                concepts = concepts_future.result()
+                summary = summary_future.result()
         
         return {
             'id': question_number,
@@ -122,14 +165,70 @@ class DocumentProcessor:
             'question': question,
             'solution': solution,
             'concepts': concepts,
-            'summary': summary,
+            'summary': summary
+        }
+
+    def embed_documents(self, docs: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Embed the question, concepts and summary of extracted documents
+
+        The texts of all documents go through batched embedding calls, so
+        each request carries hundreds of documents. With the embedding
+        concept engine, the documents' concepts are filled in here.
+
+        Args:
+            docs (List[Dict]): Documents returned by extract_file
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: Question, concept and
+                summary embedding matrices, one row per document
+        """
+        embeddings = self.get_embeddings([doc['question'] for doc in docs] + [doc['summary'] for doc in docs])
+        question_embeddings, summary_embeddings = embeddings[:len(docs)], embeddings[len(docs):]
+
+        if self.concept_classifier is not None:
+            for doc, concepts in zip(docs, self.concept_classifier.classify_many(summary_embeddings)):
+                doc['concepts'] = concepts
+
+        concept_embeddings = self.get_embeddings([' '.join(sorted(doc['concepts'])) for doc in docs])
+        return question_embeddings, concept_embeddings, summary_embeddings
+
+    def process_file(self, file_path: Path) -> Dict:
+        """Process a single LeetCode question file
+        
+        Args:
+            file_path (Path): Path to the Python file
+            
+        Returns:
+            Dict: Processed document information
+        """
+        doc_info = self.extract_file(file_path)
+
+        # Get embeddings
+        question_embeddings, concepts_embeddings, summary_embeddings = self.embed_documents([doc_info])
+        question_embedding = question_embeddings[0]
+        concepts_embedding = concepts_embeddings[0]
+        summary_embedding = summary_embeddings[0]
+
+        doc_info.update({
             'question_embedding': question_embedding,
             'conscepts_embedding': concepts_embedding,
             'summary_embedding': summary_embedding
-        }
+        })
+        return doc_info
+
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Get embeddings for many texts from the layout's provider, batched
+
+        Args:
+            texts (List[str]): Texts to get embeddings for
+
+        Returns:
+            np.ndarray: float32 matrix with one embedding per row
+        """
+        return self.embedder.embed(texts)
     
     def _get_embedding(self, text: str) -> List[float]:
-        """Get OpenAI embedding for text
+        """Get the embedding of one text
         
         Args:
             text (str): Text to get embedding for
@@ -137,9 +236,4 @@ class DocumentProcessor:
         Returns:
             List[float]: Embedding vector
         """
-        response = self.client.embeddings.create(
-            input=text,
-            model=self.embedding_model
-        )
-        
-        return response.data[0].embedding
\ No newline at end of file
+        return self.get_embeddings([text])[0].tolist()
\ No newline at end of file
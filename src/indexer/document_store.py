@@ -0,0 +1,128 @@
+import json
+import pickle
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+DOCUMENTS_FILE = "documents.sqlite"
+LEGACY_METADATA_FILE = "metadata.pkl"
+
+FIELDS = ('id', 'file_path', 'question', 'solution', 'concepts', 'summary')
+
+class DocumentStore:
+    def __init__(self, path: Path):
+        """SQLite table of the indexed documents, keyed by FAISS id
+
+        Only the rows a caller asks for are read, so the full statements and
+        solutions stay on disk until a search returns them.
+
+        Args:
+            path (Path): Database file, created if missing
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                faiss_id INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                question TEXT NOT NULL,
+                solution TEXT NOT NULL,
+                concepts TEXT NOT NULL,
+                summary TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def open(cls, store_path: Path) -> "DocumentStore":
+        """Open the documents of a vector store
+
+        Stores built before the document store existed only have
+        metadata.pkl; it is converted once and the database used from then on.
+        """
+        path = store_path / DOCUMENTS_FILE
+        legacy_path = store_path / LEGACY_METADATA_FILE
+        if not path.exists() and legacy_path.exists():
+            with open(legacy_path, 'rb') as f:
+                metadata = pickle.load(f)
+            # Old stores keep a list in index order
+            if isinstance(metadata, list):
+                metadata = dict(enumerate(metadata))
+            tmp_path = path.with_name(path.name + ".tmp")
+            tmp_path.unlink(missing_ok=True)
+            store = cls(tmp_path)
+            store.put_many(metadata)
+            store.close()
+            tmp_path.replace(path)
+        return cls(path)
+
+    def put_many(self, docs: Dict[int, Dict]):
+        """Insert or replace documents and commit"""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (faiss_id, id, file_path, question, solution, concepts, summary) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(faiss_id, doc['id'], doc['file_path'], doc['question'], doc['solution'],
+                  json.dumps(doc['concepts'], ensure_ascii=False), doc['summary'])
+                 for faiss_id, doc in docs.items()]
+            )
+            self._conn.commit()
+
+    def delete(self, faiss_ids: Iterable[int]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE faiss_id = ?", [(int(i),) for i in faiss_ids])
+            self._conn.commit()
+
+    def get_many(self, faiss_ids: List[int]) -> Dict[int, Dict]:
+        """Fetch full documents by FAISS id; unknown ids are left out"""
+        faiss_ids = [int(i) for i in faiss_ids]
+        if not faiss_ids:
+            return {}
+        placeholders = ','.join('?' * len(faiss_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT faiss_id, {', '.join(FIELDS)} FROM documents WHERE faiss_id IN ({placeholders})",
+                faiss_ids
+            ).fetchall()
+        docs = {}
+        for faiss_id, *values in rows:
+            doc = dict(zip(FIELDS, values))
+            doc['concepts'] = json.loads(doc['concepts'])
+            docs[faiss_id] = doc
+        return docs
+
+    def faiss_ids(self) -> Dict[str, int]:
+        """FAISS id of every document, by question id"""
+        with self._lock:
+            return {qid: faiss_id for faiss_id, qid in self._conn.execute("SELECT faiss_id, id FROM documents")}
+
+    def iter_concepts(self) -> Iterator[Tuple[int, str, List[str]]]:
+        """(faiss_id, question id, concepts) of every document, in FAISS id order"""
+        with self._lock:
+            rows = self._conn.execute("SELECT faiss_id, id, concepts FROM documents ORDER BY faiss_id").fetchall()
+        for faiss_id, qid, concepts in rows:
+            yield faiss_id, qid, json.loads(concepts)
+
+    def iter_texts(self, page_size: int = 1000) -> Iterator[Tuple[int, str, str]]:
+        """(faiss_id, question, solution) of every document, in FAISS id order, read a page at a time"""
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT faiss_id, question, solution FROM documents WHERE faiss_id > ? ORDER BY faiss_id LIMIT ?",
+                    (last, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,176 @@
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+from src.indexer.lexical_index import normalize, units, term_hash
+from config import (DUPLICATE_SHINGLE, DUPLICATE_PERMUTATIONS, DUPLICATE_BANDS, DUPLICATE_THRESHOLD,
+                    DUPLICATE_MIN_SHINGLES)
+
+DUPLICATES_FILE = "duplicates.npz"
+
+def shingles(text: str, size: int = DUPLICATE_SHINGLE) -> np.ndarray:
+    """Distinct hashed shingles of a statement
+
+    Shingles are runs of size units of the normalized text, across
+    punctuation and line breaks, so reflowed or re-punctuated copies of a
+    statement share almost all of them.
+
+    Returns:
+        np.ndarray: Sorted uint64 shingle hashes
+    """
+    text_units = units(normalize(text))
+    if len(text_units) < size:
+        text_units = [" ".join(text_units)] if text_units else []
+        size = 1
+    return np.unique(np.fromiter((term_hash(" ".join(text_units[i:i + size]))
+                                  for i in range(len(text_units) - size + 1)), dtype=np.uint64))
+
+def _permutations(n: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Derived from term_hash rather than a random generator, so signatures
+    # do not change between numpy versions
+    multipliers = np.array([term_hash(f"minhash/{i}/a") | 1 for i in range(n)], dtype=np.uint64)
+    offsets = np.array([term_hash(f"minhash/{i}/b") for i in range(n)], dtype=np.uint64)
+    return multipliers, offsets
+
+class DuplicateIndex:
+    def __init__(self, signatures: np.ndarray, faiss_ids: np.ndarray, bands: int = DUPLICATE_BANDS,
+                 shingle: int = DUPLICATE_SHINGLE, neighbours: Dict[str, Tuple[np.ndarray, np.ndarray]] = None):
+        """MinHash LSH index of the stored statements, with their precomputed neighbours
+
+        Each statement's signature is cut into bands, and the statements
+        sharing a band with a query are its candidates; the fraction of
+        equal signature values estimates their Jaccard similarity. A match
+        is answered from the neighbours the build found for the stored
+        problem in each FAISS index.
+
+        Args:
+            signatures (np.ndarray): MinHash signature of each statement, one uint64 row each
+            faiss_ids (np.ndarray): FAISS id of each statement
+            bands (int): LSH bands the signatures are cut into
+            shingle (int): Units per shingle the statements were signed with
+            neighbours (Dict[str, Tuple[np.ndarray, np.ndarray]], optional):
+                Per index name, the ids and distances of each statement's
+                neighbours, one row per statement
+        """
+        self.signatures = signatures
+        self.faiss_ids = faiss_ids
+        self.bands = bands
+        self.shingle = shingle
+        self.neighbours = neighbours or {}
+        self._multipliers, self._offsets = _permutations(signatures.shape[1])
+        self._rows = {faiss_id: row for row, faiss_id in enumerate(faiss_ids.tolist())}
+
+        # Per band, the band keys of all statements sorted, for binary search
+        keys = self._band_keys(signatures)
+        self._order = np.argsort(keys, axis=0, kind='stable')
+        self._keys = np.take_along_axis(keys, self._order, axis=0)
+
+    def __len__(self) -> int:
+        return len(self.faiss_ids)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of a statement, None if it is too short to tell apart"""
+        hashes = shingles(text, self.shingle)
+        if len(hashes) < DUPLICATE_MIN_SHINGLES:
+            return None
+        # uint64 arithmetic wraps around, which is the hash family's modulus
+        values = hashes[:, None] * self._multipliers + self._offsets
+        return (values ^ (values >> np.uint64(29))).min(axis=0)
+
+    def _band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        rows = signatures.shape[1] // self.bands
+        bands = signatures[:, :rows * self.bands].reshape(len(signatures), self.bands, rows)
+        return (bands * self._multipliers[:rows]).sum(axis=2, dtype=np.uint64)
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[int, str]], permutations: int = DUPLICATE_PERMUTATIONS,
+              bands: int = DUPLICATE_BANDS, shingle: int = DUPLICATE_SHINGLE) -> "DuplicateIndex":
+        """Sign statements; statements too short to sign are left out
+
+        Args:
+            docs (Iterable[Tuple[int, str]]): FAISS id and statement of each document
+            permutations (int): Signature length
+            bands (int): LSH bands, dividing permutations
+            shingle (int): Units per shingle
+        """
+        empty = cls(np.empty((0, permutations), dtype=np.uint64), np.empty(0, dtype=np.int64), bands, shingle)
+        signatures, faiss_ids = [], []
+        for faiss_id, text in docs:
+            signature = empty.signature(text)
+            if signature is not None:
+                signatures.append(signature)
+                faiss_ids.append(faiss_id)
+        if not faiss_ids:
+            return empty
+        return cls(np.stack(signatures), np.array(faiss_ids, dtype=np.int64), bands, shingle)
+
+    def updated(self, removed: np.ndarray, docs: Iterable[Tuple[int, str]]) -> "DuplicateIndex":
+        """A copy without the statements of removed ids and with docs signed and added
+
+        Neighbours are not carried over; see rows for matching them up.
+        """
+        keep = ~np.isin(self.faiss_ids, removed)
+        added = DuplicateIndex.build(docs, self.signatures.shape[1], self.bands, self.shingle)
+        return DuplicateIndex(np.concatenate([self.signatures[keep], added.signatures]),
+                              np.concatenate([self.faiss_ids[keep], added.faiss_ids]), self.bands, self.shingle)
+
+    def rows(self, faiss_ids: np.ndarray) -> np.ndarray:
+        """Row of each FAISS id in this index, -1 for ids it does not hold"""
+        return np.array([self._rows.get(faiss_id, -1) for faiss_id in faiss_ids.tolist()], dtype=np.int64)
+
+    def save(self, store_path: Path):
+        arrays = {}
+        for name, (ids, distances) in self.neighbours.items():
+            arrays[f"neighbours.{name}.ids"] = ids
+            arrays[f"neighbours.{name}.distances"] = distances
+        np.savez(store_path / DUPLICATES_FILE, signatures=self.signatures, faiss_ids=self.faiss_ids,
+                 params=np.array([self.bands, self.shingle]), **arrays)
+
+    @classmethod
+    def load(cls, store_path: Path) -> Optional["DuplicateIndex"]:
+        """Load the duplicate index of a build, or None for builds made without one"""
+        path = store_path / DUPLICATES_FILE
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            bands, shingle = data['params'].tolist()
+            neighbours = {key.split('.')[1]: (data[key], data[key.replace('.ids', '.distances')])
+                          for key in data.files if key.startswith("neighbours.") and key.endswith(".ids")}
+            return cls(data['signatures'], data['faiss_ids'], bands, shingle, neighbours)
+
+    def match(self, text: str, threshold: float = DUPLICATE_THRESHOLD) -> Optional[Tuple[int, float]]:
+        """The stored statement a text is a near-duplicate of
+
+        Args:
+            text (str): Query statement
+            threshold (float): Minimum estimated Jaccard similarity
+
+        Returns:
+            Tuple[int, float]: FAISS id of the most similar stored statement
+                and the estimated similarity, or None if none reaches threshold
+        """
+        if not len(self):
+            return None
+        signature = self.signature(text)
+        if signature is None:
+            return None
+
+        keys = self._band_keys(signature[None, :])[0]
+        candidates = []
+        for band, key in enumerate(keys):
+            column = self._keys[:, band]
+            start, end = np.searchsorted(column, key, side='left'), np.searchsorted(column, key, side='right')
+            candidates.append(self._order[start:end, band])
+        candidates = np.unique(np.concatenate(candidates))
+        if not len(candidates):
+            return None
+
+        similarities = (self.signatures[candidates] == signature).mean(axis=1)
+        best = int(np.argmax(similarities))
+        if similarities[best] < threshold:
+            return None
+        return int(self.faiss_ids[candidates[best]]), float(similarities[best])
+
+    def neighbours_of(self, faiss_id: int) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        """Precomputed ids and distances of a stored problem's neighbours, per index name"""
+        row = self._rows[faiss_id]
+        return {name: (ids[row], distances[row]) for name, (ids, distances) in self.neighbours.items()}
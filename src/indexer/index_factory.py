@@ -0,0 +1,206 @@
+import faiss
+import numpy as np
+from typing import Tuple
+from config import (INDEX_TYPE, VECTOR_STORAGE, IVF_NLIST, IVF_NPROBE, PQ_M,
+                    HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# Factory codes of the vector encodings selectable with VECTOR_STORAGE
+STORAGE_CODES = {"float32": "Flat", "float16": "SQfp16", "int8": "SQ8"}
+
+# FAISS wants this many training points per IVF list and per PQ centroid
+_MIN_POINTS_PER_CENTROID = 39
+_PQ_CENTROIDS = 256
+
+def index_description(index_type: str, dim: int, n_vectors: int, storage: str = VECTOR_STORAGE) -> str:
+    """FAISS factory string for an index type sized for n_vectors
+
+    Corpora too small to train the requested index fall back to a flat one.
+
+    Args:
+        index_type (str): One of INDEX_TYPES
+        dim (int): Embedding dimension
+        n_vectors (int): Number of vectors available for training
+        storage (str): Vector encoding, one of STORAGE_CODES; IVF-PQ
+            indexes always store product-quantized codes
+
+    Returns:
+        str: Description accepted by faiss.index_factory
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+    if storage not in STORAGE_CODES:
+        raise ValueError(f"Unknown vector storage: {storage}")
+    code = STORAGE_CODES[storage]
+
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M}" if storage == "float32" else f"HNSW{HNSW_M},{code}"
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = min(IVF_NLIST, n_vectors // _MIN_POINTS_PER_CENTROID)
+        if index_type == "ivf_pq" and (dim % PQ_M or n_vectors < _PQ_CENTROIDS * _MIN_POINTS_PER_CENTROID):
+            nlist = 0
+        if nlist >= 2:
+            return f"IVF{nlist},{code}" if index_type == "ivf_flat" else f"IVF{nlist},PQ{PQ_M}"
+        print(f"Not enough vectors ({n_vectors}) to train {index_type}, using a flat index")
+
+    return code
+
+def _inner_index(index: faiss.Index) -> faiss.Index:
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = index.index
+    return faiss.downcast_index(index)
+
+def _new_index(dim: int, description: str) -> faiss.Index:
+    # IVF indexes store the ids they are given in their inverted lists. An
+    # IndexIDMap2 around one compacts its id map on removal while the IVF
+    # keeps its internal numbering, and then maps hits to the wrong ids
+    index = faiss.index_factory(dim, description)
+    if isinstance(faiss.downcast_index(index), faiss.IndexIVF):
+        return index
+    return faiss.IndexIDMap2(index)
+
+def wrapped_ivf(index: faiss.Index) -> bool:
+    """Whether an index is an IVF index inside an ID map
+
+    Stores written before IVF indexes held their own ids have these, and
+    their ids are wrong after a removal, so they must be rebuilt.
+    """
+    return isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) and isinstance(_inner_index(index),
+                                                                                     faiss.IndexIVF)
+
+def create_index(vectors: np.ndarray, ids: np.ndarray, description: str) -> faiss.Index:
+    """Create, train and fill an index holding the given ids
+
+    Args:
+        vectors (np.ndarray): float32 matrix, one vector per row
+        ids (np.ndarray): int64 id of each row
+        description (str): Factory string from index_description
+
+    Returns:
+        faiss.Index: The described index, which holds ids itself if it is
+            an IVF index and is wrapped in an IndexIDMap2 otherwise
+    """
+    index = _new_index(vectors.shape[1], description)
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(vectors)
+    index.add_with_ids(vectors, ids)
+    configure_search(index)
+    return index
+
+def configure_search(index: faiss.Index):
+    """Apply the configured search-time parameters to a loaded index"""
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = IVF_NPROBE
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = HNSW_EF_SEARCH
+
+def search_parameters(index: faiss.Index, exhaustive: bool = False) -> faiss.SearchParameters:
+    """Search parameters of the right type for the index
+
+    Args:
+        exhaustive (bool): Widen the approximate search as far as the index
+            allows, for filtered searches that came back short
+
+    Returns:
+        faiss.SearchParameters: Parameters to pass to index.search
+    """
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=inner.nlist if exhaustive else inner.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=max(inner.ntotal, 1) if exhaustive else inner.hnsw.efSearch)
+    return faiss.SearchParameters()
+
+def stored_ids(index: faiss.Index) -> np.ndarray:
+    """Ids of every vector an index holds, in no particular order"""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(index.id_map)
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        invlists = inner.invlists
+        lists = [faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+                 for i in range(inner.nlist) if invlists.list_size(i)]
+        return np.concatenate(lists) if lists else np.empty(0, dtype=np.int64)
+    return np.arange(index.ntotal, dtype=np.int64)
+
+def remove_ids(index: faiss.Index, ids: np.ndarray, description: str) -> faiss.Index:
+    """Remove ids from an index made by create_index
+
+    HNSW graphs cannot drop nodes, so such indexes are rebuilt from the
+    vectors they keep.
+
+    Returns:
+        faiss.Index: The updated index, which may be a new object
+    """
+    try:
+        index.remove_ids(ids)
+        return index
+    except RuntimeError:
+        all_ids = stored_ids(index)
+        kept = all_ids[~np.isin(all_ids, ids)]
+        if len(kept) == 0:
+            return _new_index(index.d, description)
+        return create_index(reconstruct_vectors(index, kept), kept, description)
+
+def reconstruct_vectors(index: faiss.Index, ids: np.ndarray) -> np.ndarray:
+    """Stored vectors of ids, decoded from the index's encoding
+
+    IVF indexes only find a vector by id through a direct map, which is
+    built for the call and dropped again so the index is written as it was;
+    a hash table, as their ids need not be contiguous.
+    """
+    inner = _inner_index(index)
+    ivf = isinstance(inner, faiss.IndexIVF)
+    if ivf:
+        inner.set_direct_map_type(faiss.DirectMap.Hashtable)
+    try:
+        return index.reconstruct_batch(np.ascontiguousarray(ids, dtype=np.int64))
+    finally:
+        if ivf:
+            inner.set_direct_map_type(faiss.DirectMap.NoMap)
+
+def nearest_neighbours(index: faiss.Index, ids: np.ndarray, k: int,
+                       batch_size: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """Search an index with the stored vector of each of ids
+
+    Args:
+        index (faiss.Index): Index holding ids
+        ids (np.ndarray): Ids whose neighbours are wanted
+        k (int): Neighbours per id, the id itself included
+        batch_size (int): Vectors decoded and searched at a time
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Neighbour ids and distances, one row
+            per id, padded with -1 ids when the index holds fewer than k
+    """
+    neighbour_ids = np.full((len(ids), k), -1, dtype=np.int64)
+    distances = np.zeros((len(ids), k), dtype=np.float32)
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        vectors = reconstruct_vectors(index, batch)
+        distances[start:start + len(batch)], neighbour_ids[start:start + len(batch)] = index.search(
+            vectors, k, params=search_parameters(index))
+    return neighbour_ids, distances
+
+def stored_distances(index: faiss.Index, ids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """Distances from the stored vector of each of ids to each of vectors
+
+    Distances are in the index's metric, as its searches report them:
+    squared L2, or inner products for which larger is closer. Compressed
+    encodings are compared through their decoded vectors, so the result is
+    approximate for them.
+
+    Returns:
+        np.ndarray: float32 matrix, one row per id and one column per vector
+    """
+    stored = reconstruct_vectors(index, ids)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return stored @ vectors.T
+    return faiss.pairwise_distances(stored, vectors)
@@ -0,0 +1,243 @@
+import hashlib
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from config import LEXICAL_NGRAMS, LEXICAL_K1, LEXICAL_B, LEXICAL_MAX_QUERY_TERMS
+
+LEXICAL_FILE = "lexical.npz"
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+# Units n-grams are made of: LaTeX commands, words and numbers with their
+# exponent, and single CJK characters
+_UNIT = re.compile(rf"\\[a-z]+|[a-z0-9_]+(?:\^[a-z0-9]+)?|[{_CJK}]")
+# N-grams do not span punctuation or line breaks
+_BREAK = re.compile(r"[，。；：！？、,.;:!?()（）【】《》“”「」\"'`\[\]|\n]+")
+_REPLACEMENTS = [
+    (re.compile(r"\^\{([a-z0-9]+)\}"), r"^\1"),  # 10^{5} -> 10^5
+    (re.compile(r"\\leq?\b|≤"), r" \\le "),
+    (re.compile(r"\\geq?\b|≥"), r" \\ge "),
+    (re.compile(r"[${}]"), " "),
+]
+
+def _is_cjk(unit: str) -> bool:
+    return '\u3400' <= unit[0] <= '\ufaff'
+
+def normalize(text: str) -> str:
+    """Fold width, case and LaTeX spellings, so equivalent statements read the same"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    for pattern, replacement in _REPLACEMENTS:
+        text = pattern.sub(replacement, text)
+    return text
+
+def units(text: str) -> List[str]:
+    """LaTeX commands, words with their exponent and CJK characters of a normalized text"""
+    return _UNIT.findall(text)
+
+def tokenize(text: str, ngrams: Tuple[int, ...] = LEXICAL_NGRAMS) -> List[str]:
+    """Terms of a text: n-grams of characters and LaTeX units
+
+    CJK text has no word boundaries, so it is indexed by overlapping
+    character n-grams; a title like 跳石头 yields 跳石, 石头 and 跳石头.
+    Words, numbers and LaTeX commands are units of their own, so a
+    constraint like $n \\le 10^5$ yields n, \\le, 10^5 and their n-grams.
+
+    Args:
+        text (str): Statement or solution text
+        ngrams (Tuple[int, ...]): N-gram lengths to emit
+
+    Returns:
+        List[str]: Terms, with repetitions
+    """
+    terms = []
+    for segment in _BREAK.split(normalize(text)):
+        segment_units = units(segment)
+        # Words are meaningful alone; CJK characters only when nothing surrounds them
+        cjk = [_is_cjk(unit) for unit in segment_units]
+        terms += [unit for unit, is_cjk in zip(segment_units, cjk) if not is_cjk or len(segment_units) == 1]
+        for n in ngrams:
+            terms += [" ".join(segment_units[i:i + n]) for i in range(len(segment_units) - n + 1)]
+    return terms
+
+@lru_cache(maxsize=1 << 20)
+def term_hash(term: str) -> int:
+    """Stable 64-bit id of a term; the vocabulary is stored as sorted ids"""
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def _term_counts(text: str, ngrams: Tuple[int, ...]) -> Tuple[np.ndarray, np.ndarray, int]:
+    counts = Counter(tokenize(text, ngrams))
+    hashes = np.fromiter((term_hash(term) for term in counts), dtype=np.uint64, count=len(counts))
+    tfs = np.fromiter(counts.values(), dtype=np.uint32, count=len(counts))
+    return hashes, tfs, sum(counts.values())
+
+class LexicalIndex:
+    def __init__(self, terms: np.ndarray, indptr: np.ndarray, rows: np.ndarray, tfs: np.ndarray,
+                 lengths: np.ndarray, faiss_ids: np.ndarray, ngrams: Tuple[int, ...] = LEXICAL_NGRAMS,
+                 k1: float = LEXICAL_K1, b: float = LEXICAL_B):
+        """BM25 inverted index over character n-grams
+
+        Postings are kept in CSR form: the postings of the term with sorted
+        id terms[t] are rows[indptr[t]:indptr[t + 1]], with the term's
+        frequency in each of those documents in tfs. Queries gather the
+        postings of all their terms at once and sum the BM25 contributions
+        per document with one bincount, without any per-posting Python.
+
+        Args:
+            terms (np.ndarray): Sorted term ids, see term_hash
+            indptr (np.ndarray): Start of each term's postings, len(terms) + 1 entries
+            rows (np.ndarray): Document row of each posting
+            tfs (np.ndarray): Term frequency of each posting
+            lengths (np.ndarray): Number of terms of each document row
+            faiss_ids (np.ndarray): FAISS id of each document row
+            ngrams (Tuple[int, ...]): N-gram lengths the documents were tokenized with
+            k1 (float): BM25 term frequency saturation
+            b (float): BM25 document length normalization
+        """
+        self.terms = terms
+        self.indptr = indptr
+        self.rows = rows
+        self.tfs = tfs
+        self.lengths = lengths
+        self.faiss_ids = faiss_ids
+        self.ngrams = tuple(int(n) for n in ngrams)
+        self.k1 = k1
+        self.b = b
+
+        n_docs = len(lengths)
+        df = np.diff(indptr).astype(np.float32)
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        average = lengths.mean() if n_docs else 1.0
+        # Per-document part of the BM25 denominator
+        self.norms = (k1 * (1 - b + b * lengths / max(average, 1e-9))).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[int, str]], ngrams: Tuple[int, ...] = LEXICAL_NGRAMS) -> "LexicalIndex":
+        """Index documents
+
+        Args:
+            docs (Iterable[Tuple[int, str]]): FAISS id and text of each document
+            ngrams (Tuple[int, ...]): N-gram lengths to index
+        """
+        return cls._from_postings(*cls._postings(docs, ngrams), ngrams)
+
+    def updated(self, removed: np.ndarray, docs: Iterable[Tuple[int, str]]) -> "LexicalIndex":
+        """A copy without the documents of removed ids and with docs added
+
+        Only the added documents are tokenized; the postings of the others
+        are carried over.
+
+        Args:
+            removed (np.ndarray): FAISS ids to drop
+            docs (Iterable[Tuple[int, str]]): FAISS id and text of each added document
+        """
+        keep = ~np.isin(self.faiss_ids, removed)
+        new_rows = np.cumsum(keep) - 1
+        hashes = np.repeat(self.terms, np.diff(self.indptr))
+        kept = keep[self.rows]
+        added = self._postings(docs, self.ngrams, first_row=int(keep.sum()))
+        return self._from_postings(
+            np.concatenate([hashes[kept], added[0]]),
+            np.concatenate([self.tfs[kept].astype(np.uint32), added[1]]),
+            np.concatenate([new_rows[self.rows[kept]].astype(np.uint32), added[2]]),
+            np.concatenate([self.lengths[keep], added[3]]),
+            np.concatenate([self.faiss_ids[keep], added[4]]),
+            self.ngrams, self.k1, self.b)
+
+    @staticmethod
+    def _postings(docs: Iterable[Tuple[int, str]], ngrams: Tuple[int, ...], first_row: int = 0) -> Tuple:
+        """Unsorted postings of documents: term ids, frequencies, rows, lengths and FAISS ids"""
+        hashes, tfs, rows, lengths, faiss_ids = [], [], [], [], []
+        for row, (faiss_id, text) in enumerate(docs, first_row):
+            doc_hashes, doc_tfs, length = _term_counts(text, ngrams)
+            hashes.append(doc_hashes)
+            tfs.append(doc_tfs)
+            rows.append(np.full(len(doc_hashes), row, dtype=np.uint32))
+            lengths.append(length)
+            faiss_ids.append(faiss_id)
+        return (np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64),
+                np.concatenate(tfs) if tfs else np.empty(0, dtype=np.uint32),
+                np.concatenate(rows) if rows else np.empty(0, dtype=np.uint32),
+                np.array(lengths, dtype=np.float32), np.array(faiss_ids, dtype=np.int64))
+
+    @classmethod
+    def _from_postings(cls, hashes: np.ndarray, tfs: np.ndarray, rows: np.ndarray, lengths: np.ndarray,
+                       faiss_ids: np.ndarray, ngrams: Tuple[int, ...], k1: float = LEXICAL_K1,
+                       b: float = LEXICAL_B) -> "LexicalIndex":
+        # Postings grouped by term, in document order within a term
+        order = np.lexsort((rows, hashes))
+        hashes, tfs, rows = hashes[order], tfs[order], rows[order]
+        terms, starts = np.unique(hashes, return_index=True)
+        indptr = np.append(starts, len(hashes)).astype(np.int64)
+        return cls(terms, indptr, rows, np.minimum(tfs, np.iinfo(np.uint16).max).astype(np.uint16),
+                   lengths, faiss_ids, ngrams, k1, b)
+
+    def save(self, store_path: Path):
+        np.savez(store_path / LEXICAL_FILE, terms=self.terms, indptr=self.indptr, rows=self.rows, tfs=self.tfs,
+                 lengths=self.lengths, faiss_ids=self.faiss_ids, ngrams=np.array(self.ngrams),
+                 bm25=np.array([self.k1, self.b]))
+
+    @classmethod
+    def load(cls, store_path: Path) -> Optional["LexicalIndex"]:
+        """Load the lexical index of a build, or None for builds made without one"""
+        path = store_path / LEXICAL_FILE
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            k1, b = data['bm25'].tolist()
+            return cls(data['terms'], data['indptr'], data['rows'], data['tfs'], data['lengths'],
+                       data['faiss_ids'], tuple(data['ngrams'].tolist()), k1, b)
+
+    def scores(self, text: str, max_terms: int = LEXICAL_MAX_QUERY_TERMS) -> np.ndarray:
+        """BM25 score of every document row for a query
+
+        Only the max_terms rarest query terms are scored: common n-grams
+        have long postings and next to no weight.
+        """
+        scores = np.zeros(len(self), dtype=np.float32)
+        if not len(self):
+            return scores
+        hashes = np.unique(np.fromiter((term_hash(term) for term in set(tokenize(text, self.ngrams))),
+                                       dtype=np.uint64))
+        positions = np.minimum(np.searchsorted(self.terms, hashes), len(self.terms) - 1)
+        found = positions[self.terms[positions] == hashes]
+        if len(found) > max_terms:
+            found = found[np.argsort(-self.idf[found], kind='stable')[:max_terms]]
+        if not len(found):
+            return scores
+
+        # Gather the postings of every query term into one flat array
+        starts, ends = self.indptr[found], self.indptr[found + 1]
+        sizes = ends - starts
+        offsets = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        rows = self.rows[offsets]
+        tfs = self.tfs[offsets].astype(np.float32)
+        weights = np.repeat(self.idf[found], sizes)
+        contributions = weights * tfs * (self.k1 + 1) / (tfs + self.norms[rows])
+        return np.bincount(rows, weights=contributions, minlength=len(self)).astype(np.float32)
+
+    def search(self, text: str, k: int, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Best matching documents by BM25
+
+        Args:
+            text (str): Query text
+            k (int): Number of results wanted
+            allowed (np.ndarray, optional): FAISS ids the results must come from
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: FAISS ids and BM25 scores, best
+                first; documents sharing no term with the query are left out
+        """
+        scores = self.scores(text)
+        if allowed is not None:
+            scores[~np.isin(self.faiss_ids, allowed)] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return self.faiss_ids[candidates], scores[candidates]
@@ -0,0 +1,170 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List
+import faiss
+from config import VECTOR_STORE_PATH, STORE_MMAP, STORE_VERIFY_CHECKSUMS
+
+MANIFEST_NAME = "manifest.json"
+CURRENT_FILE = "CURRENT"
+PUBLISHED_FILE = "PUBLISHED"  # Names of the builds ever published, one per line
+BUILDS_DIR = "builds"
+STORE_FORMAT = 2
+
+# Files a store kept directly in VECTOR_STORE_PATH before builds were versioned
+LEGACY_FILES = ("questions.index", "concepts.index", "summary.index", "metadata.pkl", "documents.sqlite",
+                "concept_mapping.json", "syllabus_topics.json", "syllabus_embeddings.npy", MANIFEST_NAME)
+
+def current_build(store_path: Path = VECTOR_STORE_PATH) -> Path:
+    """Directory of the published build of a vector store
+
+    Stores written before builds were versioned keep their files directly in
+    store_path, which is returned as is.
+    """
+    pointer = store_path / CURRENT_FILE
+    if pointer.exists():
+        return store_path / pointer.read_text(encoding='utf-8').strip()
+    return store_path
+
+def new_build(store_path: Path = VECTOR_STORE_PATH) -> Path:
+    """Create an empty, unpublished build directory"""
+    build_dir = store_path / BUILDS_DIR / f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+    build_dir.mkdir(parents=True)
+    return build_dir
+
+def read_manifest(build_dir: Path) -> Dict:
+    """Manifest of a build, or an empty dict for stores without one"""
+    if not (build_dir / MANIFEST_NAME).exists():
+        return {}
+    with open(build_dir / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_manifest(build_dir: Path, manifest: Dict):
+    """Record the size and checksum of every file of the build in its manifest
+
+    Written last, so a manifest only ever describes a complete build.
+    """
+    manifest['format'] = STORE_FORMAT
+    manifest['files'] = {
+        path.name: {'size': path.stat().st_size, 'sha256': _sha256(path)}
+        for path in sorted(build_dir.iterdir()) if path.is_file() and path.name != MANIFEST_NAME
+    }
+    with open(build_dir / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+def verify_build(build_dir: Path, checksums: bool = True) -> List[str]:
+    """Check the files of a build against its manifest
+
+    Args:
+        build_dir (Path): Build directory
+        checksums (bool): Also hash the files; sizes alone are checked
+            without reading them
+
+    Returns:
+        List[str]: One message per missing or mismatching file
+    """
+    problems = []
+    for name, expected in read_manifest(build_dir).get('files', {}).items():
+        path = build_dir / name
+        if not path.exists():
+            problems.append(f"{name} is missing")
+        elif path.stat().st_size != expected['size']:
+            problems.append(f"{name} has {path.stat().st_size} bytes, expected {expected['size']}")
+        elif checksums and _sha256(path) != expected['sha256']:
+            problems.append(f"{name} does not match its checksum")
+    return problems
+
+def open_build(store_path: Path = VECTOR_STORE_PATH, checksums: bool = STORE_VERIFY_CHECKSUMS) -> Path:
+    """Resolve and verify the published build of a vector store
+
+    Raises:
+        RuntimeError: If a file of the build does not match the manifest
+    """
+    build_dir = current_build(store_path)
+    problems = verify_build(build_dir, checksums=checksums)
+    if problems:
+        raise RuntimeError(f"Vector store {build_dir} is corrupt: {'; '.join(problems)}")
+    return build_dir
+
+def read_index(path: Path, mmap: bool = STORE_MMAP) -> faiss.Index:
+    """Read a FAISS index for searching
+
+    Memory-mapped indexes are paged in on demand and share the page cache
+    with every other process reading the same build. IO_FLAG_MMAP would
+    only map the inverted lists of IVF indexes; IO_FLAG_MMAP_IFC maps the
+    stored codes of every index type, flat and HNSW ones included.
+    """
+    if mmap:
+        return faiss.read_index(str(path), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(str(path))
+
+def _abandoned(build_dir: Path) -> bool:
+    """Whether the process that created an unpublished build has exited"""
+    try:
+        pid = int(build_dir.name.rsplit('-', 1)[1])
+    except (IndexError, ValueError):
+        return False
+    # Signal 0 only checks for the process on POSIX; elsewhere it would end it
+    if os.name != "posix" or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+def publish(store_path: Path, build_dir: Path):
+    """Make a build the current one and drop older builds
+
+    The CURRENT pointer is replaced atomically, so a reader sees either the
+    old build or the new one. The previous build stays on disk for processes
+    that still have it open, and is removed by the next publish. Builds
+    another run is still writing are never removed: only builds that were
+    published, or whose process has exited, are.
+    """
+    previous = current_build(store_path)
+    published_log = store_path / PUBLISHED_FILE
+    with open(published_log, 'a', encoding='utf-8') as f:
+        f.write(build_dir.name + "\n")
+    pointer = store_path / CURRENT_FILE
+    tmp_pointer = store_path / (CURRENT_FILE + ".tmp")
+    tmp_pointer.write_text(build_dir.relative_to(store_path).as_posix(), encoding='utf-8')
+    tmp_pointer.replace(pointer)
+
+    # The files of a pre-versioning store are superseded by the first build
+    for name in LEGACY_FILES:
+        (store_path / name).unlink(missing_ok=True)
+
+    # Also clears builds left behind by runs that failed before publishing
+    published = set(published_log.read_text(encoding='utf-8').split())
+    for path in (store_path / BUILDS_DIR).iterdir():
+        if path.is_dir() and path not in (build_dir, previous) and (path.name in published or _abandoned(path)):
+            shutil.rmtree(path, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the published vector store build")
+    parser.add_argument("--verify", action="store_true", help="check every file against its manifest checksum")
+    args = parser.parse_args()
+
+    build_dir = current_build()
+    manifest = read_manifest(build_dir)
+    print(f"Build: {build_dir}")
+    print(f"Format: {manifest.get('format', 1)}, {len(manifest.get('documents', {}))} documents")
+    for name, entry in manifest.get('files', {}).items():
+        print(f"  {name:<28}{entry['size'] / 1024 ** 2:>10.1f} MB")
+    if args.verify:
+        problems = verify_build(build_dir)
+        print("\n".join(problems) if problems else "All files match the manifest")
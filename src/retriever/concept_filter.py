@@ -0,0 +1,92 @@
+from typing import Dict, List, Optional, Tuple
+import faiss
+import numpy as np
+from src.indexer.index_factory import search_parameters
+from config import FILTER_EXACT_MAX_IDS
+
+class ConceptFilter:
+    def __init__(self, concept_mapping: Dict[str, List[str]], faiss_ids: Dict[str, int]):
+        """In-memory inverted index from concepts to FAISS ids
+
+        Args:
+            concept_mapping (Dict[str, List[str]]): Concept to question ids,
+                as stored in concept_mapping.json
+            faiss_ids (Dict[str, int]): FAISS id of each question id
+        """
+        size = max(faiss_ids.values()) + 1 if faiss_ids else 0
+
+        # One bitset over the FAISS id space per concept
+        self.bitsets = {}
+        for concept, question_ids in concept_mapping.items():
+            bitset = np.zeros(size, dtype=bool)
+            bitset[[faiss_ids[qid] for qid in question_ids if qid in faiss_ids]] = True
+            self.bitsets[concept] = bitset
+        self.size = size
+
+    def allowed_ids(self, concepts: List[str]) -> np.ndarray:
+        """FAISS ids of the documents having any of the concepts"""
+        allowed = np.zeros(self.size, dtype=bool)
+        for concept in concepts:
+            if concept in self.bitsets:
+                allowed |= self.bitsets[concept]
+        return np.flatnonzero(allowed).astype(np.int64)
+
+def filtered_search(index: faiss.Index, query: np.ndarray, k: int,
+                    allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Search an index for one query, restricted to allowed ids
+
+    Small allowed sets are scored exactly from their stored vectors. Larger
+    ones push the restriction into FAISS with an ID selector, widening an
+    approximate search to its limit if it comes back short. When the index
+    type supports neither, the search over-fetches and expands until enough
+    allowed hits are found or the whole index has been scanned.
+
+    Args:
+        index (faiss.Index): Index to search
+        query (np.ndarray): Query vector
+        k (int): Number of results wanted
+        allowed (np.ndarray, optional): Sorted ids the results must come from
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Ids and distances, best first
+    """
+    query = query.reshape(1, -1)
+    if allowed is None:
+        distances, indices = index.search(query, k, params=search_parameters(index))
+        return indices[0], distances[0]
+
+    wanted = min(k, len(allowed))
+    if wanted == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    if len(allowed) <= FILTER_EXACT_MAX_IDS:
+        try:
+            vectors = index.reconstruct_batch(allowed)
+        except RuntimeError:
+            vectors = None
+        if vectors is not None:
+            distances = ((vectors - query) ** 2).sum(axis=1)
+            order = np.argsort(distances)[:k]
+            return allowed[order], distances[order]
+
+    # Keep a reference to the selector; params only hold a raw pointer
+    selector = faiss.IDSelectorBatch(allowed)
+    for exhaustive in (False, True):
+        try:
+            params = search_parameters(index, exhaustive=exhaustive)
+            params.sel = selector
+            distances, indices = index.search(query, k, params=params)
+        except RuntimeError:
+            break
+        if (indices[0] >= 0).sum() >= wanted:
+            return indices[0], distances[0]
+
+    # Over-fetch, growing the candidate pool until enough of it is allowed
+    fetch = k * 4
+    while True:
+        fetch = min(fetch, index.ntotal)
+        distances, indices = index.search(query, fetch, params=search_parameters(index, exhaustive=True))
+        mask = np.isin(indices[0], allowed)
+        if mask.sum() >= wanted or fetch >= index.ntotal:
+            return indices[0][mask][:k], distances[0][mask][:k]
+        fetch *= 4
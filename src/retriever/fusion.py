@@ -0,0 +1,72 @@
+from typing import Dict, List, Tuple
+import numpy as np
+from config import FUSION_WEIGHTS, RRF_K
+
+FUSION_STRATEGIES = ("rrf", "weighted_distance", "question")
+
+def reciprocal_rank_fusion(results: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                           weights: Dict[str, float] = FUSION_WEIGHTS,
+                           k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Combine ranked lists by weighted reciprocal rank
+
+    Args:
+        results (Dict[str, Tuple[np.ndarray, np.ndarray]]): Per index name,
+            the ids and distances returned by FAISS, best first
+        weights (Dict[str, float]): Weight of each index
+        k (int): Rank offset; larger values flatten the rank contribution
+
+    Returns:
+        List[Tuple[int, float]]: (id, score) pairs, highest score first
+    """
+    scores = {}
+    for name, (ids, _) in results.items():
+        weight = weights.get(name, 1.0)
+        for rank, idx in enumerate(ids):
+            if idx < 0:
+                continue
+            scores[int(idx)] = scores.get(int(idx), 0.0) + weight / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+def weighted_distance_fusion(results: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                             weights: Dict[str, float] = FUSION_WEIGHTS) -> List[Tuple[int, float]]:
+    """Combine ranked lists by a weighted sum of distances
+
+    A candidate missing from one list is charged that list's largest
+    returned distance, since it is at least that far away.
+
+    Returns:
+        List[Tuple[int, float]]: (id, score) pairs, where the score is the
+            negated weighted distance, highest score first
+    """
+    candidates = {int(idx) for ids, _ in results.values() for idx in ids if idx >= 0}
+    scores = dict.fromkeys(candidates, 0.0)
+    for name, (ids, distances) in results.items():
+        valid = ids >= 0
+        if not valid.any():
+            continue
+        found = dict(zip(ids[valid].tolist(), distances[valid].tolist()))
+        worst = float(distances[valid].max())
+        weight = weights.get(name, 1.0)
+        for idx in candidates:
+            scores[idx] -= weight * found.get(idx, worst)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+def fuse(results: Dict[str, Tuple[np.ndarray, np.ndarray]], strategy: str,
+         weights: Dict[str, float] = FUSION_WEIGHTS) -> List[Tuple[int, float]]:
+    """Combine the per-index results with the named strategy
+
+    Args:
+        strategy (str): "rrf", "weighted_distance", or "question" to rank
+            by the question index alone
+
+    Returns:
+        List[Tuple[int, float]]: (id, score) pairs, highest score first
+    """
+    if strategy == "rrf":
+        return reciprocal_rank_fusion(results, weights)
+    if strategy == "weighted_distance":
+        return weighted_distance_fusion(results, weights)
+    if strategy == "question":
+        ids, distances = results['questions']
+        return [(int(idx), -float(distance)) for idx, distance in zip(ids, distances) if idx >= 0]
+    raise ValueError(f"Unknown fusion strategy: {strategy}")
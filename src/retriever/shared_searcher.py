@@ -0,0 +1,107 @@
+import threading
+from typing import Dict, List
+import numpy as np
+from src.retriever.similarity_search import SimilaritySearcher
+from src.indexer.vector_store import current_build
+from config import OPENAI_API_KEY, VECTOR_STORE_PATH, STORE_RELOAD_INTERVAL
+
+class SharedSearcher:
+    def __init__(self, api_key: str = OPENAI_API_KEY, reload_interval: float = STORE_RELOAD_INTERVAL):
+        """Thread-safe SimilaritySearcher shared by every session of a process
+
+        A background thread watches the vector store and swaps in a new
+        searcher when another build is published. Searches already running
+        finish on the searcher they started with, which is closed once the
+        last of them returns.
+
+        Args:
+            api_key (str): OpenAI API key
+            reload_interval (float): Seconds between checks for a new build,
+                0 to never reload
+        """
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self._searcher = SimilaritySearcher(api_key)
+        # Searches running on each searcher
+        self._leases: Dict[SimilaritySearcher, int] = {}
+
+        self._stop = threading.Event()
+        self._watcher = None
+        if reload_interval > 0:
+            self._watcher = threading.Thread(target=self._watch, args=(reload_interval,),
+                                             name="store-watcher", daemon=True)
+            self._watcher.start()
+
+    @property
+    def searcher(self) -> SimilaritySearcher:
+        return self._searcher
+
+    @property
+    def result_cache(self):
+        return self._searcher.result_cache
+
+    def _leased(self, method: str, *args, **kwargs):
+        """Call a method of the current searcher, which stays open until it returns"""
+        with self._lock:
+            searcher = self._searcher
+            self._leases[searcher] = self._leases.get(searcher, 0) + 1
+        try:
+            return getattr(searcher, method)(*args, **kwargs)
+        finally:
+            self._release(searcher)
+
+    def search(self, *args, **kwargs) -> List[Dict]:
+        """SimilaritySearcher.search on the current build"""
+        return self._leased('search', *args, **kwargs)
+
+    def search_many(self, *args, **kwargs) -> List[List[Dict]]:
+        """SimilaritySearcher.search_many on the current build"""
+        return self._leased('search_many', *args, **kwargs)
+
+    def embed_question(self, question: str) -> np.ndarray:
+        """SimilaritySearcher.embed_question on the current build"""
+        return self._leased('embed_question', question)
+
+    def _release(self, searcher: SimilaritySearcher):
+        with self._lock:
+            self._leases[searcher] -= 1
+            retired = searcher is not self._searcher and self._leases[searcher] == 0
+            if retired:
+                del self._leases[searcher]
+        if retired:
+            searcher.close()
+
+    def reload(self) -> bool:
+        """Swap in the published build if it changed
+
+        Returns:
+            bool: Whether a new searcher was swapped in
+        """
+        if current_build(VECTOR_STORE_PATH) == self._searcher.store_path:
+            return False
+
+        # Opened outside the lock so searches keep running meanwhile
+        searcher = SimilaritySearcher(self.api_key)
+        with self._lock:
+            previous, self._searcher = self._searcher, searcher
+            idle = previous not in self._leases or self._leases[previous] == 0
+            if idle:
+                self._leases.pop(previous, None)
+        if idle:
+            previous.close()
+        print(f"Reloaded the vector store from {searcher.store_path}")
+        return True
+
+    def _watch(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.reload()
+            except Exception as e:
+                # Keep serving the current build; the next check retries
+                print(f"Error reloading the vector store: {e}")
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            searcher = self._searcher
+        searcher.close()
@@ -1,88 +1,395 @@
-import faiss
 import numpy as np
-import pickle
 import json
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
 from src.indexer.document_processor import DocumentProcessor
-from config import OPENAI_API_KEY, VECTOR_STORE_PATH, EMBEDDING_MODEL
+from src.indexer.index_factory import configure_search, search_parameters
+from src.indexer.document_store import DocumentStore
+from src.indexer.vector_store import open_build, read_manifest, read_index
+from src.indexer.lexical_index import LexicalIndex
+from src.indexer.duplicate_index import DuplicateIndex
+from src.common.embeddings import default_layout
+from src.common.result_cache import SemanticResultCache
+from src.common.tracing import span, trace, propagate
+from src.retriever.fusion import fuse
+from src.retriever.concept_filter import ConceptFilter, filtered_search
+from config import (OPENAI_API_KEY, VECTOR_STORE_PATH, CONCEPT_ENGINE, SEARCH_WORKERS, SEARCH_FETCH_K,
+                    FUSION_STRATEGY, RESULT_CACHE_ENABLED, SEARCH_MODE, DUPLICATE_DETECTION)
+
+SEARCH_MODES = ("vector", "hybrid", "lexical")
 
 class SimilaritySearcher:
     def __init__(self, api_key = OPENAI_API_KEY):
 
-        self.document_processor = DocumentProcessor()
-        self.client = OpenAI(api_key=api_key)
+        # Indexes are memory-mapped, so opening the store does not read it
+        self.store_path = open_build(VECTOR_STORE_PATH)
+
+        # Extract concepts and embed queries the same way the store's documents were
+        manifest = read_manifest(self.store_path)
+        self.layout = manifest.get('layout', default_layout())
+
+        self.document_processor = DocumentProcessor(concept_engine=manifest.get('concept_engine', CONCEPT_ENGINE),
+                                                    layout=self.layout, store_path=self.store_path)
+        self.embedder = self.document_processor.embedder
+        self._executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
 
-        # print(str(VECTOR_STORE_PATH / "questions.index"))
-        
         # Load the FAISS index
-        self.question_index = faiss.read_index(str(VECTOR_STORE_PATH / "questions.index"))
-        self.concept_index = faiss.read_index(str(VECTOR_STORE_PATH / "concepts.index"))
-        self.summary_index = faiss.read_index(str(VECTOR_STORE_PATH / "summary.index"))
+        self.question_index = read_index(self.store_path / "questions.index")
+        self.concept_index = read_index(self.store_path / "concepts.index")
+        self.summary_index = read_index(self.store_path / "summary.index")
+        for index in (self.question_index, self.concept_index, self.summary_index):
+            configure_search(index)
         
-        # Load metadata
-        with open(VECTOR_STORE_PATH / "metadata.pkl", 'rb') as f:
-            self.metadata = pickle.load(f)
+        # Builds made before the lexical index existed have none; hybrid
+        # searches fall back to the vector indexes on them
+        self.lexical_index = LexicalIndex.load(self.store_path)
+
+        # Questions that are stored problems skip extraction and embedding
+        self.duplicate_index = DuplicateIndex.load(self.store_path) if DUPLICATE_DETECTION else None
+
+        # Documents stay on disk; only the ids needed for filtering are loaded
+        self.documents = DocumentStore.open(self.store_path)
             
-        with open(VECTOR_STORE_PATH / "concept_mapping.json", 'r') as f:
+        with open(self.store_path / "concept_mapping.json", 'r') as f:
             self.concept_mapping = json.load(f)
+        self.concept_filter = ConceptFilter(self.concept_mapping, self.documents.faiss_ids())
+
+        # Results are only valid for this build, so the cache lives with the searcher
+        self.result_cache = SemanticResultCache() if RESULT_CACHE_ENABLED else None
     
-    def _get_embedding(self, text: str) -> np.ndarray:
-        """Get embedding for the search text"""
-        response = self.client.embeddings.create(
-            input=text,
-            model=EMBEDDING_MODEL
-        )
-        return np.array(response.data[0].embedding, dtype=np.float32)
+    def close(self):
+        """Release the worker threads and the document database"""
+        self._executor.shutdown(wait=False)
+        self.documents.close()
+
+    def _get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Get embeddings for several search texts in one request"""
+        return self.embedder.embed(texts)
+
+    def embed_question(self, question: str) -> np.ndarray:
+        """Embedding of a question as the questions index stores them"""
+        return self._get_embeddings([question])[0]
     
-    def search(self, question: str, k: int = 5, solution = "", concepts: List[str] = None) -> List[Dict]:
+    def _search_index(self, index_name: str, embedding: np.ndarray, k: int,
+                      allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Search one FAISS index, returning its ids and distances"""
+        index = {
+            'questions': self.question_index,
+            'concepts': self.concept_index,
+            'summary': self.summary_index
+        }[index_name]
+        if embedding.shape[-1] != index.d:
+            raise ValueError(f"Query embedding has {embedding.shape[-1]} dimensions but the {index_name} index "
+                             f"has {index.d} (store layout: {self.layout})")
+        with span(f"faiss.search.{index_name}", k=k, filtered=allowed is not None):
+            return filtered_search(index, embedding, k, allowed)
+
+    def _search_index_many(self, index_name: str, embeddings: np.ndarray, k: int,
+                           allowed: np.ndarray = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Search one FAISS index for many queries with one query matrix"""
+        if allowed is not None:
+            # Restricted searches are planned per query, see filtered_search
+            return [self._search_index(index_name, embedding, k, allowed) for embedding in embeddings]
+        index = {
+            'questions': self.question_index,
+            'concepts': self.concept_index,
+            'summary': self.summary_index
+        }[index_name]
+        if embeddings.shape[-1] != index.d:
+            raise ValueError(f"Query embedding has {embeddings.shape[-1]} dimensions but the {index_name} index "
+                             f"has {index.d} (store layout: {self.layout})")
+        with span(f"faiss.search.{index_name}", k=k, queries=len(embeddings)):
+            distances, indices = index.search(np.ascontiguousarray(embeddings, dtype=np.float32), k,
+                                              params=search_parameters(index))
+        return list(zip(indices, distances))
+
+    def _search_lexical(self, question: str, k: int, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25 hits as ids and distances, so they fuse like an index's results"""
+        with span("lexical.search", k=k):
+            ids, scores = self.lexical_index.search(question, k, allowed)
+        # The best match is at distance 0, a document sharing no term at 1
+        distances = 1 - scores / scores[0] if len(scores) else scores
+        return ids, distances.astype(np.float32)
+
+    def _resolve_mode(self, mode: str) -> str:
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        if mode != "vector" and self.lexical_index is None:
+            if mode == "lexical":
+                raise ValueError(f"The store {self.store_path} has no lexical index; rebuild it for lexical search")
+            return "vector"
+        return mode
+
+    def _question_branch(self, question: str, k: int, allowed: np.ndarray = None,
+                         cache_params: Dict = None) -> Tuple[Dict, np.ndarray, Optional[List[Dict]]]:
+        """Embed and search the question, first looking for a near-duplicate in the result cache
+
+        Returns:
+            Tuple[Dict, np.ndarray, List[Dict]]: The index results, the
+                question embedding, and the cached results of a
+                near-duplicate question or None
+        """
+        question_embedding = self.embed_question(question)
+        if cache_params is not None:
+            cached = self.result_cache.lookup_similar(question_embedding, cache_params)
+            if cached is not None:
+                return {}, question_embedding, cached
+        results = {'questions': self._search_index('questions', question_embedding, k, allowed)}
+
+        classifier = self.document_processor.concept_classifier
+        if classifier is not None:
+            # Concepts come from the question embedding; no completion is needed
+            concepts = classifier.classify(question_embedding)
+            concepts_embedding = self._get_embeddings([' '.join(sorted(concepts))])[0]
+            results['concepts'] = self._search_index('concepts', concepts_embedding, k, allowed)
+        return results, question_embedding, None
+
+    def _concepts_branch(self, question: str, solution: str, k: int, allowed: np.ndarray = None) -> Dict:
+        concepts = self.document_processor._extract_concepts(question, solution)
+        concepts_embedding = self._get_embeddings([' '.join(sorted(concepts))])[0]
+        return {'concepts': self._search_index('concepts', concepts_embedding, k, allowed)}
+
+    def _summary_branch(self, question: str, solution: str, k: int, allowed: np.ndarray = None) -> Dict:
+        summary = self.document_processor._extract_summary(question, solution)
+        summary_embedding = self._get_embeddings([summary])[0]
+        return {'summary': self._search_index('summary', summary_embedding, k, allowed)}
+
+    def search(self, question: str, k: int = 5, solution = "", concepts: List[str] = None,
+               fusion: str = FUSION_STRATEGY, mode: str = SEARCH_MODE) -> List[Dict]:
         """Search for similar questions
         
+        The question, concepts and summary branches run concurrently, each
+        embedding its text and searching its index as soon as the text is
+        available; the three ranked lists are then fused, in hybrid mode
+        with the lexical BM25 ranking of the question. A question that is a
+        stored problem, pasted as is or lightly edited, is answered from the
+        neighbours found for that problem at build time instead, without any
+        API call; that ranking can differ from a search's, as the stored
+        concepts and summary were extracted with the problem's editorial and
+        any solution passed is not used. Results of repeated and near-duplicate questions are
+        answered from the result cache. Lexical mode ranks by BM25 alone and
+        makes no API call.
+
         Args:
             query (str): The query text
             k (int): Number of results to return
             concepts (List[str], optional): Filter by concepts
+            fusion (str): How to combine the index results, see fusion.fuse
+            mode (str): "vector", "hybrid" or "lexical"
             
         Returns:
-            List[Dict]: List of similar questions
+            List[Dict]: List of similar questions, each with its fused 'score',
+                or its BM25 score in lexical mode
         """
-        # Get concepts
-        extracted_concepts = self.document_processor._extract_concepts(question, solution)
+        mode = self._resolve_mode(mode)
+        with trace("search", k=k, fusion=fusion, mode=mode) as record:
+            return self._search(question, k, solution, concepts, fusion, mode, record)
 
-        # Get summary
-        summary = self.document_processor._extract_summary(question, solution)
-        
-        # Get embeddings
-        sorted_extracted_concepts = sorted(extracted_concepts)
-        concepts_embedding = self._get_embedding(' '.join(sorted_extracted_concepts))
-        concepts_embedding = concepts_embedding.reshape(1, -1)
+    def _search(self, question: str, k: int, solution: str, concepts: List[str], fusion: str, mode: str,
+                record: Dict) -> List[Dict]:
+        # Restrict every index search to documents having a wanted concept,
+        # instead of filtering the few neighbours FAISS returns
+        allowed = None
+        if concepts:
+            allowed = self.concept_filter.allowed_ids(concepts)
+            if len(allowed) == 0:
+                return []
 
-        summary_embedding = self._get_embedding(summary)
-        summary_embedding = summary_embedding.reshape(1, -1)
+        if mode == "lexical":
+            return self._lexical_only(question, k, allowed)
 
-        question_embedding = self._get_embedding(question)
-        question_embedding = question_embedding.reshape(1, -1)
-        
-        # Search in FAISS index
-        question_distances, question_indices = self.question_index.search(question_embedding, k)  # Get more results for filtering
-        concept_distances, concept_indices = self.concept_index.search(concepts_embedding, k)
-        summary_distances, summary_indices = self.summary_index.search(summary_embedding, k)
-        
-        # Get metadata for the results
-        question_results = []
-        for idx in question_indices[0]:
-            if idx < len(self.metadata):  # Ensure valid index
-                doc = self.metadata[idx]
-                # Filter by concepts if provided
-                if concepts and not any(c in doc.get('concepts', []) for c in concepts):
-                    continue
-                question_results.append(doc)
-                if len(question_results) >= k:  # Stop after getting k filtered results
-                    break
+        known = self._known_problem(question, k, fusion, mode, allowed)
+        if known is not None:
+            record['duplicate'] = True
+            return known
+
+        params = {'k': k, 'solution': solution, 'concepts': sorted(concepts or []), 'fusion': fusion, 'mode': mode}
+        if self.result_cache is not None:
+            # Near-duplicates are looked up once the question branch has the
+            # embedding, so a miss does not delay the other branches
+            cached = self.result_cache.lookup_exact(question, params)
+            if cached is not None:
+                record['cached'] = True
+                return cached
+
+        fetch_k = max(k, SEARCH_FETCH_K)
+        # Branch spans join this search's trace
+        branches = [self._executor.submit(propagate(self._question_branch), question, fetch_k, allowed,
+                                          params if self.result_cache is not None else None)]
+        if fusion != "question":
+            branches.append(self._executor.submit(propagate(self._summary_branch), question, solution, fetch_k,
+                                                  allowed))
+            if self.document_processor.concept_classifier is None:
+                branches.append(self._executor.submit(propagate(self._concepts_branch), question, solution,
+                                                      fetch_k, allowed))
+
+        results = {}
+        if mode == "hybrid":
+            # Milliseconds, while the branches wait on the API
+            results['lexical'] = self._search_lexical(question, fetch_k, allowed)
+        question_results, question_embedding, cached = branches[0].result()
+        if cached is not None:
+            # The completions already running finish unobserved
+            for branch in branches[1:]:
+                branch.cancel()
+            record['cached'] = True
+            return cached
+        results.update(question_results)
+        for branch in branches[1:]:
+            results.update(branch.result())
+
+        # Fetch the documents of the top hits only
+        question_results = self._fetch(fuse(results, fusion)[:k])
+
+        if self.result_cache is not None:
+            self.result_cache.put(question, params, question_results, question_embedding)
         
-        return question_results[:k]  # Ensure we return at most k results
+        return question_results
     
+    def _known_problem(self, question: str, k: int, fusion: str, mode: str,
+                       allowed: np.ndarray = None) -> List[Dict]:
+        """Results of a question that is a stored problem, from its precomputed neighbours
+
+        The neighbours are the build's: in the concepts and summary indexes
+        they are those of the stored vectors, extracted from the statement
+        together with its editorial, not from the question alone as a search
+        would. The ranking is the one the stored problem has in the corpus,
+        and may differ from what searching the question returns.
+
+        Returns:
+            List[Dict]: Results as search returns them, or None if the
+                question is not a stored problem or it has fewer precomputed
+                neighbours than a search would fuse
+        """
+        if self.duplicate_index is None:
+            return None
+        with span("duplicates.match") as record:
+            match = self.duplicate_index.match(question)
+            if match is not None:
+                record['faiss_id'], record['similarity'] = match
+        if match is None:
+            return None
+
+        fetch_k = max(k, SEARCH_FETCH_K)
+        results = self.duplicate_index.neighbours_of(match[0])
+        available = self.question_index.ntotal if allowed is None else len(allowed)
+        for name, (ids, distances) in results.items():
+            # The build keeps spare neighbours past what a search fetches
+            keep = ids >= 0 if allowed is None else np.isin(ids, allowed)
+            results[name] = (ids[keep][:fetch_k], distances[keep][:fetch_k])
+        # Short of what a search would fuse, as after a restrictive concept
+        # filter or for a larger k than the build kept: search normally
+        if not results or any(len(ids) < min(fetch_k, available) for ids, _ in results.values()):
+            return None
+        if mode == "hybrid":
+            results['lexical'] = self._search_lexical(question, fetch_k, allowed)
+        return self._fetch(fuse(results, fusion)[:k])
+
+    def _lexical_only(self, question: str, k: int, allowed: np.ndarray = None) -> List[Dict]:
+        """Results of the lexical mode, scored by BM25"""
+        with span("lexical.search", k=k):
+            ids, scores = self.lexical_index.search(question, k, allowed)
+        return self._fetch(list(zip(ids.tolist(), scores.tolist())))
+
+    def _fetch(self, ranked: List[Tuple[int, float]]) -> List[Dict]:
+        """Documents of ranked (id, score) pairs, with their score"""
+        with span("documents.fetch"):
+            docs = self.documents.get_many([idx for idx, _ in ranked])
+        return [dict(docs[idx], score=score) for idx, score in ranked if idx in docs]
+
+    def search_many(self, questions: List[str], k: int = 5, solutions: List[str] = None,
+                    concepts: List[str] = None, fusion: str = FUSION_STRATEGY,
+                    concurrency: int = SEARCH_WORKERS, mode: str = SEARCH_MODE) -> List[List[Dict]]:
+        """Search for similar questions of many questions at once
+
+        Each stage runs for all questions before the next: the questions are
+        embedded in batched requests, the summary and concept completions
+        run with bounded concurrency, and each index is searched with one
+        query matrix. Questions that are stored problems skip all of it, as
+        in search.
+
+        Args:
+            questions (List[str]): The query texts
+            k (int): Number of results per question
+            solutions (List[str], optional): Solution of each question
+            concepts (List[str], optional): Filter every question by concepts
+            fusion (str): How to combine the index results, see fusion.fuse
+            concurrency (int): Maximum completions in flight
+            mode (str): "vector", "hybrid" or "lexical", as in search
+
+        Returns:
+            List[List[Dict]]: Similar questions of each question, as search
+                returns them
+        """
+        mode = self._resolve_mode(mode)
+        with trace("search_many", k=k, fusion=fusion, mode=mode, questions=len(questions)):
+            return self._search_many(questions, k, solutions, concepts, fusion, concurrency, mode)
+
+    def _search_many(self, questions: List[str], k: int, solutions: List[str], concepts: List[str],
+                     fusion: str, concurrency: int, mode: str) -> List[List[Dict]]:
+        solutions = solutions or [""] * len(questions)
+        allowed = None
+        if concepts:
+            allowed = self.concept_filter.allowed_ids(concepts)
+            if len(allowed) == 0:
+                return [[] for _ in questions]
+
+        if mode == "lexical":
+            return [self._lexical_only(question, k, allowed) for question in questions]
+
+        # Stored problems are answered without embedding them
+        results = [self._known_problem(question, k, fusion, mode, allowed) for question in questions]
+        unknown = [i for i, result in enumerate(results) if result is None]
+        if not unknown:
+            return results
+        embedded = self._get_embeddings([questions[i] for i in unknown])
+        question_embeddings = np.zeros((len(questions), embedded.shape[1]), dtype=embedded.dtype)
+        question_embeddings[unknown] = embedded
+
+        params = {'k': k, 'concepts': sorted(concepts or []), 'fusion': fusion, 'mode': mode}
+        if self.result_cache is not None:
+            for i in unknown:
+                question = questions[i]
+                results[i], _ = self.result_cache.lookup(question, dict(params, solution=solutions[i]),
+                                                         embed=lambda i=i: question_embeddings[i])
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        fetch_k = max(k, SEARCH_FETCH_K)
+        embeddings = {'questions': question_embeddings[pending]}
+        processor = self.document_processor
+        classifier = processor.concept_classifier
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            if fusion != "question":
+                summaries = executor.map(propagate(processor._extract_summary),
+                                         [questions[i] for i in pending], [solutions[i] for i in pending])
+                if classifier is not None:
+                    extracted = classifier.classify_many(embeddings['questions'])
+                else:
+                    extracted = list(executor.map(propagate(processor._extract_concepts),
+                                                  [questions[i] for i in pending], [solutions[i] for i in pending]))
+                # One request for all summaries and concept lists
+                texts = list(summaries) + [' '.join(sorted(c)) for c in extracted]
+                summary_embeddings, concepts_embeddings = np.split(self._get_embeddings(texts), 2)
+                embeddings.update(summary=summary_embeddings, concepts=concepts_embeddings)
+
+        hits = {name: self._search_index_many(name, matrix, fetch_k, allowed) for name, matrix in embeddings.items()}
+        if mode == "hybrid":
+            hits['lexical'] = [self._search_lexical(questions[i], fetch_k, allowed) for i in pending]
+        ranked = {i: fuse({name: hits[name][row] for name in hits}, fusion)[:k] for row, i in enumerate(pending)}
+
+        # One database read for the documents of every question
+        with span("documents.fetch"):
+            docs = self.documents.get_many(sorted({idx for hits_i in ranked.values() for idx, _ in hits_i}))
+        for i in pending:
+            results[i] = [dict(docs[idx], score=score) for idx, score in ranked[i] if idx in docs]
+            if self.result_cache is not None:
+                self.result_cache.put(questions[i], dict(params, solution=solutions[i]), results[i],
+                                      question_embeddings[i])
+        return results
+
 if __name__ == "__main__":
     retriever = SimilaritySearcher()
 
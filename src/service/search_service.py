@@ -0,0 +1,241 @@
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from aiohttp import web
+from src.retriever.shared_searcher import SharedSearcher
+from src.retriever.similarity_search import SEARCH_MODES
+from src.retriever.fusion import FUSION_STRATEGIES
+from src.generator.solution_generator import SolutionGenerator
+from config import (OPENAI_API_KEY, FUSION_STRATEGY, SEARCH_MODE, SEARCH_WORKERS, SERVICE_HOST, SERVICE_PORT,
+                    SERVICE_BATCH_WINDOW_MS, SERVICE_MAX_BATCH, SERVICE_GENERATE_WORKERS)
+
+class MicroBatcher:
+    def __init__(self, searcher: SharedSearcher, executor: ThreadPoolExecutor,
+                 window_ms: float = SERVICE_BATCH_WINDOW_MS, max_batch: int = SERVICE_MAX_BATCH):
+        """Coalesce concurrent searches into search_many calls
+
+        The first request of a batch waits at most window_ms for others to
+        join it. Requests with the same k, concepts, fusion and mode are then
+        searched together, so their embeddings share requests and their
+        FAISS queries share one query matrix per index.
+
+        Args:
+            searcher (SharedSearcher): Searcher the batches run on
+            executor (ThreadPoolExecutor): Threads the blocking searches run in
+            window_ms (float): Longest wait for a batch to fill
+            max_batch (int): Largest batch
+        """
+        self.searcher = searcher
+        self.executor = executor
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.requests = 0
+        self._queue: asyncio.Queue = None
+        self._task = None
+        # The loop only keeps weak references to tasks
+        self._searches = set()
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop batching and cancel the searches in flight, failing their requests"""
+        tasks = [self._task, *self._searches]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def search(self, question: str, k: int, solution: str, concepts: List[str],
+                     fusion: str, mode: str) -> Tuple[List[Dict], Dict]:
+        """Search one question as part of the next batch
+
+        Returns:
+            Tuple[List[Dict], Dict]: The results, and the time spent queued
+                and searching, in milliseconds, with the batch size
+        """
+        future = asyncio.get_running_loop().create_future()
+        key = (k, tuple(sorted(concepts or [])), fusion, mode)
+        await self._queue.put((key, question, solution, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[0], []).append(item)
+            # Searched in the background, so the next window opens right away
+            for key, items in groups.items():
+                task = asyncio.create_task(self._search_group(key, items))
+                self._searches.add(task)
+                task.add_done_callback(self._searches.discard)
+
+    async def _search_group(self, key: Tuple, items: List[Tuple]):
+        k, concepts, fusion, mode = key
+        started = time.perf_counter()
+        self.batches += 1
+        self.requests += len(items)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                lambda: self.searcher.search_many([item[1] for item in items], k=k,
+                                                  solutions=[item[2] for item in items],
+                                                  concepts=list(concepts), fusion=fusion, mode=mode)
+            )
+        except asyncio.CancelledError:
+            for item in items:
+                item[3].cancel()
+            raise
+        except Exception as e:
+            for item in items:
+                if not item[3].done():
+                    item[3].set_exception(e)
+            return
+
+        search_ms = (time.perf_counter() - started) * 1000
+        for item, result in zip(items, results):
+            if not item[3].done():
+                item[3].set_result((result, {
+                    'queue_ms': (started - item[4]) * 1000,
+                    'search_ms': search_ms,
+                    'batch_size': len(items)
+                }))
+
+def _search_params(body: Dict) -> Dict:
+    """Validated search parameters of a request body
+
+    Everything is checked before the request is queued, since a bad value
+    would otherwise fail the whole batch it joins.
+    """
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Request body must be a JSON object")
+    if not isinstance(body.get('question'), str) or not body['question'].strip():
+        raise web.HTTPBadRequest(text="'question' must be a non-empty string")
+    k = body.get('k', 5)
+    if not isinstance(k, int) or isinstance(k, bool) or k <= 0:
+        raise web.HTTPBadRequest(text="'k' must be a positive integer")
+    if not isinstance(body.get('solution', ""), str):
+        raise web.HTTPBadRequest(text="'solution' must be a string")
+    concepts = body.get('concepts') or []
+    if not isinstance(concepts, list) or not all(isinstance(concept, str) for concept in concepts):
+        raise web.HTTPBadRequest(text="'concepts' must be a list of strings")
+    if body.get('fusion', FUSION_STRATEGY) not in FUSION_STRATEGIES:
+        raise web.HTTPBadRequest(text=f"'fusion' must be one of {', '.join(FUSION_STRATEGIES)}")
+    if body.get('mode', SEARCH_MODE) not in SEARCH_MODES:
+        raise web.HTTPBadRequest(text=f"'mode' must be one of {', '.join(SEARCH_MODES)}")
+    return {
+        'question': body['question'],
+        'k': k,
+        'solution': body.get('solution', ""),
+        'concepts': concepts,
+        'fusion': body.get('fusion', FUSION_STRATEGY),
+        'mode': body.get('mode', SEARCH_MODE)
+    }
+
+async def _read_json(request: web.Request) -> Dict:
+    try:
+        return await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Request body must be JSON")
+
+async def handle_search(request: web.Request) -> web.Response:
+    """POST /search {question, k?, solution?, concepts?, fusion?, mode?}"""
+    start = time.perf_counter()
+    params = _search_params(await _read_json(request))
+    results, timing = await request.app['batcher'].search(**params)
+    timing['total_ms'] = (time.perf_counter() - start) * 1000
+    print(f"POST /search {timing['total_ms']:.1f}ms (queued {timing['queue_ms']:.1f}ms, "
+          f"batch of {timing['batch_size']})")
+    return web.json_response({'results': results, 'timing': timing},
+                             headers={'Server-Timing': f"total;dur={timing['total_ms']:.1f}"})
+
+async def handle_generate(request: web.Request) -> web.Response:
+    """POST /generate {question, k?, solution?, concepts?, fusion?, mode?}"""
+    start = time.perf_counter()
+    params = _search_params(await _read_json(request))
+    results, timing = await request.app['batcher'].search(**params)
+
+    generate_start = time.perf_counter()
+    solution = await asyncio.get_running_loop().run_in_executor(
+        request.app['generate_executor'], request.app['generator'].generate, params['question'], results
+    )
+    timing['generate_ms'] = (time.perf_counter() - generate_start) * 1000
+    timing['total_ms'] = (time.perf_counter() - start) * 1000
+    print(f"POST /generate {timing['total_ms']:.1f}ms (queued {timing['queue_ms']:.1f}ms, "
+          f"batch of {timing['batch_size']}, generation {timing['generate_ms']:.1f}ms)")
+    return web.json_response({'solution': solution, 'results': results, 'timing': timing},
+                             headers={'Server-Timing': f"total;dur={timing['total_ms']:.1f}"})
+
+async def handle_health(request: web.Request) -> web.Response:
+    """GET /health: the served build and batching counters"""
+    searcher, batcher = request.app['searcher'], request.app['batcher']
+    cache = searcher.result_cache
+    return web.json_response({
+        'store': str(searcher.searcher.store_path),
+        'batches': batcher.batches,
+        'requests': batcher.requests,
+        'result_cache': cache.stats() if cache is not None else None
+    })
+
+def create_app(searcher: SharedSearcher = None, generator: SolutionGenerator = None,
+               window_ms: float = SERVICE_BATCH_WINDOW_MS, max_batch: int = SERVICE_MAX_BATCH) -> web.Application:
+    """Build the service application
+
+    Args:
+        searcher (SharedSearcher, optional): Searcher to serve, opened on
+            the published vector store by default
+        generator (SolutionGenerator, optional): Generator behind /generate
+        window_ms (float): Micro-batching window
+        max_batch (int): Largest micro-batch
+    """
+    app = web.Application()
+    app['searcher'] = searcher or SharedSearcher(OPENAI_API_KEY)
+    app['generator'] = generator or SolutionGenerator(OPENAI_API_KEY, embed=app['searcher'].embed_question)
+    app['executor'] = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+    # Generations take seconds; on their own threads they cannot hold up searches
+    app['generate_executor'] = ThreadPoolExecutor(max_workers=SERVICE_GENERATE_WORKERS)
+    app['batcher'] = MicroBatcher(app['searcher'], app['executor'], window_ms=window_ms, max_batch=max_batch)
+
+    async def on_startup(app):
+        app['batcher'].start()
+
+    async def on_cleanup(app):
+        await app['batcher'].stop()
+        app['executor'].shutdown(wait=False)
+        app['generate_executor'].shutdown(wait=False)
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post('/search', handle_search)
+    app.router.add_post('/generate', handle_generate)
+    app.router.add_get('/health', handle_health)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve similar-question search over HTTP. Set OPENAI_BASE_URL to run against "
+                    "another OpenAI-compatible endpoint, such as a local fake server")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--batch-window-ms", type=float, default=SERVICE_BATCH_WINDOW_MS,
+                        help="longest wait for concurrent requests to join a batch")
+    parser.add_argument("--max-batch", type=int, default=SERVICE_MAX_BATCH)
+    args = parser.parse_args()
+
+    web.run_app(create_app(window_ms=args.batch_window_ms, max_batch=args.max_batch),
+                host=args.host, port=args.port)
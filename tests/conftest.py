@@ -0,0 +1,73 @@
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from benchmarks.corpus import generate_corpus
+from benchmarks.fake_openai import FakeOpenAI
+from config import ROOT_DIR
+
+EMBEDDING_DIM = 32
+
+@pytest.fixture(scope="session")
+def fake_api():
+    """The benchmarks' fake OpenAI API, without simulated latency"""
+    server = FakeOpenAI(dim=EMBEDDING_DIM, embedding_latency_ms=0, chat_latency_ms=0, stream_chunk_ms=0).start()
+    yield server
+    server.stop()
+
+@pytest.fixture(scope="session")
+def problems(tmp_path_factory):
+    """Statement and solution files of a synthetic corpus, to copy from"""
+    root = tmp_path_factory.mktemp("problems")
+    generate_corpus(root, 160)
+    return root / "Luogu"
+
+class Workspace:
+    def __init__(self, root: Path, problems: Path, api_url: str):
+        """Questions directory, vector store and cache of a test, built through the CLI
+
+        Config paths are read from the environment at import, so builds run
+        in a fresh interpreter, as the benchmarks run them.
+        """
+        self.root = root
+        self.problems = problems
+        self.questions = root / "questions" / "Luogu"
+        (self.questions / "statement").mkdir(parents=True)
+        (self.questions / "solution").mkdir(parents=True)
+        self.store_path = root / "vector_store"
+        self.env = dict(os.environ,
+                        OPENAI_API_KEY="test",
+                        OPENAI_BASE_URL=api_url,
+                        OI_QUESTIONS_DIR=str(root / "questions"),
+                        OI_VECTOR_STORE_PATH=str(self.store_path),
+                        OI_CACHE_PATH=str(root / "cache" / "llm_cache.sqlite"))
+
+    def add(self, numbers):
+        for i in numbers:
+            for kind in ("statement", "solution"):
+                shutil.copyfile(self.problems / kind / f"S{i:06d}.md", self.questions / kind / f"S{i:06d}.md")
+
+    def remove(self, numbers):
+        for i in numbers:
+            (self.questions / "statement" / f"S{i:06d}.md").unlink()
+
+    def edit(self, numbers):
+        for i in numbers:
+            with open(self.questions / "statement" / f"S{i:06d}.md", 'a', encoding='utf-8') as f:
+                f.write("\n额外的一句话说明了新的限制条件。\n")
+
+    def build(self, *args) -> str:
+        result = subprocess.run([sys.executable, "-m", "src.indexer.build_index", *args], cwd=ROOT_DIR,
+                                env=self.env, capture_output=True, text=True)
+        assert result.returncode == 0, result.stdout + result.stderr
+        return result.stdout
+
+@pytest.fixture
+def make_workspace(tmp_path_factory, problems, fake_api):
+    return lambda: Workspace(tmp_path_factory.mktemp("workspace"), problems, fake_api.url)
+
+@pytest.fixture
+def workspace(make_workspace):
+    return make_workspace()
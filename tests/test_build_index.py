@@ -0,0 +1,116 @@
+import json
+import faiss
+import numpy as np
+import pytest
+from benchmarks.fake_openai import fake_embedding
+from src.indexer.build_index import INDEX_NAMES
+from src.indexer.document_store import DocumentStore, DOCUMENTS_FILE
+from src.indexer.duplicate_index import DuplicateIndex
+from src.indexer.index_factory import search_parameters, stored_ids
+from src.indexer.lexical_index import LexicalIndex
+from src.indexer.vector_store import current_build, read_manifest
+from config import SEARCH_FETCH_K
+
+class Build:
+    def __init__(self, store_path):
+        """The published build of a store, with its ids translated to file names"""
+        self.path = current_build(store_path)
+        self.manifest = read_manifest(self.path)
+        self.ids = {name: entry['faiss_id'] for name, entry in self.manifest['documents'].items()}
+        self.names = {faiss_id: name for name, faiss_id in self.ids.items()}
+        self.indexes = {name: faiss.read_index(str(self.path / f"{name}.index")) for name in INDEX_NAMES}
+        documents = DocumentStore(self.path / DOCUMENTS_FILE)
+        self.documents = {self.names[faiss_id]: doc
+                          for faiss_id, doc in documents.get_many(list(self.names)).items()}
+        documents.close()
+
+    def search(self, index_name, vectors, k):
+        index = self.indexes[index_name]
+        distances, ids = index.search(vectors, k, params=search_parameters(index, exhaustive=True))
+        return [[self.names.get(faiss_id) for faiss_id in row] for row in ids], distances
+
+def _question_vectors(build, names, dim):
+    return np.stack([fake_embedding(build.documents[name]['question'], dim) for name in names])
+
+def _update(workspace):
+    workspace.edit([3, 50])
+    workspace.remove([7, 8, 9])
+    workspace.add(range(120, 130))
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+def test_ids_stay_correct_after_incremental_updates(workspace, fake_api, index_type):
+    workspace.add(range(120))
+    workspace.build("--index-type", index_type)
+    _update(workspace)
+    workspace.build("--index-type", index_type, "--incremental")
+    workspace.remove([20, 21])
+    workspace.build("--index-type", index_type, "--incremental")
+
+    build = Build(workspace.store_path)
+    names = sorted(build.ids)
+    assert len(names) == 125 and "S000007.md" not in names and "S000129.md" in names
+    assert build.manifest['index_description'].startswith("IVF" if index_type == "ivf_flat" else "Flat")
+    for index in build.indexes.values():
+        assert sorted(stored_ids(index).tolist()) == sorted(build.names)
+
+    # Each statement's own embedding finds it, under its own id
+    found, _ = build.search('questions', _question_vectors(build, names, fake_api.dim), 1)
+    assert [row[0] for row in found] == names
+
+    duplicates = DuplicateIndex.load(build.path)
+    for faiss_id in duplicates.faiss_ids.tolist():
+        neighbours = duplicates.neighbours_of(faiss_id)['questions'][0]
+        assert neighbours[0] == faiss_id
+        assert all(neighbour in build.names for neighbour in neighbours.tolist() if neighbour >= 0)
+
+def test_incremental_build_matches_full_build(workspace, make_workspace, fake_api):
+    workspace.add(range(120))
+    workspace.build()
+    _update(workspace)
+    output = workspace.build("--incremental")
+    assert "12 added or changed, 3 removed" in output
+    # Only the new and changed documents need their neighbours searched
+    assert "Searched the neighbours of 12/127 documents" in output
+
+    full = make_workspace()
+    full.add(range(120, 130))
+    full.add(i for i in range(120) if i not in (7, 8, 9))
+    full.edit([3, 50])
+    full.build()
+
+    incremental, rebuilt = Build(workspace.store_path), Build(full.store_path)
+    names = sorted(rebuilt.ids)
+    assert sorted(incremental.ids) == names
+    assert {name: doc['concepts'] for name, doc in incremental.documents.items()} == \
+        {name: doc['concepts'] for name, doc in rebuilt.documents.items()}
+
+    # Same rankings; concept and summary vectors are often equal, so ties
+    # between them are compared by distance only
+    queries = _question_vectors(rebuilt, names, fake_api.dim)
+    for index_name in INDEX_NAMES:
+        found, distances = incremental.search(index_name, queries, 10)
+        expected, expected_distances = rebuilt.search(index_name, queries, 10)
+        assert np.allclose(distances, expected_distances, atol=1e-5)
+        if index_name == 'questions':
+            assert found == expected
+
+    lexical, expected_lexical = LexicalIndex.load(incremental.path), LexicalIndex.load(rebuilt.path)
+    for name in names[::10]:
+        query = rebuilt.documents[name]['question']
+        ids, scores = lexical.search(query, 10)
+        expected_ids, expected_scores = expected_lexical.search(query, 10)
+        assert np.allclose(scores, expected_scores)
+        assert [incremental.names[i] for i in ids[:3]] == [rebuilt.names[i] for i in expected_ids[:3]]
+
+    # Neighbour lists kept through the update start like those a full build
+    # finds, and are at least as long as a search fetches
+    duplicates, expected_duplicates = DuplicateIndex.load(incremental.path), DuplicateIndex.load(rebuilt.path)
+    assert sorted(incremental.names[i] for i in duplicates.faiss_ids.tolist()) == \
+        sorted(rebuilt.names[i] for i in expected_duplicates.faiss_ids.tolist())
+    for name in names:
+        lists = duplicates.neighbours_of(incremental.ids[name])
+        expected_lists = expected_duplicates.neighbours_of(rebuilt.ids[name])
+        for index_name in INDEX_NAMES:
+            known = np.count_nonzero(lists[index_name][0] >= 0)
+            assert known >= SEARCH_FETCH_K
+            assert np.allclose(lists[index_name][1][:known], expected_lists[index_name][1][:known], atol=1e-5)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from src.indexer.index_factory import create_index
+from src.retriever import concept_filter
+from src.retriever.concept_filter import ConceptFilter, filtered_search
+
+N = 3000
+
+@pytest.fixture(scope="module")
+def vectors():
+    return np.random.default_rng(0).standard_normal((N, 16)).astype(np.float32)
+
+def _exact(vectors, ids, query, allowed, k):
+    positions = np.flatnonzero(np.isin(ids, allowed))
+    distances = ((vectors[positions] - query) ** 2).sum(axis=1)
+    return ids[positions[np.argsort(distances)[:k]]]
+
+def test_allowed_ids_unite_the_concepts():
+    mapping = {"dp": ["a", "b"], "graph": ["b", "c", "gone"]}
+    concept_filter = ConceptFilter(mapping, {"a": 0, "b": 5, "c": 2, "d": 7})
+    assert concept_filter.allowed_ids(["dp", "graph"]).tolist() == [0, 2, 5]
+    assert concept_filter.allowed_ids(["unknown"]).tolist() == []
+
+@pytest.mark.parametrize("description", ["Flat", "IVF16,Flat", "HNSW16"])
+@pytest.mark.parametrize("exact_max", [0, 10 ** 6])
+def test_filtered_search_only_returns_allowed_ids(vectors, description, exact_max, monkeypatch):
+    monkeypatch.setattr(concept_filter, "FILTER_EXACT_MAX_IDS", exact_max)
+    ids = np.arange(N, dtype=np.int64) * 3
+    index = create_index(vectors, ids, description)
+    allowed = np.sort(np.random.default_rng(1).choice(ids, 200, replace=False))
+    query = vectors[7] + 0.01
+
+    found, distances = filtered_search(index, query, 10, allowed)
+    assert len(found) == 10 and np.isin(found, allowed).all()
+    assert np.all(np.diff(distances) >= 0)
+    if description != "HNSW16":
+        assert found.tolist() == _exact(vectors, ids, query, allowed, 10).tolist()
+
+def test_filtered_search_returns_what_there_is(vectors):
+    ids = np.arange(N, dtype=np.int64)
+    index = create_index(vectors, ids, "Flat")
+    found, _ = filtered_search(index, vectors[0], 10, np.array([4, 9], dtype=np.int64))
+    assert sorted(found.tolist()) == [4, 9]
+    found, _ = filtered_search(index, vectors[0], 10, np.empty(0, dtype=np.int64))
+    assert len(found) == 0
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from src.indexer.duplicate_index import DuplicateIndex
+
+@pytest.fixture(scope="module")
+def statements(problems):
+    paths = sorted((problems / "statement").glob("S*.md"))[:60]
+    return [(faiss_id, path.read_text(encoding="utf-8")) for faiss_id, path in enumerate(paths)]
+
+def _reflowed(text):
+    return text.replace("\n\n", "\n").replace("。", ". ").replace("## ", "")
+
+def test_matches_a_reflowed_copy(statements):
+    index = DuplicateIndex.build(statements)
+    for faiss_id, text in statements[:10]:
+        match = index.match(_reflowed(text))
+        assert match is not None
+        assert match[0] == faiss_id and match[1] >= 0.8
+
+def test_different_statements_do_not_match(statements):
+    index = DuplicateIndex.build(statements[:30])
+    assert sum(index.match(text) is not None for _, text in statements[30:]) == 0
+
+def test_short_texts_are_neither_signed_nor_matched(statements):
+    index = DuplicateIndex.build(statements + [(100, "求 a+b。")])
+    assert len(index) == len(statements)
+    assert index.match("求 a+b。") is None
+
+def test_update_matches_a_full_build(statements):
+    removed = np.arange(10, 20)
+    added = [(faiss_id + 100, text) for faiss_id, text in statements[10:15]]
+    kept = [(faiss_id, text) for faiss_id, text in statements if faiss_id not in removed]
+
+    updated = DuplicateIndex.build(statements).updated(removed, added)
+    expected = DuplicateIndex.build(kept + added)
+    np.testing.assert_array_equal(updated.faiss_ids, expected.faiss_ids)
+    np.testing.assert_array_equal(updated.signatures, expected.signatures)
+    assert updated.match(statements[12][1])[0] == 112
+    assert updated.match(statements[17][1]) is None
+    np.testing.assert_array_equal(updated.rows(np.array([0, 15, 112])), [0, -1, 52])
+
+def test_save_and_load_keep_neighbours(statements, tmp_path):
+    index = DuplicateIndex.build(statements[:4])
+    ids = np.arange(12, dtype=np.int64).reshape(4, 3)
+    distances = ids.astype(np.float32) / 10
+    index.neighbours = {'questions': (ids, distances)}
+    index.save(tmp_path)
+
+    loaded = DuplicateIndex.load(tmp_path)
+    np.testing.assert_array_equal(loaded.signatures, index.signatures)
+    neighbour_ids, neighbour_distances = loaded.neighbours_of(2)['questions']
+    np.testing.assert_array_equal(neighbour_ids, [6, 7, 8])
+    np.testing.assert_allclose(neighbour_distances, [0.6, 0.7, 0.8])
+    assert DuplicateIndex.load(tmp_path / "missing") is None
@@ -0,0 +1,34 @@
+import logging
+import numpy as np
+from src.common import embeddings
+from src.common.embeddings import ApproximateEncoding, get_encoding, truncate_embeddings, _batches
+
+def test_tiktoken_fallback_is_logged_not_printed(monkeypatch, caplog, capsys):
+    def offline(model):
+        raise ConnectionError("no network")
+    monkeypatch.setattr(embeddings.tiktoken, "encoding_for_model", offline)
+    monkeypatch.setattr(embeddings, "_encodings", {})
+
+    with caplog.at_level(logging.WARNING, logger="oi_search.embeddings"):
+        encoding = get_encoding("text-embedding-3-large")
+        assert get_encoding("text-embedding-3-large") is encoding
+    assert isinstance(encoding, ApproximateEncoding)
+    assert len(caplog.records) == 1 and "ConnectionError" in caplog.records[0].getMessage()
+    assert capsys.readouterr().out == ""
+
+def test_approximate_encoding_round_trips():
+    encoding = ApproximateEncoding()
+    text = "给定 $n$ 个整数，求 max_value(a, b) 的最大值。\n\n  Output one line."
+    tokens = encoding.encode(text)
+    assert encoding.decode(tokens) == text
+    assert encoding.decode(tokens[:5]) == text[:len(encoding.decode(tokens[:5]))]
+
+def test_batches_respect_both_limits():
+    batches = list(_batches([5, 5, 5, 20, 1, 1, 1], max_items=3, max_tokens=12))
+    assert batches == [[0, 1], [2], [3], [4, 5, 6]]
+
+def test_truncated_embeddings_are_renormalized():
+    vectors = np.random.default_rng(0).standard_normal((4, 16)).astype(np.float32)
+    truncated = truncate_embeddings(vectors, 8)
+    assert truncated.shape == (4, 8)
+    assert np.allclose(np.linalg.norm(truncated, axis=1), 1.0)
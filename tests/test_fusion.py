@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from src.retriever.fusion import FUSION_STRATEGIES, fuse, reciprocal_rank_fusion, weighted_distance_fusion
+
+def _result(ids, distances):
+    return np.array(ids, dtype=np.int64), np.array(distances, dtype=np.float32)
+
+RESULTS = {
+    'questions': _result([1, 2, 3, -1], [0.1, 0.2, 0.4, np.inf]),
+    'concepts': _result([3, 2, 4, -1], [0.0, 0.0, 0.5, np.inf]),
+    'summary': _result([2, 5, 1, 3], [0.3, 0.35, 0.6, 0.9]),
+}
+
+def test_rrf_sums_weighted_reciprocal_ranks():
+    weights = {'questions': 1.0, 'concepts': 0.5, 'summary': 0.8}
+    fused = dict(reciprocal_rank_fusion(RESULTS, weights, k=60))
+    assert set(fused) == {1, 2, 3, 4, 5}
+    assert fused[2] == pytest.approx(1.0 / 62 + 0.5 / 62 + 0.8 / 61)
+    assert fused[4] == pytest.approx(0.5 / 63)
+
+def test_rrf_ranks_agreement_first():
+    ranked = [idx for idx, _ in reciprocal_rank_fusion(RESULTS, {})]
+    assert ranked[0] == 2
+    assert ranked.index(3) < ranked.index(5)
+
+def test_weighted_distance_charges_missing_candidates_the_worst_distance():
+    weights = {'questions': 1.0, 'concepts': 1.0, 'summary': 1.0}
+    fused = dict(weighted_distance_fusion(RESULTS, weights))
+    # 4 is missing from questions (worst 0.4) and summary (worst 0.9)
+    assert fused[4] == pytest.approx(-(0.4 + 0.5 + 0.9))
+    assert fused[2] == pytest.approx(-(0.2 + 0.0 + 0.3))
+    assert max(fused, key=fused.get) == 2
+
+def test_weighted_distance_skips_empty_lists():
+    results = dict(RESULTS, lexical=_result([], []))
+    assert weighted_distance_fusion(results, {}) == weighted_distance_fusion(RESULTS, {})
+
+def test_question_strategy_keeps_the_question_ranking():
+    assert fuse(RESULTS, "question") == [(1, pytest.approx(-0.1)), (2, pytest.approx(-0.2)),
+                                         (3, pytest.approx(-0.4))]
+
+@pytest.mark.parametrize("strategy", FUSION_STRATEGIES)
+def test_every_strategy_ranks_best_first(strategy):
+    fused = fuse(RESULTS, strategy)
+    scores = [score for _, score in fused]
+    assert scores == sorted(scores, reverse=True)
+    assert all(idx >= 0 for idx, _ in fused)
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        fuse(RESULTS, "borda")
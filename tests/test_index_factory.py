@@ -0,0 +1,81 @@
+import faiss
+import numpy as np
+import pytest
+from src.indexer.index_factory import (index_description, create_index, remove_ids, reconstruct_vectors,
+                                       nearest_neighbours, search_parameters, stored_ids, wrapped_ivf)
+from src.indexer.vector_store import read_index
+
+DIM = 32
+N = 4000
+
+@pytest.fixture(scope="module")
+def vectors():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((N, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+# ivf_pq needs more vectors than the test uses for index_description to pick it
+DESCRIPTIONS = {"flat": "Flat", "ivf_flat": "IVF64,Flat", "ivf_pq": "IVF16,PQ8x4", "hnsw": "HNSW32",
+                "ivf_sq8": "IVF64,SQ8"}
+
+def _top_hits(index, queries):
+    _, found = index.search(queries, 1, params=search_parameters(index, exhaustive=True))
+    return found[:, 0]
+
+def test_index_description_falls_back_to_flat_for_small_corpora():
+    assert index_description("ivf_flat", DIM, 50) == "Flat"
+    assert index_description("ivf_flat", DIM, 10000).startswith("IVF")
+    with pytest.raises(ValueError):
+        index_description("annoy", DIM, 1000)
+
+@pytest.mark.parametrize("name", list(DESCRIPTIONS))
+def test_ids_survive_removal(name, vectors, tmp_path):
+    ids = np.arange(N, dtype=np.int64) + 1000
+    index = create_index(vectors, ids, DESCRIPTIONS[name])
+    assert not wrapped_ivf(index)
+
+    removed = ids[[3, 10, 11, 12, 2500]]
+    index = remove_ids(index, removed, DESCRIPTIONS[name])
+    kept = ids[~np.isin(ids, removed)]
+    assert index.ntotal == len(kept)
+    assert np.array_equal(np.sort(stored_ids(index)), kept)
+
+    # Vectors stored after the removed ones must still come back under their own id
+    queries = np.arange(1500, 1505)
+    if name != "ivf_pq":
+        assert np.array_equal(_top_hits(index, vectors[queries]), ids[queries])
+        assert np.allclose(reconstruct_vectors(index, ids[queries]), vectors[queries], atol=0.05)
+
+    # Also after a round trip through a written, memory-mapped store file
+    faiss.write_index(index, str(tmp_path / "questions.index"))
+    loaded = read_index(tmp_path / "questions.index")
+    assert np.array_equal(np.sort(stored_ids(loaded)), kept)
+    if name != "ivf_pq":
+        assert np.array_equal(_top_hits(loaded, vectors[queries]), ids[queries])
+
+@pytest.mark.parametrize("name", ["flat", "ivf_flat"])
+def test_added_ids_after_removal(name, vectors):
+    ids = np.arange(N - 100, dtype=np.int64)
+    index = create_index(vectors[:N - 100], ids, DESCRIPTIONS[name])
+    index = remove_ids(index, ids[:50], DESCRIPTIONS[name])
+    added = np.arange(N, N + 100, dtype=np.int64)
+    index.add_with_ids(vectors[N - 100:], added)
+    assert np.array_equal(_top_hits(index, vectors[N - 100:]), added)
+    assert np.array_equal(_top_hits(index, vectors[60:70]), ids[60:70])
+
+def test_removing_every_id_leaves_an_empty_index(vectors):
+    ids = np.arange(100, dtype=np.int64)
+    index = remove_ids(create_index(vectors[:100], ids, "HNSW32"), ids, "HNSW32")
+    assert index.ntotal == 0
+
+@pytest.mark.parametrize("name", ["flat", "ivf_flat"])
+def test_nearest_neighbours_start_with_the_document(name, vectors):
+    ids = np.arange(N, dtype=np.int64) * 2
+    index = create_index(vectors, ids, DESCRIPTIONS[name])
+    neighbours, distances = nearest_neighbours(index, ids[:20], 5, batch_size=7)
+    assert np.array_equal(neighbours[:, 0], ids[:20])
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+    small = create_index(vectors[:3], ids[:3], "Flat")
+    neighbours, _ = nearest_neighbours(small, ids[:3], 5)
+    assert np.all(neighbours[:, 3:] == -1)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from src.indexer.lexical_index import LexicalIndex
+
+@pytest.fixture(scope="module")
+def statements(problems):
+    paths = sorted((problems / "statement").glob("S*.md"))[:60]
+    return [(faiss_id, path.read_text(encoding="utf-8")) for faiss_id, path in enumerate(paths)]
+
+def _assert_same_search(index, expected, queries):
+    for query in queries:
+        ids, scores = index.search(query, 10)
+        expected_ids, expected_scores = expected.search(query, 10)
+        np.testing.assert_array_equal(ids, expected_ids)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+def test_finds_a_stored_statement_first(statements):
+    index = LexicalIndex.build(statements)
+    for faiss_id, text in statements[:10]:
+        ids, scores = index.search(text, 5)
+        assert ids[0] == faiss_id
+        assert np.all(np.diff(scores) <= 0)
+
+def test_update_matches_a_full_build(statements):
+    # Ids 5..29 are removed, ten of them come back under new ids and five kept statements are copied
+    removed = np.arange(5, 30)
+    changed = [(faiss_id + 55, text) for faiss_id, text in statements[20:30]]
+    added = changed + [(faiss_id + 100, text) for faiss_id, text in statements[:5]]
+    kept = [(faiss_id, text) for faiss_id, text in statements if faiss_id not in removed]
+
+    updated = LexicalIndex.build(statements).updated(removed, added)
+    expected = LexicalIndex.build(kept + added)
+    assert len(updated) == len(expected)
+    _assert_same_search(updated, expected, [text for _, text in statements[::7]] + ["线段树 区间 修改"])
+
+def test_allowed_restricts_results(statements):
+    index = LexicalIndex.build(statements)
+    allowed = np.arange(30, 40)
+    ids, _ = index.search(statements[0][1], 20, allowed=allowed)
+    assert len(ids) and np.isin(ids, allowed).all()
+
+def test_unknown_terms_find_nothing(statements):
+    ids, scores = LexicalIndex.build(statements).search("zzqx", 5)
+    assert len(ids) == 0 and len(scores) == 0
+
+def test_save_and_load(statements, tmp_path):
+    index = LexicalIndex.build(statements)
+    index.save(tmp_path)
+    _assert_same_search(LexicalIndex.load(tmp_path), index, [text for _, text in statements[:3]])
+
+def test_load_without_index(tmp_path):
+    assert LexicalIndex.load(tmp_path) is None
@@ -0,0 +1,41 @@
+import numpy as np
+from src.common.llm_cache import LLMCache
+
+def test_completions_and_embeddings_round_trip(tmp_path):
+    cache = LLMCache(tmp_path / "cache.sqlite")
+    cache.put_completion("gpt", {'temperature': 0}, "prompt", "答案")
+    assert cache.get_completion("gpt", {'temperature': 0}, "prompt") == "答案"
+    assert cache.get_completion("gpt", {'temperature': 1}, "prompt") is None
+
+    embeddings = np.random.default_rng(0).standard_normal((2, 8)).astype(np.float32)
+    cache.put_embeddings("emb", {}, ["a", "b"], embeddings)
+    found = cache.get_embeddings("emb", {}, ["b", "c", "a"])
+    assert np.array_equal(found[0], embeddings[1]) and found[1] is None and np.array_equal(found[2], embeddings[0])
+    assert cache.stats()['hits'] == 3 and cache.stats()['misses'] == 2
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LLMCache(tmp_path / "cache.sqlite", max_bytes=1000)
+    for i in range(5):
+        cache.put(f"key{i}", "m", bytes(200))
+    assert cache.get("key0") is not None
+    cache.put("key5", "m", bytes(200))
+    assert cache.stats()['bytes'] <= 900
+    assert cache.get("key0") is not None and cache.get("key5") is not None
+    assert cache.get("key1") is None
+
+def test_size_bound_holds_across_connections(tmp_path):
+    # Two instances stand in for two processes sharing the database
+    first = LLMCache(tmp_path / "cache.sqlite", max_bytes=1000)
+    second = LLMCache(tmp_path / "cache.sqlite", max_bytes=1000)
+    for i in range(10):
+        (first if i % 2 else second).put(f"key{i}", "m", bytes(150))
+        assert first.stats()['bytes'] <= 1000 and second.stats()['bytes'] <= 1000
+    assert second.get("key9") is not None
+
+def test_invalidate_drops_one_model(tmp_path):
+    cache = LLMCache(tmp_path / "cache.sqlite")
+    cache.put_many("old", {"a": b"1", "b": b"2"})
+    cache.put("c", "new", b"3")
+    assert cache.invalidate("old") == 2
+    assert cache.get("a") is None and cache.get("c") == b"3"
+    assert cache.stats()['entries'] == 1 and cache.stats()['bytes'] == 1
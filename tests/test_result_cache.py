@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from src.common.result_cache import SemanticResultCache
+
+PARAMS = {'k': 5, 'fusion': "rrf"}
+
+def _unit(rng, dim=16):
+    vector = rng.standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+def test_exact_repeats_match_after_normalization():
+    cache = SemanticResultCache()
+    cache.put("Find the  Shortest path\n", PARAMS, [1, 2])
+    assert cache.lookup_exact("find the shortest path", PARAMS) == [1, 2]
+    assert cache.lookup_exact("find the shortest path", dict(PARAMS, k=10)) is None
+
+def test_results_are_copies():
+    cache = SemanticResultCache()
+    result = [{'id': 1}]
+    cache.put("q", PARAMS, result)
+    result[0]['id'] = 2
+    cached = cache.lookup_exact("q", PARAMS)
+    cached[0]['id'] = 3
+    assert cache.lookup_exact("q", PARAMS) == [{'id': 1}]
+
+def test_near_duplicates_match_above_the_threshold(rng):
+    cache = SemanticResultCache(threshold=0.97)
+    embedding = _unit(rng)
+    cache.put("q", PARAMS, "result", embedding * 3)
+    close = embedding + 0.01 * _unit(rng)
+    assert cache.lookup_similar(close, PARAMS) == "result"
+    assert cache.lookup_similar(close, dict(PARAMS, k=10)) is None
+    assert cache.lookup_similar(_unit(rng), PARAMS) is None
+    assert cache.lookup_similar(np.ones(8, dtype=np.float32), PARAMS) is None
+
+    value, computed = cache.lookup("other wording", PARAMS, embed=lambda: close)
+    assert value == "result" and computed is close
+    assert cache.stats()['semantic_hits'] == 2
+
+def test_lru_eviction_reuses_rows_in_place(rng):
+    cache = SemanticResultCache(max_entries=3)
+    embeddings = [_unit(rng) for _ in range(5)]
+    for i in range(3):
+        cache.put(f"q{i}", PARAMS, i, embeddings[i])
+    vectors = cache._vectors
+    assert cache.lookup_exact("q0", PARAMS) == 0
+
+    # q1 is now the least recently used
+    cache.put("q3", PARAMS, 3, embeddings[3])
+    cache.put("q4", PARAMS, 4, embeddings[4])
+    assert cache._vectors is vectors
+    assert cache.stats()['entries'] == 3
+    assert cache.lookup_exact("q1", PARAMS) is None and cache.lookup_similar(embeddings[1], PARAMS) is None
+    assert cache.lookup_similar(embeddings[2], PARAMS) is None
+    for i in (0, 3, 4):
+        assert cache.lookup_similar(embeddings[i], PARAMS) == i
+
+def test_updating_an_entry_replaces_its_embedding(rng):
+    cache = SemanticResultCache(max_entries=2)
+    old, new = _unit(rng), _unit(rng)
+    cache.put("q", PARAMS, "old", old)
+    cache.put("q", PARAMS, "new", new)
+    assert cache.lookup_similar(old, PARAMS) is None
+    assert cache.lookup_similar(new, PARAMS) == "new"
+    cache.put("r", PARAMS, "r", _unit(rng))
+    assert cache.lookup_similar(new, PARAMS) == "new"
+
+def test_expired_entries_are_not_matched(rng):
+    cache = SemanticResultCache(ttl=-1)
+    embedding = _unit(rng)
+    cache.put("q", PARAMS, "result", embedding)
+    assert cache.lookup_exact("q", PARAMS) is None
+    assert cache.lookup_similar(embedding, PARAMS) is None
+    cache.ttl = 60
+    cache.put("r", PARAMS, "result", embedding)
+    assert cache.lookup_similar(embedding, PARAMS) == "result"
+
+def test_a_new_embedding_size_drops_the_old_embeddings(rng):
+    cache = SemanticResultCache()
+    cache.put("q", PARAMS, "small", _unit(rng, 8))
+    cache.put("r", PARAMS, "large", _unit(rng, 16))
+    assert cache.lookup_exact("q", PARAMS) == "small"
+    assert cache.stats()['entries'] == 2
+    cache.clear()
+    assert cache.stats()['entries'] == 0
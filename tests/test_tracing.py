@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+from src.common.tracing import Tracer, get_tracer, span, trace, propagate
+
+def _extract(_):
+    with span("extract.summary"):
+        pass
+
+def test_summary_of_one_trace_leaves_out_earlier_ones():
+    with trace("search"):
+        with span("embedding"):
+            pass
+    with trace("build_index") as record:
+        with ThreadPoolExecutor(2) as executor:
+            list(executor.map(propagate(_extract), range(2)))
+        with span("index.write"):
+            pass
+
+    tracer = get_tracer()
+    summary = tracer.summary(tracer.spans(record['trace_id']))
+    assert set(summary) == {"build_index", "extract.summary", "index.write"}
+    assert summary["extract.summary"]['count'] == 2
+    assert {"search", "embedding"} <= set(tracer.summary())
+
+def test_summary_counts_and_errors():
+    tracer = Tracer(log_path=None)
+    tracer.record({'name': "chat", 'duration_ms': 10.0, 'input_tokens': 5, 'output_tokens': 2})
+    tracer.record({'name': "chat", 'duration_ms': 30.0, 'error': "Timeout()"})
+    summary = tracer.summary()
+    assert summary["chat"]['count'] == 2 and summary["chat"]['tokens'] == 7 and summary["chat"]['errors'] == 1
+    assert summary["chat"]['p50_ms'] == 20.0
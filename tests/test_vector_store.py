@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+import faiss
+import numpy as np
+import pytest
+from src.indexer.index_factory import INDEX_TYPES, index_description, create_index, search_parameters
+from src.indexer.vector_store import BUILDS_DIR, current_build, new_build, publish, read_index
+from config import INDEX_TYPE
+
+def _mapped_files():
+    return {line.split(maxsplit=5)[5] for line in Path("/proc/self/maps").read_text().splitlines()
+            if len(line.split(maxsplit=5)) == 6}
+
+@pytest.mark.skipif(not Path("/proc/self/maps").exists(), reason="needs /proc/self/maps")
+@pytest.mark.parametrize("index_type", sorted({INDEX_TYPE, *INDEX_TYPES}))
+def test_read_index_maps_the_file(index_type, tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((5000, 64)).astype(np.float32)
+    description = index_description(index_type, 64, len(vectors))
+    if index_type == "ivf_pq":
+        description = "IVF64,PQ8x4"
+    path = tmp_path / "questions.index"
+    faiss.write_index(create_index(vectors, np.arange(len(vectors)), description), str(path))
+
+    index = read_index(path)
+    assert str(path) in _mapped_files()
+    _, found = index.search(vectors[:5], 1, params=search_parameters(index, exhaustive=True))
+    if index_type != "ivf_pq":
+        assert found[:, 0].tolist() == list(range(5))
+    del index
+    assert str(path) not in _mapped_files()
+
+def _build(store_path: Path, name: str) -> Path:
+    build_dir = store_path / BUILDS_DIR / name
+    build_dir.mkdir(parents=True)
+    return build_dir
+
+def test_publish_keeps_the_previous_build_and_builds_in_progress(tmp_path):
+    first = new_build(tmp_path)
+    publish(tmp_path, first)
+    assert current_build(tmp_path) == first
+
+    # A concurrent run, alive in another process, is still writing this one
+    with subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"]) as other:
+        in_progress = _build(tmp_path, f"20260101T000000-{other.pid}")
+        second = _build(tmp_path, f"20260101T000001-{os.getpid()}")
+        publish(tmp_path, second)
+        third = _build(tmp_path, f"20260101T000002-{os.getpid()}")
+        publish(tmp_path, third)
+        assert current_build(tmp_path) == third
+        assert not first.exists()
+        assert second.exists() and in_progress.exists()
+        other.kill()
+
+def test_publish_clears_builds_of_exited_runs(tmp_path):
+    exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    failed = _build(tmp_path, f"20260101T000000-{exited.stdout.strip()}")
+    build_dir = new_build(tmp_path)
+    publish(tmp_path, build_dir)
+    assert not failed.exists() and build_dir.exists()